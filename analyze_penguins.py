@@ -0,0 +1,215 @@
+# Project 1: Penguin Data Analysis - Command Line
+#
+# Runs the analysis without the test suite. main.py (and NumPy through it)
+# is only imported when something has to be computed, so with --cache a
+# repeated run on unchanged input is answered from the result cache
+# without loading any of the analysis code.
+#
+#   python analyze_penguins.py penguins.csv
+#   python analyze_penguins.py penguins.csv --format results --output penguin_analysis_results.txt
+#   python analyze_penguins.py 'colonies/*.csv' --analysis weight_stats --format jsonl --cache
+
+import argparse
+import glob
+import json
+import os
+import sys
+
+
+# the result names of main.DEFAULT_ACCUMULATORS, listed here so the
+# arguments can be checked without importing main
+ANALYSES = ('total_count', 'species_data', 'gender_counts', 'weight_stats', 'bill_length_avgs')
+
+# analyses each text report needs
+REPORT_ANALYSES = {
+    'results': ('gender_counts', 'weight_stats'),
+    'comprehensive': ('total_count', 'species_data', 'gender_counts', 'weight_stats'),
+}
+
+FORMATS = ('comprehensive', 'results', 'jsonl', 'csv', 'columnar')
+
+DEFAULT_CACHE_FILE = '.penguin_results_cache.json'
+
+# cached outputs kept in the cache file; the least recently used go first
+CACHE_ENTRIES = 16
+
+
+def expand_inputs(patterns):
+    """
+    Turn the input arguments into a list of files.
+
+    Parameters:
+        patterns (list): File paths or glob patterns
+
+    Returns:
+        list: Matching paths in argument order, each pattern's matches sorted
+    """
+    paths = []
+    for pattern in patterns:
+        matches = sorted(glob.glob(pattern)) if glob.has_magic(pattern) else [pattern]
+        paths.extend(match for match in matches if match not in paths)
+    return paths
+
+
+def _cache_key(paths, analyses, fmt):
+    # size and modification time stand in for the file contents, as for snapshots
+    inputs = []
+    for path in paths:
+        info = os.stat(path)
+        inputs.append([os.path.abspath(path), info.st_size, info.st_mtime_ns])
+    return json.dumps([inputs, list(analyses), fmt])
+
+
+def _read_cache(cache_file):
+    try:
+        with open(cache_file) as file:
+            entries = json.load(file)
+    except (FileNotFoundError, ValueError):
+        return {}
+    return entries if isinstance(entries, dict) else {}
+
+
+def _write_cache(cache_file, entries):
+    while len(entries) > CACHE_ENTRIES:
+        del entries[next(iter(entries))]
+    temp_file = cache_file + '.tmp'
+    with open(temp_file, 'w') as file:
+        json.dump(entries, file)
+    os.replace(temp_file, cache_file)
+
+
+def compute_results(paths, analyses, backend='auto', processes=None, snapshot=False):
+    """
+    Run the requested analyses over one or more CSV files.
+
+    Parameters:
+        paths (list): CSV files with the penguins.csv header
+        analyses (iterable): Result names from ANALYSES
+        backend (str): 'auto', 'python' or 'numpy'
+        processes (int): Worker processes; one file is split into byte ranges
+        snapshot (bool): Load a single file through its binary snapshot
+
+    Returns:
+        tuple: (results dict, ratios dict or None)
+    """
+    import main
+
+    accumulators = {name: main.DEFAULT_ACCUMULATORS[name] for name in analyses}
+    if len(paths) == 1 and processes and processes > 1:
+        results = main.analyze_chunked(paths[0], accumulators, processes, backend=backend)
+    elif len(paths) == 1:
+        table = main.load_table(paths[0], cache=snapshot)
+        results = main.aggregate_penguins(table, accumulators, backend)
+    else:
+        results = main.analyze_files(paths, accumulators, processes, backend)
+
+    ratios = None
+    if 'gender_counts' in results:
+        ratios = main.calculate_ratio(results['gender_counts'])
+    return results, ratios
+
+
+def render_output(results, ratios, fmt):
+    """
+    Render results as the text of a report or a jsonl/csv export.
+
+    Parameters:
+        results (dict): Output of compute_results
+        ratios (dict): Male:female ratios
+        fmt (str): 'comprehensive', 'results', 'jsonl' or 'csv'
+
+    Returns:
+        str: The output text
+    """
+    import tempfile
+    import main
+
+    if fmt == 'results':
+        return main.render_results(results['gender_counts'], results['weight_stats'], ratios)
+    if fmt == 'comprehensive':
+        return main.render_comprehensive_results(results['total_count'], results['species_data'],
+                                                 results['gender_counts'], ratios,
+                                                 results['weight_stats'])
+
+    # the export writers take a filename, so render through a temporary file
+    handle, temp_file = tempfile.mkstemp(suffix='.' + fmt)
+    os.close(handle)
+    try:
+        main.export_results(results, temp_file, fmt, ratios)
+        with open(temp_file, newline='') as file:
+            return file.read()
+    finally:
+        os.remove(temp_file)
+
+
+def _emit(text, output):
+    if output == '-':
+        sys.stdout.write(text)
+    else:
+        with open(output, 'w', newline='') as file:
+            file.write(text)
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog='analyze_penguins.py', description="Analyze penguin CSV files.")
+    parser.add_argument('inputs', nargs='*', default=['penguins.csv'],
+                        help="CSV files or glob patterns (default: penguins.csv)")
+    parser.add_argument('--analysis', action='append', choices=ANALYSES, dest='analyses',
+                        help="analysis to run, may be repeated (jsonl, csv and columnar only; default: all)")
+    parser.add_argument('--format', choices=FORMATS, default='comprehensive',
+                        help="report layout or export format (default: comprehensive)")
+    parser.add_argument('--output', default='-', help="output file, '-' for standard output (default)")
+    parser.add_argument('--backend', choices=('auto', 'python', 'numpy'), default='auto',
+                        help="aggregation backend (default: auto)")
+    parser.add_argument('--processes', type=int,
+                        help="worker processes, per file or per byte range of a single file")
+    parser.add_argument('--cache', action='store_true',
+                        help="reuse results and table snapshots while the inputs are unchanged")
+    parser.add_argument('--cache-file', default=DEFAULT_CACHE_FILE,
+                        help=f"result cache location (default: {DEFAULT_CACHE_FILE})")
+    return parser
+
+
+def main(argv=None):
+    parser = build_parser()
+    args = parser.parse_args(argv)
+
+    if args.analyses and args.format in REPORT_ANALYSES:
+        parser.error("--analysis only applies to the jsonl, csv and columnar formats")
+    if args.format == 'columnar' and args.output == '-':
+        parser.error("columnar output needs --output")
+    analyses = REPORT_ANALYSES.get(args.format) or [name for name in ANALYSES
+                                                    if not args.analyses or name in args.analyses]
+
+    paths = expand_inputs(args.inputs)
+    missing = [path for path in paths if not os.path.isfile(path)]
+    if not paths or missing:
+        parser.error(f"no such file: {', '.join(missing or args.inputs)}")
+
+    # columnar output is binary and always recomputed
+    use_cache = args.cache and args.format != 'columnar'
+    if use_cache:
+        key = _cache_key(paths, analyses, args.format)
+        entries = _read_cache(args.cache_file)
+        if key in entries:
+            text = entries.pop(key)
+            entries[key] = text
+            _write_cache(args.cache_file, entries)
+            _emit(text, args.output)
+            return
+
+    results, ratios = compute_results(paths, analyses, args.backend, args.processes, args.cache)
+    if args.format == 'columnar':
+        import main as analysis
+        analysis.export_results(results, args.output, 'columnar', ratios)
+        return
+
+    text = render_output(results, ratios, args.format)
+    _emit(text, args.output)
+    if use_cache:
+        entries[key] = text
+        _write_cache(args.cache_file, entries)
+
+
+if __name__ == "__main__":
+    main()
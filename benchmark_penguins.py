@@ -0,0 +1,287 @@
+# Project 1: Penguin Data Analysis - Benchmarks
+#
+# Generates synthetic penguins-shaped CSV files and measures how long each
+# analysis function takes and how much memory it needs at each size.
+# Results are written as JSON so runs from different versions can be compared:
+#
+#   python benchmark_penguins.py --sizes 1000 100000 --output new.json --baseline old.json
+
+import argparse
+import json
+import os
+import platform
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from main import (load_csv, iter_csv, load_table, scan_csv, count_island_gender,
+                  calculate_ratio, calculate_body_weights, count_total_penguins,
+                  count_species_by_island, avg_bill_length, aggregate_penguins,
+                  write_to_file, write_comprehensive_results)
+
+
+DEFAULT_SIZES = (10**3, 10**4, 10**5, 10**6, 10**7)
+
+# sizes above this skip the stages that need the whole file as a list of dictionaries
+LIST_STAGE_ROWS = 10**6
+
+HEADER = ['', 'species', 'island', 'bill_length_mm', 'bill_depth_mm',
+          'flipper_length_mm', 'body_mass_g', 'sex', 'year']
+
+# mean and spread of each measurement, roughly matching penguins.csv
+MEASUREMENTS = {
+    'bill_length_mm': (44.0, 5.5, 1),
+    'bill_depth_mm': (17.2, 2.0, 1),
+    'flipper_length_mm': (201.0, 14.0, 0),
+    'body_mass_g': (4200.0, 800.0, 0),
+}
+
+
+def generate_synthetic_csv(filename, n_rows, na_rate=0.02, n_species=3, n_islands=3, seed=0):
+    """
+    Write a CSV file with the same layout as penguins.csv.
+
+    Parameters:
+        filename (str): Path of the file to write
+        n_rows (int): Number of penguin rows
+        na_rate (float): Chance that any measurement, sex or year is NA
+        n_species (int): Number of distinct species names
+        n_islands (int): Number of distinct island names
+        seed (int): Random seed, so the same arguments give the same file
+    """
+    rng = random.Random(seed)
+    species_names = ['Adelie', 'Gentoo', 'Chinstrap'][:n_species]
+    species_names += [f'Species{i}' for i in range(len(species_names), n_species)]
+    island_names = ['Torgersen', 'Biscoe', 'Dream'][:n_islands]
+    island_names += [f'Island{i}' for i in range(len(island_names), n_islands)]
+
+    with open(filename, 'w') as file:
+        file.write(','.join(f'"{name}"' for name in HEADER) + '\n')
+        lines = []
+        for index in range(1, n_rows + 1):
+            fields = [f'"{index}"', f'"{rng.choice(species_names)}"', f'"{rng.choice(island_names)}"']
+            for mean, spread, digits in MEASUREMENTS.values():
+                if rng.random() < na_rate:
+                    fields.append('NA')
+                elif digits:
+                    fields.append(f'{rng.gauss(mean, spread):.{digits}f}')
+                else:
+                    fields.append(str(int(rng.gauss(mean, spread))))
+            fields.append('NA' if rng.random() < na_rate else f'"{rng.choice(["male", "female"])}"')
+            fields.append('NA' if rng.random() < na_rate else str(rng.choice([2007, 2008, 2009])))
+            lines.append(','.join(fields) + '\n')
+            if len(lines) == 10000:
+                file.writelines(lines)
+                lines = []
+        file.writelines(lines)
+
+
+def measure(function, *args, repeat=3):
+    """
+    Time a call and record its peak traced memory.
+
+    The timing runs happen without tracemalloc, which slows Python code down,
+    and one extra run measures memory.
+
+    Parameters:
+        function (callable): Function to measure
+        *args: Arguments passed to the function
+        repeat (int): Number of timed runs; the fastest is reported
+
+    Returns:
+        dict: best_seconds, mean_seconds and peak_bytes
+    """
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function(*args)
+        timings.append(time.perf_counter() - start)
+
+    tracemalloc.start()
+    try:
+        function(*args)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    return {
+        'best_seconds': min(timings),
+        'mean_seconds': sum(timings) / len(timings),
+        'peak_bytes': peak,
+    }
+
+
+def _write_reports(penguins, workdir):
+    results = aggregate_penguins(penguins)
+    ratios = calculate_ratio(results['gender_counts'])
+    write_to_file(results['gender_counts'], results['weight_stats'], ratios,
+                  os.path.join(workdir, 'results.txt'))
+    write_comprehensive_results(results['total_count'], results['species_data'],
+                                results['gender_counts'], ratios, results['weight_stats'],
+                                os.path.join(workdir, 'comprehensive.txt'))
+
+
+def _pipeline(csv_file, workdir):
+    _write_reports(iter_csv(csv_file), workdir)
+
+
+def benchmark_size(csv_file, workdir, repeat=3, list_rows=LIST_STAGE_ROWS):
+    """
+    Measure every stage of the analysis on one CSV file.
+    
+    The loaders are measured first, with no parsed data alive. Stages that
+    take a list of dictionaries are skipped for files with more than
+    list_rows rows, where the list alone would need many gigabytes.
+    
+    Parameters:
+        csv_file (str): Path of the CSV file
+        workdir (str): Directory for the report files the writers produce
+        repeat (int): Number of timed runs per stage
+        list_rows (int): Largest row count that runs the list stages
+    
+    Returns:
+        dict: Stage names mapped to the measure() result
+    """
+    stages = {
+        'scan_csv': (scan_csv, csv_file),
+        'load_table': (load_table, csv_file),
+        'pipeline': (_pipeline, csv_file, workdir),
+    }
+    measured = {name: measure(*call, repeat=repeat) for name, call in stages.items()}
+
+    table = load_table(csv_file)
+    results = aggregate_penguins(table)
+    gender_counts = results['gender_counts']
+    ratios = calculate_ratio(gender_counts)
+    stages = {
+        'calculate_ratio': (calculate_ratio, gender_counts),
+        'calculate_body_weights_table': (calculate_body_weights, table),
+        'avg_bill_length_table': (avg_bill_length, table),
+        'aggregate_penguins_table': (aggregate_penguins, table),
+        'write_to_file': (write_to_file, gender_counts, results['weight_stats'], ratios,
+                          os.path.join(workdir, 'results.txt')),
+        'write_comprehensive_results': (write_comprehensive_results, results['total_count'],
+                                        results['species_data'], gender_counts, ratios,
+                                        results['weight_stats'],
+                                        os.path.join(workdir, 'comprehensive.txt')),
+    }
+    measured.update((name, measure(*call, repeat=repeat)) for name, call in stages.items())
+    n_rows = len(table)
+    del table, stages
+
+    if n_rows <= list_rows:
+        measured['load_csv'] = measure(load_csv, csv_file, repeat=repeat)
+        penguins = load_csv(csv_file)
+        stages = {
+            'count_total_penguins': (count_total_penguins, penguins),
+            'count_island_gender': (count_island_gender, penguins),
+            'calculate_body_weights': (calculate_body_weights, penguins),
+            'count_species_by_island': (count_species_by_island, penguins),
+            'avg_bill_length': (avg_bill_length, penguins),
+            'aggregate_penguins': (aggregate_penguins, penguins),
+        }
+        measured.update((name, measure(*call, repeat=repeat)) for name, call in stages.items())
+    return measured
+
+
+def run_benchmarks(sizes=DEFAULT_SIZES, na_rate=0.02, n_species=3, n_islands=3, repeat=3, workdir=None,
+                   list_rows=LIST_STAGE_ROWS):
+    """
+    Generate a synthetic file for each size and benchmark every stage on it.
+
+    Parameters:
+        sizes (iterable): Row counts to benchmark
+        na_rate (float): Chance of NA per generated field
+        n_species (int): Number of distinct species
+        n_islands (int): Number of distinct islands
+        repeat (int): Number of timed runs per stage
+        workdir (str): Directory for generated files, defaults to a temporary one
+        list_rows (int): Largest size that runs the list-of-dictionary stages
+
+    Returns:
+        dict: Environment details and one entry per size with the stage results
+    """
+    report = {
+        'python': sys.version.split()[0],
+        'platform': platform.platform(),
+        'settings': {'na_rate': na_rate, 'n_species': n_species,
+                     'n_islands': n_islands, 'repeat': repeat, 'list_rows': list_rows},
+        'runs': [],
+    }
+    with tempfile.TemporaryDirectory(dir=workdir) as tempdir:
+        for n_rows in sizes:
+            csv_file = os.path.join(tempdir, f'penguins_{n_rows}.csv')
+            generate_synthetic_csv(csv_file, n_rows, na_rate, n_species, n_islands)
+            print(f"Benchmarking {n_rows} rows...")
+            stages = benchmark_size(csv_file, tempdir, repeat, list_rows)
+            report['runs'].append({'rows': n_rows, 'stages': stages})
+            os.remove(csv_file)
+    return report
+
+
+def compare_results(baseline, current, threshold=1.2):
+    """
+    Find stages that got slower than a baseline report.
+
+    Parameters:
+        baseline (dict): Earlier run_benchmarks report
+        current (dict): New run_benchmarks report
+        threshold (float): Slowdown factor that counts as a regression
+
+    Returns:
+        list: (rows, stage, baseline seconds, current seconds) tuples
+    """
+    old_runs = {run['rows']: run['stages'] for run in baseline['runs']}
+    regressions = []
+    for run in current['runs']:
+        old_stages = old_runs.get(run['rows'], {})
+        for stage, result in run['stages'].items():
+            if stage not in old_stages:
+                continue
+            old_seconds = old_stages[stage]['best_seconds']
+            if result['best_seconds'] > old_seconds * threshold:
+                regressions.append((run['rows'], stage, old_seconds, result['best_seconds']))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the penguin analysis functions.")
+    parser.add_argument('--sizes', type=int, nargs='+', default=list(DEFAULT_SIZES),
+                        help="row counts to benchmark")
+    parser.add_argument('--na-rate', type=float, default=0.02, help="chance of NA per field")
+    parser.add_argument('--species', type=int, default=3, help="number of distinct species")
+    parser.add_argument('--islands', type=int, default=3, help="number of distinct islands")
+    parser.add_argument('--repeat', type=int, default=3, help="timed runs per stage")
+    parser.add_argument('--list-rows', type=int, default=LIST_STAGE_ROWS,
+                        help="largest size that runs the list-of-dictionary stages")
+    parser.add_argument('--output', default='benchmark_results.json', help="JSON file for the results")
+    parser.add_argument('--baseline', help="earlier results file to check for regressions")
+    args = parser.parse_args()
+
+    report = run_benchmarks(args.sizes, args.na_rate, args.species, args.islands, args.repeat,
+                            list_rows=args.list_rows)
+    with open(args.output, 'w') as file:
+        json.dump(report, file, indent=2)
+    print(f"Results written to '{args.output}'")
+
+    for run in report['runs']:
+        print(f"\n{run['rows']} rows:")
+        for stage, result in run['stages'].items():
+            print(f"  {stage:<30} {result['best_seconds'] * 1000:10.2f} ms "
+                  f"{result['peak_bytes'] / 1024:10.1f} KiB")
+
+    if args.baseline:
+        with open(args.baseline) as file:
+            baseline = json.load(file)
+        regressions = compare_results(baseline, report)
+        for rows, stage, old_seconds, new_seconds in regressions:
+            print(f"Regression: {stage} at {rows} rows went from "
+                  f"{old_seconds * 1000:.2f} ms to {new_seconds * 1000:.2f} ms")
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
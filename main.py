@@ -7,6 +7,7 @@
 # - Both: load_csv (the final version integrates our code) write_comprehensive_results, test cases for our own part of functions
 
 # IMPORTANT: The main function is under test_penguins.py to perform test and analysis in the same time, so after running test_penguins.py you will get the analysis results as well as the test results.
+# To only produce the analysis (no tests), run analyze_penguins.py; see its --help for options.
 
 # AI Tools Used: 
 # Eve: used claude to ask it help load_csv function and write_comprehensive_results function;
@@ -14,84 +15,2935 @@
 
 # Alexia: I used ChatGPT to help me come up with my test cases for the avg_bill function as well as my bill_avg function
 import csv
+import functools
+import glob
+import hashlib
+import inspect
+import io
+import json
+import math
+import mmap
+import operator
+import os
+import queue
+import struct
+import sys
+import threading
+import time
+import tracemalloc
+from array import array
+from collections import Counter, OrderedDict, namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+
+# NumPy is optional: the grouped reductions use it when it is installed
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# numeric columns; everything else (except the unnamed index column) is text
+MEASUREMENT_COLUMNS = ('bill_length_mm', 'bill_depth_mm', 'flipper_length_mm', 'body_mass_g')
+INTEGER_COLUMNS = ('year',)
+
+# per-stage profiling: off unless PENGUIN_PROFILE is set or profiling() is used
+
+PROFILE_ENV_VAR = 'PENGUIN_PROFILE'
+
+
+class Profiler:
+    """
+    Records wall time, CPU time, rows processed and peak traced memory for
+    each profiled stage. Stages may nest; a stage's peak includes its children.
+    Each thread nests its stages separately; tracemalloc's peak is shared by
+    the process, so peaks of stages that overlap in time include each other.
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self.stages = []
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._started_tracing = False
+
+    @property
+    def _stack(self):
+        # the open stages of the calling thread
+        stack = getattr(self._local, 'stack', None)
+        if stack is None:
+            stack = self._local.stack = []
+        return stack
+
+    def enable(self):
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._started_tracing = True
+        self.enabled = True
+
+    def disable(self):
+        self.enabled = False
+        if self._started_tracing:
+            tracemalloc.stop()
+            self._started_tracing = False
+
+    def reset(self):
+        self.stages = []
+        self._local = threading.local()
+
+    def add_record(self, name):
+        record = {'stage': name, 'depth': len(self._stack), 'wall_seconds': 0.0,
+                  'cpu_seconds': 0.0, 'rows': None, 'peak_bytes': None}
+        self.stages.append(record)
+        return record
+
+    def start(self, name):
+        stack = self._stack
+        with self._lock:
+            current, peak = tracemalloc.get_traced_memory()
+            if stack:
+                parent = stack[-1]
+                parent['_peak'] = max(parent['_peak'], peak)
+            tracemalloc.reset_peak()
+            record = self.add_record(name)
+            record['_start_memory'] = current
+            record['_peak'] = current
+        stack.append(record)
+        return record
+
+    def stop(self, record, wall_seconds, cpu_seconds):
+        stack = self._stack
+        with self._lock:
+            record['wall_seconds'] += wall_seconds
+            record['cpu_seconds'] += cpu_seconds
+            peak = max(record.pop('_peak'), tracemalloc.get_traced_memory()[1])
+            record['peak_bytes'] = max(0, peak - record.pop('_start_memory'))
+        if stack and stack[-1] is record:
+            stack.pop()
+        if stack:
+            parent = stack[-1]
+            parent['_peak'] = max(parent['_peak'], peak)
+
+    def to_json(self):
+        return json.dumps({'stages': self.stages}, indent=2)
+
+    def summary(self):
+        lines = ['PROFILE', '-'*40,
+                 f"{'Stage':<36}{'Wall ms':>10}{'CPU ms':>10}{'Rows':>10}{'Peak KiB':>12}"]
+        for record in self.stages:
+            name = '  ' * record['depth'] + record['stage']
+            rows = '' if record['rows'] is None else record['rows']
+            peak = '' if record['peak_bytes'] is None else f"{record['peak_bytes'] / 1024:.1f}"
+            lines.append(f"{name:<36}{record['wall_seconds'] * 1000:>10.2f}"
+                         f"{record['cpu_seconds'] * 1000:>10.2f}{rows:>10}{peak:>12}")
+        return '\n'.join(lines) + '\n'
+
+
+PROFILER = Profiler()
+if os.environ.get(PROFILE_ENV_VAR, '') not in ('', '0'):
+    PROFILER.enable()
+
+
+@contextmanager
+def profiling():
+    """
+    Turn profiling on for a block of code.
+    
+    Yields:
+        Profiler: The shared PROFILER, holding the stages recorded so far
+    """
+    was_enabled = PROFILER.enabled
+    PROFILER.enable()
+    try:
+        yield PROFILER
+    finally:
+        if not was_enabled:
+            PROFILER.disable()
+
+
+@contextmanager
+def profile_stage(name, rows=None):
+    """
+    Profile a block of code as one stage; yields the stage record (or None
+    when profiling is off) so the block can fill in 'rows'.
+    """
+    if not PROFILER.enabled:
+        yield None
+        return
+    record = PROFILER.start(name)
+    record['rows'] = rows
+    wall_start = time.perf_counter()
+    cpu_start = time.process_time()
+    try:
+        yield record
+    finally:
+        PROFILER.stop(record, time.perf_counter() - wall_start, time.process_time() - cpu_start)
+
+
+def _row_count(value):
+    # length of a table or a list of penguin rows, None for anything else
+    if isinstance(value, PenguinTable):
+        return len(value)
+    if isinstance(value, list) and (not value or isinstance(value[0], (dict, PenguinRecord))):
+        return len(value)
+    return None
+
+
+def _rows_processed(args, result):
+    if args and _row_count(args[0]) is not None:
+        return _row_count(args[0])
+    if _row_count(result) is not None:
+        return _row_count(result)
+    # (penguins, report) from validate_csv
+    if isinstance(result, tuple) and result and _row_count(result[0]) is not None:
+        return _row_count(result[0])
+    if isinstance(result, dict) and isinstance(result.get('total_count'), int):
+        return result['total_count']
+    return None
+
+
+def _profiled_stream(name, stream):
+    # only the time spent producing rows is charged to the stage; the rows
+    # are used elsewhere, so no peak memory is recorded for it
+    record = PROFILER.add_record(name)
+    record['rows'] = 0
+    while True:
+        wall_start = time.perf_counter()
+        cpu_start = time.process_time()
+        try:
+            penguin = next(stream)
+        except StopIteration:
+            return
+        finally:
+            record['wall_seconds'] += time.perf_counter() - wall_start
+            record['cpu_seconds'] += time.process_time() - cpu_start
+        record['rows'] += 1
+        yield penguin
+
+
+def profiled(function):
+    """Record each call of a function as a stage when profiling is on."""
+    name = function.__name__
+    if inspect.isgeneratorfunction(function):
+        @functools.wraps(function)
+        def stream_wrapper(*args, **kwargs):
+            if not PROFILER.enabled:
+                return function(*args, **kwargs)
+            return _profiled_stream(name, function(*args, **kwargs))
+        return stream_wrapper
+
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+        if not PROFILER.enabled:
+            return function(*args, **kwargs)
+        with profile_stage(name) as record:
+            result = function(*args, **kwargs)
+            record['rows'] = _rows_processed(args, result)
+        return result
+    return wrapper
+
+
+def write_profile(filename='penguin_profile.json', report_file=None):
+    """
+    Save the recorded stages as JSON and optionally append the summary to a report.
+    
+    Parameters:
+        filename (str): Path of the JSON file
+        report_file (str): Analysis output file to append the readable summary to
+    """
+    with open(filename, 'w') as file:
+        file.write(PROFILER.to_json())
+    if report_file:
+        with open(report_file, 'a') as file:
+            file.write('\n' + PROFILER.summary())
+
 
 # import data from csv file and data cleaning (combined version of eve and alexia's code)
 
-def load_csv(penguins_file):
+# the schema says how each column is converted: type is float, int, str or
+# any callable taking the raw text; a value that is empty, or that matches
+# one of na_tokens after strip() and upper(), becomes default instead.
+# Results of float, int and str are cached per distinct text; other
+# callables run for every field, so they may return mutable objects
+ColumnSchema = namedtuple('ColumnSchema', 'name type na_tokens default')
+
+PENGUIN_SCHEMA = (tuple(ColumnSchema(name, float, ('', 'NA'), None) for name in MEASUREMENT_COLUMNS)
+                  + tuple(ColumnSchema(name, int, ('', 'NA'), None) for name in INTEGER_COLUMNS))
+
+# columns the schema doesn't list are kept as text, with NA as ""
+TEXT_COLUMN = ColumnSchema(None, str, ('NA',), "")
+
+
+def _column_converter(column):
+    na_tokens = frozenset(token.upper() for token in column.na_tokens)
+    convert = column.type
+    default = column.default
+
+    def converter(value):
+        if not value or value.strip().upper() in na_tokens:
+            return default
+        return convert(value)
+    return converter
+
+
+class _ConverterMemo(dict):
+    """Raw field text -> converted value for one column, converting each distinct text once."""
+
+    __slots__ = ('converter',)
+
+    def __init__(self, converter):
+        super().__init__()
+        self.converter = converter
+
+    def __missing__(self, value):
+        if len(self) > SCAN_MEMO_LIMIT:
+            self.clear()
+        converted = self[value] = self.converter(value)
+        return converted
+
+
+class _ConverterCall:
+    """Same lookup as _ConverterMemo, but converting every field without caching."""
+
+    __slots__ = ('converter',)
+
+    def __init__(self, converter):
+        self.converter = converter
+
+    def __getitem__(self, value):
+        return self.converter(value)
+
+
+def _column_memo(column):
+    # only the built-in types are known to return immutable values that rows
+    # can share; any other callable is called once per field
+    converter = _column_converter(column)
+    if column.type in (float, int, str):
+        return _ConverterMemo(converter)
+    return _ConverterCall(converter)
+
+
+def _resolve_columns(header, schema):
+    # (positions, names, memos) of the named header columns
+    columns = {column.name: column for column in PENGUIN_SCHEMA}
+    for column in schema or ():
+        columns[column.name] = column
+
+    positions = []
+    names = []
+    memos = []
+    for position, name in enumerate(header):
+        # Skip the index column if it exists
+        if name == '':
+            continue
+        positions.append(position)
+        names.append(name)
+        memos.append(_column_memo(columns.get(name, TEXT_COLUMN)))
+    return tuple(positions), tuple(names), tuple(memos)
+
+
+def compile_schema(header, schema=None):
+    """
+    Resolve the schema against a CSV header once, giving a row converter.
+    
+    The converter takes the list of fields from csv.reader and looks each
+    one up by position in a per-column memo of converted values, so no
+    column names are compared per cell. Like csv.DictReader plus the
+    original cleaning rules, the unnamed index column and fields beyond the
+    header are dropped, and missing trailing fields become the default.
+    
+    Parameters:
+        header (list): Column names from the first CSV row
+        schema (iterable): ColumnSchema entries that add to or replace
+            PENGUIN_SCHEMA
+    
+    Returns:
+        callable: Function turning a list of fields into a penguin dictionary
+    """
+    positions, names, memos = _resolve_columns(header, schema)
+    width = len(header)
+    if len(positions) > 1:
+        pick = operator.itemgetter(*positions)
+    else:
+        # itemgetter returns a bare value for one position
+        pick = lambda fields: [fields[position] for position in positions]
+    lookup = operator.getitem
+
+    def coerce(fields):
+        if len(fields) < width:
+            fields = fields + [None] * (width - len(fields))
+        return dict(zip(names, map(lookup, memos, pick(fields))))
+    return coerce
+
+
+# compressed input: gzip, bz2 and xz files are recognized by their first
+# bytes and decompressed while they are read
+
+COMPRESSION_MAGIC = (
+    (b'\x1f\x8b', 'gzip'),
+    (b'BZh', 'bz2'),
+    (b'\xfd7zXZ\x00', 'xz'),
+)
+
+# decompressed bytes handed from the background thread to the parser at a time
+DECOMPRESS_CHUNK_BYTES = 1 << 20
+
+
+def _compression_kind(start):
+    for magic, kind in COMPRESSION_MAGIC:
+        if start.startswith(magic):
+            return kind
+    return None
+
+
+def detect_compression(penguins_file):
+    """Return 'gzip', 'bz2', 'xz' or None from the first bytes of a file."""
+    with open(penguins_file, 'rb') as file:
+        return _compression_kind(file.read(6))
+
+
+class _ThreadedDecompressor(io.RawIOBase):
+    """
+    Read-only byte stream filled by a background thread.
+    
+    The thread reads from a decompressing file object into a small queue, so
+    decompression (which releases the GIL in zlib, bz2 and lzma) overlaps
+    with parsing in the reading thread.
+    """
+
+    def __init__(self, compressed, chunk_size=DECOMPRESS_CHUNK_BYTES, depth=4):
+        super().__init__()
+        self._queue = queue.Queue(maxsize=depth)
+        self._stop = threading.Event()
+        self._pending = memoryview(b'')
+        self._eof = False
+        self._thread = threading.Thread(target=self._fill, args=(compressed, chunk_size), daemon=True)
+        self._thread.start()
+
+    def _put(self, item):
+        while not self._stop.is_set():
+            try:
+                self._queue.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def _fill(self, compressed, chunk_size):
+        try:
+            with compressed:
+                while True:
+                    chunk = compressed.read(chunk_size)
+                    if not self._put(chunk) or not chunk:
+                        return
+        except Exception as error:
+            # raised again in the reading thread
+            self._put(error)
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        if not self._pending:
+            if self._eof:
+                return 0
+            item = self._queue.get()
+            if isinstance(item, Exception):
+                self._eof = True
+                raise item
+            if not item:
+                self._eof = True
+                return 0
+            self._pending = memoryview(item)
+        n = min(len(buffer), len(self._pending))
+        buffer[:n] = self._pending[:n]
+        self._pending = self._pending[n:]
+        return n
+
+    def close(self):
+        if not self.closed:
+            self._stop.set()
+            self._thread.join()
+        super().close()
+
+
+def open_penguin_file(penguins_file):
+    """
+    Open a CSV file for reading as text, decompressing gzip, bz2 or xz files
+    on the fly in a background thread.
+    
+    Parameters:
+        penguins_file (str): Path to a plain or compressed CSV file
+    
+    Returns:
+        file object: Text stream of the CSV contents
+    """
+    kind = detect_compression(penguins_file)
+    if kind is None:
+        return open(penguins_file, 'r')
+    # multi-member gzip and multi-stream bz2/xz files are read through to the end
+    if kind == 'gzip':
+        import gzip
+        compressed = gzip.open(penguins_file, 'rb')
+    elif kind == 'bz2':
+        import bz2
+        compressed = bz2.open(penguins_file, 'rb')
+    else:
+        import lzma
+        compressed = lzma.open(penguins_file, 'rb')
+    return io.TextIOWrapper(io.BufferedReader(_ThreadedDecompressor(compressed)))
+
+
+@profiled
+def iter_csv(penguins_file, records=False, schema=None):
+    """
+    Stream penguin records from a CSV file one at a time.
+    
+    Values are converted the same way as load_csv, but no list is built, so
+    memory use does not grow with the size of the file. Compressed files
+    are decompressed on the fly, see open_penguin_file.
+    
+    Parameters:
+        penguins_file (str): Path to the CSV file
+        records (bool): Yield compact PenguinRecord objects instead of dictionaries
+        schema (iterable): Extra ColumnSchema entries, see compile_schema
+    
+    Yields:
+        dict: One penguin record per CSV row
+    """
+    try:
+        with open_penguin_file(penguins_file) as file:
+            reader = csv.reader(file)
+            header = next(reader, None)
+            if header is None:
+                return
+            coerce = compile_schema(header, schema)
+            
+            # blank lines are skipped, as csv.DictReader does
+            if records:
+                for fields in reader:
+                    if fields:
+                        yield PenguinRecord.from_dict(coerce(fields))
+            else:
+                for fields in reader:
+                    if fields:
+                        yield coerce(fields)
+    except FileNotFoundError:
+        print(f"Error: The file {penguins_file} was not found.")
+
+
+@profiled
+def load_csv(penguins_file, records=False, schema=None):
+    """
+    Load penguin data from a CSV file.
+    
+    gzip, bz2 and xz files are recognized by their first bytes and
+    decompressed while they are parsed.
+    
+    Parameters:
+        penguins_file (str): Path to the CSV file
+        records (bool): Return compact PenguinRecord objects instead of dictionaries
+        schema (iterable): ColumnSchema entries for custom or extra columns,
+            added to PENGUIN_SCHEMA
+    
+    Returns:
+        list: List of dictionaries, each representing a penguin record
+    """
+    return list(iter_csv(penguins_file, records, schema))
+
+
+# data-quality validation: malformed rows are set aside instead of stopping
+# the load, and unusual measurements are flagged per species
+
+# plausible range of each measurement; values outside it are treated as
+# data-entry errors and the row is quarantined
+VALID_RANGES = {
+    'bill_length_mm': (25.0, 70.0),
+    'bill_depth_mm': (10.0, 25.0),
+    'flipper_length_mm': (150.0, 250.0),
+    'body_mass_g': (2000.0, 7000.0),
+}
+
+# a measurement is an outlier for its species when its z-score is beyond
+# OUTLIER_Z or it lies more than OUTLIER_IQR interquartile ranges outside
+# the quartiles
+OUTLIER_Z = 3.0
+OUTLIER_IQR = 1.5
+
+
+def _group_outliers(values, z_threshold, iqr_factor):
+    # (position, value, z-score) of the outliers among one group's values
+    n = len(values)
+    if n < 4:
+        return []
+    if np is not None:
+        values = np.asarray(values)
+        mean = values.mean()
+        std = values.std(ddof=1)
+        q1, q3 = np.percentile(values, [25, 75])
+        z = (values - mean) / std if std > 0 else np.zeros(n)
+        low = q1 - iqr_factor * (q3 - q1)
+        high = q3 + iqr_factor * (q3 - q1)
+        flagged = np.flatnonzero((np.abs(z) > z_threshold) | (values < low) | (values > high))
+        return [(int(i), float(values[i]), float(z[i])) for i in flagged]
+
+    mean = sum(values) / n
+    std = math.sqrt(sum((value - mean) ** 2 for value in values) / (n - 1))
+    # linear interpolation between ranks, as numpy.percentile does
+    ordered = sorted(values)
+    quartiles = []
+    for fraction in (0.25, 0.75):
+        rank = fraction * (n - 1)
+        below = int(rank)
+        above = min(below + 1, n - 1)
+        quartiles.append(ordered[below] + (ordered[above] - ordered[below]) * (rank - below))
+    q1, q3 = quartiles
+    low = q1 - iqr_factor * (q3 - q1)
+    high = q3 + iqr_factor * (q3 - q1)
+    outliers = []
+    for i, value in enumerate(values):
+        z = (value - mean) / std if std > 0 else 0.0
+        if abs(z) > z_threshold or value < low or value > high:
+            outliers.append((i, value, z))
+    return outliers
+
+
+def _flag_columns(species_codes, species_labels, columns, z_threshold, iqr_factor):
+    # outliers from per-row species codes and measurement columns (NaN = missing)
+    outliers = []
+    for name, column in columns.items():
+        if np is not None:
+            codes = np.asarray(species_codes)
+            values = np.asarray(column)
+            present = ~np.isnan(values)
+            groups = {}
+            for code, label in enumerate(species_labels):
+                if label:
+                    rows = np.flatnonzero(present & (codes == code))
+                    if len(rows):
+                        groups[code] = (rows, values[rows])
+        else:
+            groups = {}
+            for row, (code, value) in enumerate(zip(species_codes, column)):
+                if value == value and species_labels[code]:
+                    group = groups.get(code)
+                    if group is None:
+                        group = groups[code] = ([], [])
+                    group[0].append(row)
+                    group[1].append(value)
+        for code, (rows, values) in groups.items():
+            for position, value, z in _group_outliers(values, z_threshold, iqr_factor):
+                outliers.append({'row': int(rows[position]), 'species': species_labels[code],
+                                 'column': name, 'value': value, 'z_score': round(z, 2)})
+    outliers.sort(key=lambda outlier: outlier['row'])
+    return outliers
+
+
+@profiled
+def flag_outliers(penguins, measurements=MEASUREMENT_COLUMNS, z_threshold=OUTLIER_Z,
+                  iqr_factor=OUTLIER_IQR):
+    """
+    Find measurements that are unusual for the penguin's species.
+    
+    A value is flagged when its z-score within the species is beyond
+    z_threshold, or when it lies more than iqr_factor interquartile ranges
+    below the first or above the third quartile. Uses NumPy for the group
+    statistics when it is installed.
+    
+    Parameters:
+        penguins (iterable): Penguin dictionaries or a PenguinTable
+        measurements (tuple): Numeric columns to check
+        z_threshold (float): Largest z-score that is not an outlier
+        iqr_factor (float): Multiple of the interquartile range for the fences
+    
+    Returns:
+        list: Dictionaries with row (position in penguins), species, column,
+            value and z_score, ordered by row
+    """
+    if not isinstance(penguins, PenguinTable):
+        penguins = PenguinTable.from_records(penguins)
+    if 'species' not in penguins.codes:
+        return []
+    columns = {name: penguins.numeric[name] for name in measurements if name in penguins.numeric}
+    return _flag_columns(penguins.codes['species'], penguins.categories['species'], columns,
+                         z_threshold, iqr_factor)
+
+
+@profiled
+def iter_validated(penguins_file, report=None, quarantine_file=None, ranges=None, schema=None,
+                   z_threshold=OUTLIER_Z, iqr_factor=OUTLIER_IQR, outliers=True):
+    """
+    Stream the usable penguin records of a CSV file, setting aside bad rows.
+    
+    A row is quarantined when a numeric field can't be converted (e.g.
+    'abc') or a measurement is outside its range in VALID_RANGES. Quarantined
+    rows are copied, padded or cut to the header's width and with a reason
+    column added, to quarantine_file, which is only written when there are
+    any. Good rows are yielded as they are read. With outliers=True their
+    species and measurements are kept (in compact columns) for the outlier
+    check per species that runs when the stream ends (see flag_outliers),
+    so memory grows with the file; with outliers=False nothing is kept per
+    row. Outliers are reported but still yielded.
+    
+    Parameters:
+        penguins_file (str): Path to the CSV file, plain or compressed
+        report (dict): Filled in once the stream is exhausted with rows,
+            valid_rows, quarantined, quarantine_file, errors ({column:
+            {'invalid': count, 'out_of_range': count}}), outliers (None when
+            not checked) and thresholds
+        quarantine_file (str): Where to write bad rows, defaults to
+            penguins_file + '.quarantine.csv'
+        ranges (dict): Column names mapped to (low, high), defaults to VALID_RANGES
+        schema (iterable): Extra ColumnSchema entries, see compile_schema
+        z_threshold (float): Largest z-score that is not an outlier
+        iqr_factor (float): Multiple of the interquartile range for the fences
+        outliers (bool): Check the good rows for outliers per species
+    
+    Yields:
+        dict: One penguin record per good CSV row
+    """
+    if report is None:
+        report = {}
+    if quarantine_file is None:
+        quarantine_file = penguins_file + '.quarantine.csv'
+    if ranges is None:
+        ranges = VALID_RANGES
+
+    errors = {}
+    rows = 0
+    valid_rows = 0
+    quarantined = 0
+    out = None
+    species_lookup = {"": 0}
+    species_labels = [""]
+    species_codes = array('I')
+    columns = {}
+    nan = math.nan
+
+    def count_error(name, kind):
+        if name not in errors:
+            errors[name] = {'invalid': 0, 'out_of_range': 0}
+        errors[name][kind] += 1
+
+    try:
+        with open_penguin_file(penguins_file) as file:
+            reader = csv.reader(file)
+            header = next(reader, None)
+            if header is None:
+                header = []
+            width = len(header)
+            coerce = compile_schema(header, schema)
+            checked = [(name, low, high) for name, (low, high) in ranges.items() if name in header]
+            # separate memos, used only to find the bad fields of rows that fail
+            positions, names, memos = _resolve_columns(header, schema)
+            if outliers:
+                columns = {name: array('d') for name in MEASUREMENT_COLUMNS if name in names}
+
+            for fields in reader:
+                if not fields:
+                    continue
+                rows += 1
+                reasons = []
+                try:
+                    penguin = coerce(fields)
+                except ValueError:
+                    for position, name, memo in zip(positions, names, memos):
+                        field = fields[position] if position < len(fields) else None
+                        try:
+                            memo[field]
+                        except ValueError:
+                            count_error(name, 'invalid')
+                            reasons.append(f"{name}: invalid value {field!r}")
+                else:
+                    for name, low, high in checked:
+                        value = penguin[name]
+                        if value is not None and not low <= value <= high:
+                            count_error(name, 'out_of_range')
+                            reasons.append(f"{name}: {value:g} outside {low:g}-{high:g}")
+
+                if reasons:
+                    if out is None:
+                        out = open(quarantine_file, 'w', newline='')
+                        writer = csv.writer(out)
+                        writer.writerow(header + ['reason'])
+                    # line the reason up under its own column
+                    row = fields[:width] + [''] * (width - len(fields))
+                    writer.writerow(row + ['; '.join(reasons)])
+                    quarantined += 1
+                    continue
+
+                valid_rows += 1
+                if outliers:
+                    label = penguin.get('species') or ""
+                    code = species_lookup.get(label)
+                    if code is None:
+                        code = species_lookup[label] = len(species_labels)
+                        species_labels.append(label)
+                    species_codes.append(code)
+                for name, column in columns.items():
+                    value = penguin[name]
+                    column.append(nan if value is None else value)
+                yield penguin
+    except FileNotFoundError:
+        print(f"Error: The file {penguins_file} was not found.")
+    finally:
+        if out is not None:
+            out.close()
+
+    report.update({
+        'rows': rows,
+        'valid_rows': valid_rows,
+        'quarantined': quarantined,
+        'quarantine_file': quarantine_file if quarantined else None,
+        'errors': errors,
+        'outliers': (_flag_columns(species_codes, species_labels, columns, z_threshold, iqr_factor)
+                     if outliers else None),
+        'z_threshold': z_threshold,
+        'iqr_factor': iqr_factor,
+    })
+
+
+@profiled
+def validate_csv(penguins_file, quarantine_file=None, ranges=None, schema=None,
+                 z_threshold=OUTLIER_Z, iqr_factor=OUTLIER_IQR):
+    """
+    Load penguin data, setting aside rows that can't be used.
+    
+    The list version of iter_validated, which takes the same arguments;
+    pass iter_validated to aggregate_penguins to validate without keeping
+    the rows in memory.
+    
+    Returns:
+        tuple: (list of penguin dictionaries from the good rows, report dict
+            as filled in by iter_validated)
+    """
+    report = {}
+    penguins = list(iter_validated(penguins_file, report, quarantine_file, ranges, schema,
+                                   z_threshold, iqr_factor))
+    return penguins, report
+
+
+# compact row records
+
+# the columns of penguins.csv, in file order, that PenguinRecord stores in slots
+RECORD_FIELDS = ('species', 'island') + MEASUREMENT_COLUMNS + ('sex',) + INTEGER_COLUMNS
+RECORD_TEXT_FIELDS = ('species', 'island', 'sex')
+
+
+class PenguinRecord:
+    """
+    One penguin row in __slots__ instead of a dict.
+    
+    Holds the same values load_csv puts in a dictionary: species, island and
+    sex are interned strings ("" when missing), the measurements floats and
+    year an int (None when missing). Columns outside RECORD_FIELDS go in
+    `extra`. When the CSV lacks some of RECORD_FIELDS, `present` lists the
+    ones it has, so keys(), `in` and to_dict() match the dictionary; the
+    attributes of absent fields still hold the missing value. The analysis
+    functions read the attributes directly; get(), [] and `in` work as on a
+    dictionary for everything else.
+    """
+
+    __slots__ = RECORD_FIELDS + ('extra', 'present')
+
+    def __init__(self, species='', island='', bill_length_mm=None, bill_depth_mm=None,
+                 flipper_length_mm=None, body_mass_g=None, sex='', year=None, extra=None,
+                 present=None):
+        self.species = sys.intern(species)
+        self.island = sys.intern(island)
+        self.bill_length_mm = bill_length_mm
+        self.bill_depth_mm = bill_depth_mm
+        self.flipper_length_mm = flipper_length_mm
+        self.body_mass_g = body_mass_g
+        self.sex = sys.intern(sex)
+        self.year = year
+        self.extra = extra
+        # None means every field in RECORD_FIELDS is present
+        self.present = present
+
+    @classmethod
+    def from_dict(cls, penguin):
+        """Build a record from a load_csv dictionary."""
+        record = cls(*(penguin.get(name, '' if name in RECORD_TEXT_FIELDS else None)
+                       for name in RECORD_FIELDS))
+        extra = {name: value for name, value in penguin.items() if name not in RECORD_FIELDS}
+        if extra:
+            record.extra = extra
+        if len(penguin) - len(extra) < len(RECORD_FIELDS):
+            present = tuple(name for name in RECORD_FIELDS if name in penguin)
+            # records from the same file share one tuple
+            record.present = _PRESENT_FIELDS.setdefault(present, present)
+        return record
+
+    def _has_field(self, name):
+        return name in RECORD_FIELDS and (self.present is None or name in self.present)
+
+    def keys(self):
+        fields = RECORD_FIELDS if self.present is None else self.present
+        return list(fields) + list(self.extra or ())
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def __contains__(self, name):
+        return self._has_field(name) or (self.extra is not None and name in self.extra)
+
+    def __getitem__(self, name):
+        if self._has_field(name):
+            return getattr(self, name)
+        if self.extra is not None and name in self.extra:
+            return self.extra[name]
+        raise KeyError(name)
+
+    def get(self, name, default=None):
+        if self._has_field(name):
+            return getattr(self, name)
+        if self.extra is not None:
+            return self.extra.get(name, default)
+        return default
+
+    def items(self):
+        return [(name, self[name]) for name in self.keys()]
+
+    def to_dict(self):
+        """The dictionary load_csv would have returned for this row."""
+        return dict(self.items())
+
+    def __eq__(self, other):
+        if isinstance(other, PenguinRecord):
+            return self.to_dict() == other.to_dict()
+        if isinstance(other, dict):
+            return self.to_dict() == other
+        return NotImplemented
+
+    def __repr__(self):
+        return f"PenguinRecord({self.to_dict()!r})"
+
+
+_PRESENT_FIELDS = {}
+
+
+# columnar storage
+
+class PenguinTable:
+    """
+    Column-oriented penguin data.
+    
+    Measurement columns and year are kept in array('d') buffers with NaN for
+    missing values. Every other column is kept as array('I') category codes
+    plus a list of the distinct labels, with missing text stored as "".
+    Iterating over a table yields the same dictionaries load_csv returns.
+    Other column names can be stored as numbers by passing numeric_columns.
+    """
+
+    def __init__(self, numeric_columns=MEASUREMENT_COLUMNS + INTEGER_COLUMNS):
+        self.numeric_columns = numeric_columns
+        self.version = 0
+        self._indexes = {}
+        self.columns = []
+        self.numeric = {}
+        self.codes = {}
+        self.categories = {}
+        self._code_lookup = {}
+        self.length = 0
+
+    @classmethod
+    def from_records(cls, penguins, numeric_columns=MEASUREMENT_COLUMNS + INTEGER_COLUMNS):
+        """Build a table from an iterable of penguin dictionaries."""
+        table = cls(numeric_columns)
+        for penguin in penguins:
+            table.append(penguin)
+        return table
+
+    def _add_column(self, name):
+        self.columns.append(name)
+        if name in self.numeric_columns:
+            self.numeric[name] = array('d', [math.nan]) * self.length
+        else:
+            self.categories[name] = [""]
+            self._code_lookup[name] = {"": 0}
+            self.codes[name] = array('I', [0]) * self.length
+
+    def append(self, penguin):
+        """Add one penguin dictionary as a new row."""
+        for name in penguin:
+            if name not in self.numeric and name not in self.codes:
+                self._add_column(name)
+
+        for name, values in self.numeric.items():
+            value = penguin.get(name)
+            values.append(math.nan if value is None else value)
+
+        for name, codes in self.codes.items():
+            label = penguin.get(name) or ""
+            lookup = self._code_lookup[name]
+            code = lookup.get(label)
+            if code is None:
+                code = lookup[label] = len(self.categories[name])
+                self.categories[name].append(label)
+            codes.append(code)
+
+        self.length += 1
+        self.version += 1
+
+    def __len__(self):
+        return self.length
+
+    def __getitem__(self, index):
+        penguin = {}
+        for name in self.columns:
+            if name in self.numeric:
+                value = self.numeric[name][index]
+                if value != value:
+                    value = None
+                elif name in INTEGER_COLUMNS:
+                    value = int(value)
+                penguin[name] = value
+            else:
+                penguin[name] = self.categories[name][self.codes[name][index]]
+        return penguin
+
+    def __iter__(self):
+        for index in range(self.length):
+            yield self[index]
+
+    def value(self, name, row):
+        """One cell, converted like a row from __getitem__ (None if the column is absent)."""
+        if name in self.codes:
+            return self.categories[name][self.codes[name][row]]
+        if name not in self.numeric:
+            return None
+        value = self.numeric[name][row]
+        if value != value:
+            return None
+        return int(value) if name in INTEGER_COLUMNS else value
+
+    def index(self, name):
+        """
+        Sorted row positions for each value of a column.
+        
+        Built on first use and rebuilt once the table has changed. Text
+        columns are indexed by label; numeric columns by value, leaving out
+        missing values.
+        
+        Parameters:
+            name (str): Column name
+        
+        Returns:
+            dict: Column values mapped to array('I') row positions
+        """
+        cached = self._indexes.get(name)
+        if cached is not None and cached[0] == self.version:
+            return cached[1]
+
+        if name in self.codes:
+            positions = [array('I') for _ in self.categories[name]]
+            for row, code in enumerate(self.codes[name]):
+                positions[code].append(row)
+            index = dict(zip(self.categories[name], positions))
+        else:
+            index = {}
+            for row, value in enumerate(self.numeric.get(name, ())):
+                if value == value:
+                    if name in INTEGER_COLUMNS:
+                        value = int(value)
+                    if value not in index:
+                        index[value] = array('I')
+                    index[value].append(row)
+
+        self._indexes[name] = (self.version, index)
+        return index
+
+    def build_indexes(self, columns=('species', 'island', 'sex', 'year')):
+        """Build the indexes for the given columns now rather than on first query."""
+        for name in columns:
+            if name in self.codes or name in self.numeric:
+                self.index(name)
+
+
+# fast byte-level scanner for the penguins CSV layout
+
+class _ScanFallback(Exception):
+    """Raised when a file needs the full csv module (e.g. quoted newlines)."""
+
+
+# lines are scanned in blocks of about this many bytes
+SCAN_BLOCK_BYTES = 1 << 22
+
+# converted values remembered per column before the memo is cleared
+SCAN_MEMO_LIMIT = 1 << 16
+
+
+def _unquote(field):
+    """Strip the quotes around one field, or raise _ScanFallback if it needs csv."""
+    if len(field) >= 2 and field[0:1] == b'"' and field[-1:] == b'"' and b'"' not in field[1:-1]:
+        return field[1:-1]
+    raise _ScanFallback()
+
+
+def _scan_number(field, is_integer):
+    if field is None:
+        return math.nan
+    if b'"' in field:
+        field = _unquote(field)
+    stripped = field.strip()
+    if not stripped or stripped.upper() == b'NA':
+        return math.nan
+    return int(field) if is_integer else float(field)
+
+
+def _scan_label(field):
+    if field is None:
+        return ""
+    if b'"' in field:
+        field = _unquote(field)
+    value = field.decode('utf-8')
+    return value if value and value.strip().upper() != 'NA' else ""
+
+
+def _line_blocks(data, start, end=None):
+    """
+    Yield lists of complete lines from data[start:end], split on newlines.
+    
+    Each block of about SCAN_BLOCK_BYTES is copied out of the mapping once
+    and split into line objects, so memory stays bounded by the block size
+    rather than the file size; this is a blocked read, not a zero-copy scan.
+    """
+    size = len(data) if end is None else end
+    while start < size:
+        stop = min(start + SCAN_BLOCK_BYTES, size)
+        if stop < size:
+            newline = data.rfind(b'\n', start, stop)
+            if newline == -1:
+                newline = data.find(b'\n', stop)
+            stop = size if newline == -1 else newline + 1
+        block = data[start:stop]
+        if b'\r' in block:
+            block = block.replace(b'\r\n', b'\n')
+            if b'\r' in block:
+                raise _ScanFallback()
+        lines = block.split(b'\n')
+        if b'"' in block and any(line.count(b'"') % 2 for line in lines):
+            # a quoted field spans lines
+            raise _ScanFallback()
+        yield lines
+        start = stop
+
+
+def _scan_mmap(data, start=None, end=None):
+    """
+    Fill a PenguinTable from the mapped bytes of a CSV file, or only from
+    the lines in data[start:end] when a byte range is given.
+    """
+    data.seek(0)
+    header_line = data.readline()
+    header_text = header_line.rstrip(b'\n').rstrip(b'\r')
+    if b'\r' in header_text or header_text.count(b'"') % 2:
+        raise _ScanFallback()
+    header = next(csv.reader([header_text.decode('utf-8')]), [])
+    n_header = len(header)
+
+    table = PenguinTable()
+    plan = []
+    for position, name in enumerate(header):
+        # Skip the index column if it exists
+        if name == '':
+            continue
+        if name in table.numeric or name in table.codes:
+            raise _ScanFallback()
+        table._add_column(name)
+        plan.append((position, name))
+
+    # raw field bytes -> converted value (numbers) or category code (text);
+    # None stands for a field missing from a short row
+    memos = {name: {None: math.nan} if name in table.numeric else {None: 0} for _, name in plan}
+
+    for lines in _line_blocks(data, len(header_line) if start is None else start, end):
+        rows = [line.split(b',') for line in lines if line]
+        for index, fields in enumerate(rows):
+            if len(fields) != n_header:
+                # quoted commas, or short/long rows: let csv split this line
+                fields = [value.encode('utf-8') for value in next(csv.reader([b','.join(fields).decode('utf-8')]))]
+                rows[index] = (fields + [None] * n_header)[:n_header]
+
+        for position, name in plan:
+            column = [fields[position] for fields in rows]
+            memo = memos[name]
+            if len(memo) > SCAN_MEMO_LIMIT and name in table.numeric:
+                memo.clear()
+                memo[None] = math.nan
+            missing = set(column).difference(memo)
+            if name in table.numeric:
+                is_integer = name in INTEGER_COLUMNS
+                for field in missing:
+                    memo[field] = _scan_number(field, is_integer)
+                table.numeric[name].extend(map(memo.__getitem__, column))
+            else:
+                lookup = table._code_lookup[name]
+                for field in missing:
+                    label = _scan_label(field)
+                    code = lookup.get(label)
+                    if code is None:
+                        code = lookup[label] = len(table.categories[name])
+                        table.categories[name].append(label)
+                    memo[field] = code
+                table.codes[name].extend(map(memo.__getitem__, column))
+
+        table.length += len(rows)
+
+    return table
+
+
+@profiled
+def scan_csv(penguins_file):
+    """
+    Load a penguins CSV straight into a PenguinTable from the raw bytes.
+    
+    The file is memory-mapped and read a block at a time; each block is
+    copied once and split on newlines and commas, so memory is bounded by
+    the block size (this is not a zero-copy parse). Columns are then filled
+    from the byte fields, converting each distinct value only once, so no
+    per-row dictionaries or strings are created. Values follow the same NA and missing-column rules as load_csv.
+    Files the simple split cannot handle (quoted newlines, escaped quotes,
+    duplicate columns) and compressed files are read with csv instead.
+    
+    Parameters:
+        penguins_file (str): Path to the CSV file
+    
+    Returns:
+        PenguinTable: Columnar table of the penguin records
+    """
+    try:
+        file = open(penguins_file, 'rb')
+    except FileNotFoundError:
+        print(f"Error: The file {penguins_file} was not found.")
+        return PenguinTable()
+
+    with file:
+        if os.fstat(file.fileno()).st_size == 0:
+            return PenguinTable()
+        if _compression_kind(file.read(6)) is None:
+            with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                try:
+                    return _scan_mmap(data)
+                except _ScanFallback:
+                    pass
+    return PenguinTable.from_records(iter_csv(penguins_file))
+
+
+# binary snapshots of parsed tables
+#
+# layout: magic, little-endian u32 metadata length, JSON metadata, then the
+# raw column buffers, each starting on an 8 byte boundary
+
+SNAPSHOT_MAGIC = b'PENGSNAP'
+SNAPSHOT_VERSION = 1
+
+
+def _padding(size):
+    return -size % 8
+
+
+def _file_fingerprint(penguins_file, with_hash=True):
+    """Size, modification time and (optionally) SHA-1 of a file."""
+    info = os.stat(penguins_file)
+    fingerprint = {'size': info.st_size, 'mtime_ns': info.st_mtime_ns}
+    if with_hash:
+        digest = hashlib.sha1()
+        with open(penguins_file, 'rb') as file:
+            for chunk in iter(lambda: file.read(1 << 20), b''):
+                digest.update(chunk)
+        fingerprint['sha1'] = digest.hexdigest()
+    return fingerprint
+
+
+def save_snapshot(table, snapshot_file, fingerprint=None):
+    """
+    Write a PenguinTable to a compact binary snapshot file.
+    
+    Parameters:
+        table (PenguinTable): Table to save
+        snapshot_file (str): Path of the snapshot file
+        fingerprint (dict): Source file fingerprint stored alongside the data
+    """
+    layout = []
+    buffers = []
+    offset = 0
+    for name in table.columns:
+        if name in table.numeric:
+            buffer = memoryview(table.numeric[name])
+        else:
+            buffer = memoryview(table.codes[name])
+        layout.append({'name': name, 'format': buffer.format,
+                       'offset': offset, 'nbytes': buffer.nbytes})
+        buffers.append(buffer)
+        offset += buffer.nbytes + _padding(buffer.nbytes)
+
+    meta = json.dumps({
+        'version': SNAPSHOT_VERSION,
+        'byteorder': sys.byteorder,
+        'length': len(table),
+        'fingerprint': fingerprint,
+        'columns': layout,
+        'categories': table.categories,
+    }).encode('utf-8')
+
+    temp_file = snapshot_file + '.tmp'
+    with open(temp_file, 'wb') as file:
+        header_size = len(SNAPSHOT_MAGIC) + 4 + len(meta)
+        file.write(SNAPSHOT_MAGIC + struct.pack('<I', len(meta)) + meta)
+        file.write(b'\0' * _padding(header_size))
+        for buffer in buffers:
+            file.write(buffer)
+            file.write(b'\0' * _padding(buffer.nbytes))
+    os.replace(temp_file, snapshot_file)
+
+
+def open_snapshot(snapshot_file):
+    """
+    Memory-map a snapshot written by save_snapshot.
+    
+    The columns of the returned table are views straight into the mapped
+    file, so nothing is copied or parsed; such a table is read-only.
+    
+    Parameters:
+        snapshot_file (str): Path of the snapshot file
+    
+    Returns:
+        tuple: (PenguinTable, fingerprint dict), or None if the file is not a
+            usable snapshot
+    """
+    try:
+        with open(snapshot_file, 'rb') as file:
+            mapped = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        if mapped[:len(SNAPSHOT_MAGIC)] != SNAPSHOT_MAGIC:
+            return None
+        meta_start = len(SNAPSHOT_MAGIC) + 4
+        meta_size = struct.unpack_from('<I', mapped, len(SNAPSHOT_MAGIC))[0]
+        meta = json.loads(mapped[meta_start:meta_start + meta_size])
+        if meta['version'] != SNAPSHOT_VERSION or meta['byteorder'] != sys.byteorder:
+            return None
+
+        data_start = meta_start + meta_size + _padding(meta_start + meta_size)
+        view = memoryview(mapped)
+        table = PenguinTable()
+        table.length = meta['length']
+        for column in meta['columns']:
+            start = data_start + column['offset']
+            buffer = view[start:start + column['nbytes']].cast(column['format'])
+            name = column['name']
+            table.columns.append(name)
+            if name in meta['categories']:
+                table.codes[name] = buffer
+                table.categories[name] = meta['categories'][name]
+                table._code_lookup[name] = {label: code for code, label in enumerate(table.categories[name])}
+            else:
+                table.numeric[name] = buffer
+        return table, meta['fingerprint']
+    except (OSError, ValueError, KeyError, TypeError, struct.error):
+        return None
+
+
+@profiled
+def load_table(penguins_file, cache=False, verify_hash=False, index=False):
+    """
+    Load penguin data from a CSV file into a PenguinTable.
+    
+    With cache=True the parsed table is saved to penguins_file + '.snapshot'
+    and later loads memory-map that snapshot instead of parsing the CSV,
+    as long as the CSV's size and modification time (and with
+    verify_hash=True, its SHA-1) still match.
+    
+    Parameters:
+        penguins_file (str): Path to the CSV file
+        cache (bool): Use and refresh the binary snapshot
+        verify_hash (bool): Also compare the content hash before trusting the snapshot
+        index (bool): Build the species, island, sex and year indexes used by query
+    
+    Returns:
+        PenguinTable: Columnar table of the penguin records
+    """
+    table = _load_table(penguins_file, cache, verify_hash)
+    if index:
+        table.build_indexes()
+    return table
+
+
+def _load_table(penguins_file, cache, verify_hash):
+    if not cache:
+        return scan_csv(penguins_file)
+
+    try:
+        fingerprint = _file_fingerprint(penguins_file, with_hash=verify_hash)
+    except FileNotFoundError:
+        print(f"Error: The file {penguins_file} was not found.")
+        return PenguinTable()
+
+    snapshot_file = penguins_file + '.snapshot'
+    if os.path.exists(snapshot_file):
+        opened = open_snapshot(snapshot_file)
+        if opened is not None:
+            table, saved = opened
+            if saved and all(saved.get(key) == value for key, value in fingerprint.items()):
+                return table
+
+    # fingerprint before parsing, so a file changed meanwhile is reparsed next time
+    fingerprint = _file_fingerprint(penguins_file)
+    table = scan_csv(penguins_file)
+    save_snapshot(table, snapshot_file, fingerprint)
+    return table
+
+
+# full-precision group statistics
+
+class GroupStats:
+    """
+    Full-precision count, sum, sum of squares, minimum and maximum of one group.
+    
+    Nothing is rounded here, so stats from different batches or workers can
+    be merged and only rounded when a report is produced.
+    """
+
+    __slots__ = ('count', 'total', 'total_sq', 'minimum', 'maximum')
+
+    def __init__(self, count=0, total=0, total_sq=0, minimum=None, maximum=None):
+        self.count = count
+        self.total = total
+        self.total_sq = total_sq
+        self.minimum = minimum
+        self.maximum = maximum
+
+    def add(self, value):
+        self.count += 1
+        self.total += value
+        self.total_sq += value * value
+        if self.minimum is None or value < self.minimum:
+            self.minimum = value
+        if self.maximum is None or value > self.maximum:
+            self.maximum = value
+
+    def merge(self, other):
+        if not other.count:
+            return
+        self.count += other.count
+        self.total += other.total
+        self.total_sq += other.total_sq
+        if self.minimum is None or other.minimum < self.minimum:
+            self.minimum = other.minimum
+        if self.maximum is None or other.maximum > self.maximum:
+            self.maximum = other.maximum
+
+    def copy(self):
+        return GroupStats(self.count, self.total, self.total_sq, self.minimum, self.maximum)
+
+    def to_state(self):
+        """Plain list of the fields, for saving as JSON."""
+        return [self.count, self.total, self.total_sq, self.minimum, self.maximum]
+
+    @classmethod
+    def from_state(cls, state):
+        return cls(*state)
+
+    def mean(self):
+        return self.total / self.count if self.count else None
+
+    def variance(self):
+        """Sample variance, or None with fewer than two values."""
+        if self.count < 2:
+            return None
+        spread = self.total_sq - self.total * self.total / self.count
+        return max(spread, 0.0) / (self.count - 1)
+
+    def std(self):
+        variance = self.variance()
+        return None if variance is None else math.sqrt(variance)
+
+    def __eq__(self, other):
+        if not isinstance(other, GroupStats):
+            return NotImplemented
+        return all(getattr(self, name) == getattr(other, name) for name in self.__slots__)
+
+    def __repr__(self):
+        return (f"GroupStats(count={self.count}, total={self.total}, total_sq={self.total_sq}, "
+                f"minimum={self.minimum}, maximum={self.maximum})")
+
+
+class GroupedStats:
+    """GroupStats for each group key, merged key by key."""
+
+    def __init__(self):
+        self.groups = {}
+
+    def add(self, key, value):
+        stats = self.groups.get(key)
+        if stats is None:
+            stats = self.groups[key] = GroupStats()
+        stats.add(value)
+
+    def merge_group(self, key, stats):
+        if key in self.groups:
+            self.groups[key].merge(stats)
+        else:
+            self.groups[key] = stats.copy()
+
+    def merge(self, other):
+        for key, stats in other.groups.items():
+            self.merge_group(key, stats)
+
+    def items(self):
+        return self.groups.items()
+
+    def to_state(self):
+        """List of [key, stats] pairs, for saving as JSON."""
+        return [[list(key) if isinstance(key, tuple) else key, stats.to_state()]
+                for key, stats in self.groups.items()]
+
+    @classmethod
+    def from_state(cls, state):
+        grouped = cls()
+        for key, stats in state:
+            grouped.groups[tuple(key) if isinstance(key, list) else key] = GroupStats.from_state(stats)
+        return grouped
+
+    def __len__(self):
+        return len(self.groups)
+
+
+def _numpy_group_stats(groups, values, n_groups):
+    """Yield (group, GroupStats) for each non-empty group using bincount reductions."""
+    valid = ~np.isnan(values)
+    groups = groups[valid]
+    values = values[valid]
+    counts = np.bincount(groups, minlength=n_groups)
+    totals = np.bincount(groups, weights=values, minlength=n_groups)
+    totals_sq = np.bincount(groups, weights=values * values, minlength=n_groups)
+    minimums = np.full(n_groups, np.inf)
+    np.minimum.at(minimums, groups, values)
+    maximums = np.full(n_groups, -np.inf)
+    np.maximum.at(maximums, groups, values)
+    for group in np.flatnonzero(counts):
+        yield int(group), GroupStats(int(counts[group]), float(totals[group]), float(totals_sq[group]),
+                                     float(minimums[group]), float(maximums[group]))
+
+
+# streaming distribution statistics: fixed memory per group, mergeable
+
+# histogram range and bin count per measurement; values outside the range
+# are counted as below or above
+MEASUREMENT_HISTOGRAMS = {
+    'bill_length_mm': (30.0, 60.0, 30),
+    'bill_depth_mm': (13.0, 22.0, 18),
+    'flipper_length_mm': (170.0, 235.0, 13),
+    'body_mass_g': (2500.0, 6500.0, 40),
+}
+
+DEFAULT_PERCENTILES = (5, 25, 50, 75, 95)
+
+
+class FixedHistogram:
+    """Counts in equal-width bins between low and high, plus below/above counts."""
+
+    __slots__ = ('low', 'high', 'bins', 'counts')
+
+    def __init__(self, low, high, bins, counts=None):
+        self.low = low
+        self.high = high
+        self.bins = bins
+        # counts[0] is below low, counts[-1] is at or above high
+        self.counts = counts if counts is not None else [0] * (bins + 2)
+
+    def add(self, value):
+        if value < self.low:
+            self.counts[0] += 1
+        elif value >= self.high:
+            self.counts[-1] += 1
+        else:
+            bin_index = int((value - self.low) * self.bins / (self.high - self.low))
+            self.counts[1 + min(bin_index, self.bins - 1)] += 1
+
+    def merge(self, other):
+        if (self.low, self.high, self.bins) != (other.low, other.high, other.bins):
+            raise ValueError("Histograms with different bins cannot be merged")
+        self.counts = [a + b for a, b in zip(self.counts, other.counts)]
+
+    def edges(self):
+        width = (self.high - self.low) / self.bins
+        return [self.low + i * width for i in range(self.bins + 1)]
+
+    def to_state(self):
+        return [self.low, self.high, self.bins, self.counts]
+
+    @classmethod
+    def from_state(cls, state):
+        low, high, bins, counts = state
+        return cls(low, high, bins, list(counts))
+
+
+class KLLSketch:
+    """
+    KLL quantile sketch.
+    
+    Values are kept in levels (compactors); an item on level i stands for
+    2**i values. When a level fills up it is sorted and every other item
+    moves up a level, so memory stays around 3k items however many values
+    are added, and the rank error stays around 1/k. Which half is kept
+    alternates on each level instead of being random, so results are
+    reproducible.
+    """
+
+    __slots__ = ('k', 'count', 'compactions', 'compactors')
+
+    def __init__(self, k=200):
+        self.k = k
+        self.count = 0
+        self.compactions = [0]
+        self.compactors = [[]]
+
+    def _capacity(self, level):
+        depth = len(self.compactors) - level - 1
+        return max(2, int(math.ceil(self.k * (2 / 3) ** depth)))
+
+    def add(self, value):
+        compactor = self.compactors[0]
+        compactor.append(value)
+        self.count += 1
+        if len(compactor) >= self._capacity(0):
+            self._compress()
+
+    def _compress(self):
+        level = 0
+        while level < len(self.compactors):
+            if len(self.compactors[level]) >= self._capacity(level):
+                if level + 1 == len(self.compactors):
+                    self.compactors.append([])
+                    self.compactions.append(0)
+                items = sorted(self.compactors[level])
+                # an odd item out stays on this level
+                kept = [items.pop()] if len(items) % 2 else []
+                self.compactors[level + 1].extend(items[self.compactions[level] % 2::2])
+                self.compactors[level] = kept
+                self.compactions[level] += 1
+            level += 1
+
+    def merge(self, other):
+        while len(self.compactors) < len(other.compactors):
+            self.compactors.append([])
+            self.compactions.append(0)
+        for level, items in enumerate(other.compactors):
+            self.compactors[level].extend(items)
+        self.count += other.count
+        self._compress()
+
+    def quantiles(self, fractions):
+        """Nearest-rank estimates for each fraction in [0, 1], None when empty."""
+        if not self.count:
+            return [None for _ in fractions]
+        weighted = sorted((value, 1 << level)
+                          for level, items in enumerate(self.compactors) for value in items)
+        estimates = []
+        for fraction in fractions:
+            rank = max(1, math.ceil(fraction * self.count))
+            seen = 0
+            for value, weight in weighted:
+                seen += weight
+                if seen >= rank:
+                    break
+            estimates.append(value)
+        return estimates
+
+    def quantile(self, fraction):
+        return self.quantiles([fraction])[0]
+
+    def to_state(self):
+        return [self.k, self.count, self.compactions, self.compactors]
+
+    @classmethod
+    def from_state(cls, state):
+        sketch = cls(state[0])
+        sketch.count, sketch.compactions = state[1], list(state[2])
+        sketch.compactors = [list(items) for items in state[3]]
+        return sketch
+
+
+class DistributionStats:
+    """
+    Count, mean and variance (Welford), min/max, quantile sketch and
+    histogram of one measurement in one group.
+    """
+
+    __slots__ = ('count', 'mean', 'm2', 'minimum', 'maximum', 'sketch', 'histogram')
+
+    def __init__(self, histogram=(0.0, 1.0, 1), k=200):
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.minimum = None
+        self.maximum = None
+        self.sketch = KLLSketch(k)
+        self.histogram = FixedHistogram(*histogram)
+
+    def add(self, value):
+        self.count += 1
+        delta = value - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (value - self.mean)
+        if self.minimum is None or value < self.minimum:
+            self.minimum = value
+        if self.maximum is None or value > self.maximum:
+            self.maximum = value
+        self.sketch.add(value)
+        self.histogram.add(value)
+
+    def merge(self, other):
+        if not other.count:
+            return
+        # Chan et al.'s pairwise update of the mean and squared deviations
+        count = self.count + other.count
+        delta = other.mean - self.mean
+        self.mean += delta * other.count / count
+        self.m2 += other.m2 + delta * delta * self.count * other.count / count
+        self.count = count
+        if self.minimum is None or other.minimum < self.minimum:
+            self.minimum = other.minimum
+        if self.maximum is None or other.maximum > self.maximum:
+            self.maximum = other.maximum
+        self.sketch.merge(other.sketch)
+        self.histogram.merge(other.histogram)
+
+    def variance(self):
+        """Sample variance, or None with fewer than two values."""
+        return self.m2 / (self.count - 1) if self.count > 1 else None
+
+    def std(self):
+        variance = self.variance()
+        return None if variance is None else math.sqrt(variance)
+
+    def summary(self, percentiles=DEFAULT_PERCENTILES):
+        """Plain dict of the statistics, unrounded."""
+        estimates = self.sketch.quantiles([p / 100 for p in percentiles])
+        return {
+            'count': self.count,
+            'mean': self.mean if self.count else None,
+            'std': self.std(),
+            'min': self.minimum,
+            'max': self.maximum,
+            'median': self.sketch.quantile(0.5),
+            'percentiles': dict(zip(percentiles, estimates)),
+            'histogram': {'edges': self.histogram.edges(), 'counts': self.histogram.counts[1:-1],
+                          'below': self.histogram.counts[0], 'above': self.histogram.counts[-1]},
+        }
+
+    def to_state(self):
+        return [self.count, self.mean, self.m2, self.minimum, self.maximum,
+                self.sketch.to_state(), self.histogram.to_state()]
+
+    @classmethod
+    def from_state(cls, state):
+        stats = cls()
+        stats.count, stats.mean, stats.m2, stats.minimum, stats.maximum = state[:5]
+        stats.sketch = KLLSketch.from_state(state[5])
+        stats.histogram = FixedHistogram.from_state(state[6])
+        return stats
+
+
+# approximate counting sketches: fixed memory however many distinct keys
+# there are, and mergeable when built with the same settings
+
+def _key_bytes(key):
+    if isinstance(key, tuple):
+        key = '\x1f'.join(str(part) for part in key)
+    return str(key).encode('utf-8')
+
+
+def _hash128(key):
+    # stable across processes, unlike hash(), so sketches from workers merge
+    digest = hashlib.blake2b(_key_bytes(key), digest_size=16).digest()
+    return int.from_bytes(digest[:8], 'little'), int.from_bytes(digest[8:], 'little')
+
+
+@functools.lru_cache(maxsize=65536)
+def _sketch_cells(key, width, depth):
+    # double hashing: row i uses h1 + i * h2; the bounded cache saves
+    # rehashing frequent keys
+    first, second = _hash128(key)
+    return tuple(row * width + (first + row * second) % width for row in range(depth))
+
+
+class CountMinSketch:
+    """
+    Count-min sketch of key frequencies.
+    
+    Estimates never undercount, and overcount by at most epsilon times the
+    total count with probability 1 - delta. Memory is
+    ceil(e / epsilon) * ceil(ln(1 / delta)) counters.
+    """
+
+    def __init__(self, epsilon=0.001, delta=0.01):
+        self.epsilon = epsilon
+        self.delta = delta
+        self.width = int(math.ceil(math.e / epsilon))
+        self.depth = int(math.ceil(math.log(1 / delta)))
+        self.total = 0
+        self.counters = array('q', [0]) * (self.width * self.depth)
+
+    def add(self, key, n=1):
+        """Count key n more times and return its new estimate."""
+        counters = self.counters
+        cells = _sketch_cells(key, self.width, self.depth)
+        for cell in cells:
+            counters[cell] += n
+        self.total += n
+        return min([counters[cell] for cell in cells])
+
+    def estimate(self, key):
+        counters = self.counters
+        return min([counters[cell] for cell in _sketch_cells(key, self.width, self.depth)])
+
+    def merge(self, other):
+        if (self.width, self.depth) != (other.width, other.depth):
+            raise ValueError("Count-min sketches with different sizes cannot be merged")
+        self.counters = array('q', map(sum, zip(self.counters, other.counters)))
+        self.total += other.total
+
+    def to_state(self):
+        return [self.epsilon, self.delta, self.total, self.counters.tolist()]
+
+    @classmethod
+    def from_state(cls, state):
+        sketch = cls(state[0], state[1])
+        sketch.total = state[2]
+        sketch.counters = array('q', state[3])
+        return sketch
+
+
+class HeavyHitters:
+    """
+    The top_k most frequent keys, with count-min estimates of their counts.
+    
+    Only top_k keys are remembered; a new key replaces the smallest one once
+    its estimate is larger.
+    """
+
+    def __init__(self, top_k=100, epsilon=0.001, delta=0.01):
+        self.top_k = top_k
+        self.sketch = CountMinSketch(epsilon, delta)
+        self.candidates = {}
+        self._floor = 0
+
+    def add(self, key, n=1):
+        estimate = self.sketch.add(key, n)
+        candidates = self.candidates
+        if key in candidates:
+            candidates[key] = estimate
+        elif len(candidates) < self.top_k:
+            candidates[key] = estimate
+            if len(candidates) == self.top_k:
+                self._floor = min(candidates.values())
+        elif estimate > self._floor:
+            # _floor is a lower bound of the smallest candidate, since
+            # estimates only grow, so most keys are turned away here
+            smallest = min(candidates, key=candidates.get)
+            if estimate > candidates[smallest]:
+                del candidates[smallest]
+                candidates[key] = estimate
+            self._floor = min(candidates.values())
+
+    def merge(self, other):
+        self.sketch.merge(other.sketch)
+        keys = set(self.candidates) | set(other.candidates)
+        estimates = sorted(((self.sketch.estimate(key), key) for key in keys),
+                           key=lambda pair: pair[0], reverse=True)[:self.top_k]
+        self.candidates = {key: estimate for estimate, key in estimates}
+        self._floor = min(self.candidates.values()) if len(self.candidates) == self.top_k else 0
+
+    def items(self):
+        """(key, estimate) pairs, most frequent first."""
+        estimates = {key: self.sketch.estimate(key) for key in self.candidates}
+        return sorted(estimates.items(), key=lambda pair: pair[1], reverse=True)
+
+    def to_state(self):
+        return [self.top_k, self.sketch.to_state(),
+                [[list(key) if isinstance(key, tuple) else key, estimate]
+                 for key, estimate in self.candidates.items()]]
+
+    @classmethod
+    def from_state(cls, state):
+        hitters = cls(state[0])
+        hitters.sketch = CountMinSketch.from_state(state[1])
+        hitters.candidates = {tuple(key) if isinstance(key, list) else key: estimate
+                              for key, estimate in state[2]}
+        if len(hitters.candidates) == hitters.top_k:
+            hitters._floor = min(hitters.candidates.values())
+        return hitters
+
+
+class HyperLogLog:
+    """
+    HyperLogLog distinct-count estimate with relative standard error about
+    `error`, using 2**precision one-byte registers.
+    """
+
+    def __init__(self, error=0.01):
+        self.precision = min(16, max(4, int(math.ceil(2 * math.log2(1.04 / error)))))
+        self.registers = bytearray(1 << self.precision)
+
+    def add(self, key):
+        value = _hash128(key)[0]
+        rest_bits = 64 - self.precision
+        register = value >> rest_bits
+        rest = value & ((1 << rest_bits) - 1)
+        rank = rest_bits - rest.bit_length() + 1
+        if rank > self.registers[register]:
+            self.registers[register] = rank
+
+    def estimate(self):
+        m = len(self.registers)
+        alpha = {16: 0.673, 32: 0.697, 64: 0.709}.get(m, 0.7213 / (1 + 1.079 / m))
+        raw = alpha * m * m / sum(2.0 ** -rank for rank in self.registers)
+        zeros = self.registers.count(0)
+        if raw <= 2.5 * m and zeros:
+            # linear counting is more accurate for small cardinalities
+            return int(round(m * math.log(m / zeros)))
+        return int(round(raw))
+
+    def merge(self, other):
+        if self.precision != other.precision:
+            raise ValueError("HyperLogLogs with different precision cannot be merged")
+        self.registers = bytearray(map(max, self.registers, other.registers))
+
+    def to_state(self):
+        return [self.precision, self.registers.hex()]
+
+    @classmethod
+    def from_state(cls, state):
+        hll = cls()
+        hll.precision = state[0]
+        hll.registers = bytearray.fromhex(state[1])
+        return hll
+
+
+# accumulators: each one holds the running state for one analysis and is
+# updated one penguin at a time, so several analyses can share a single pass
+
+class TotalCounter:
+    """Running count of penguin records (count_total_penguins)."""
+
+    def __init__(self):
+        self.total = 0
+
+    def update(self, penguin):
+        self.total += 1
+
+    def update_table(self, table):
+        self.total += len(table)
+
+    def merge(self, other):
+        self.total += other.total
+
+    def to_state(self):
+        return self.total
+
+    @classmethod
+    def from_state(cls, state):
+        acc = cls()
+        acc.total = state
+        return acc
+
+    def result(self):
+        return self.total
+
+
+class IslandGenderCounter:
+    """Running male/female counts per island (count_island_gender)."""
+
+    def __init__(self):
+        self.counts = {}
+
+    def update(self, penguin):
+        self._add(penguin.get('island', ''), penguin.get('sex',''))
+
+    def update_record(self, record):
+        self._add(record.island, record.sex)
+
+    def _add(self, island, sex):
+        if not island or not sex:
+            return
+        if island not in self.counts:
+            self.counts[island] = {'male':0, 'female':0}
+        if sex.lower() == 'male':
+            self.counts[island]['male']+=1
+        elif sex.lower() == 'female':
+            self.counts[island]['female']+=1
+
+    def update_table(self, table):
+        if 'island' not in table.codes or 'sex' not in table.codes:
+            return
+        islands = table.categories['island']
+        sexes = table.categories['sex']
+        for (island_code, sex_code), n in Counter(zip(table.codes['island'], table.codes['sex'])).items():
+            island = islands[island_code]
+            sex = sexes[sex_code]
+            if not island or not sex:
+                continue
+            if island not in self.counts:
+                self.counts[island] = {'male':0, 'female':0}
+            if sex.lower() == 'male':
+                self.counts[island]['male']+=n
+            elif sex.lower() == 'female':
+                self.counts[island]['female']+=n
+
+    def merge(self, other):
+        for island, gender_counts in other.counts.items():
+            if island not in self.counts:
+                self.counts[island] = {'male':0, 'female':0}
+            self.counts[island]['male'] += gender_counts['male']
+            self.counts[island]['female'] += gender_counts['female']
+
+    def to_state(self):
+        return self.counts
+
+    @classmethod
+    def from_state(cls, state):
+        acc = cls()
+        acc.counts = state
+        return acc
+
+    def result(self):
+        return self.counts
+
+
+class BodyWeightAccumulator:
+    """Body mass GroupStats by species, island and sex (calculate_body_weights)."""
+
+    def __init__(self):
+        self.weights = GroupedStats()
+
+    def update(self, penguin):
+        species = penguin.get('species','')
+        island = penguin.get('island','')
+        sex = penguin.get('sex','')
+        body_mass = penguin.get('body_mass_g')
+
+        if not species or not island or not sex or body_mass is None:
+            return
+
+        self.weights.add((species, island, sex), body_mass)
+
+    def update_record(self, record):
+        if record.species and record.island and record.sex and record.body_mass_g is not None:
+            self.weights.add((record.species, record.island, record.sex), record.body_mass_g)
+
+    def update_table(self, table):
+        keys = ('species', 'island', 'sex')
+        if any(key not in table.codes for key in keys) or 'body_mass_g' not in table.numeric:
+            return
+
+        # group by the codes first, in row order, then attach labels
+        by_code = GroupedStats()
+        group_keys = zip(*(table.codes[key] for key in keys))
+        for group, body_mass in zip(group_keys, table.numeric['body_mass_g']):
+            if body_mass == body_mass:
+                by_code.add(group, body_mass)
+
+        labels = [table.categories[key] for key in keys]
+        for (species_code, island_code, sex_code), stats in by_code.items():
+            self._merge_labelled(labels[0][species_code], labels[1][island_code],
+                                 labels[2][sex_code], stats)
+
+    def update_numpy(self, table):
+        keys = ('species', 'island', 'sex')
+        if any(key not in table.codes for key in keys) or 'body_mass_g' not in table.numeric:
+            return
+
+        # one integer per species/island/sex combination, then bincount
+        sizes = [len(table.categories[key]) for key in keys]
+        groups = np.zeros(len(table), dtype=np.int64)
+        for key, size in zip(keys, sizes):
+            groups = groups * size + np.asarray(table.codes[key], dtype=np.int64)
+        body_mass = np.asarray(table.numeric['body_mass_g'], dtype=np.float64)
+
+        labels = [table.categories[key] for key in keys]
+        for group, stats in _numpy_group_stats(groups, body_mass, sizes[0] * sizes[1] * sizes[2]):
+            rest, sex_code = divmod(group, sizes[2])
+            species_code, island_code = divmod(rest, sizes[1])
+            self._merge_labelled(labels[0][species_code], labels[1][island_code],
+                                 labels[2][sex_code], stats)
+
+    def _merge_labelled(self, species, island, sex, stats):
+        if species and island and sex:
+            self.weights.merge_group((species, island, sex), stats)
+
+    def merge(self, other):
+        self.weights.merge(other.weights)
+
+    def to_state(self):
+        return self.weights.to_state()
+
+    @classmethod
+    def from_state(cls, state):
+        acc = cls()
+        acc.weights = GroupedStats.from_state(state)
+        return acc
+
+    def result(self):
+        weights_stats = {}
+        for (species, island, gender), stats in self.weights.items():
+            genders = weights_stats.setdefault(species, {}).setdefault(island, {})
+            if stats.count:
+                genders[gender] = round(stats.mean(),2)
+            else:
+                genders[gender] = 'No data'
+        return weights_stats
+
+
+class SpeciesIslandCounter:
+    """Running species totals and per-island counts (count_species_by_island)."""
+
+    def __init__(self):
+        self.species_data = {}
+
+    def update(self, penguin):
+        self._add(penguin.get('species', '').strip(), penguin.get('island', '').strip())
+
+    def update_record(self, record):
+        self._add(record.species.strip(), record.island.strip())
+
+    def _add(self, species, island):
+        if not species or not island:
+            return
+
+        if species not in self.species_data:
+            self.species_data[species] = {'total': 0, 'islands': {}}
+
+        self.species_data[species]['total'] += 1
+        self.species_data[species]['islands'][island] = self.species_data[species]['islands'].get(island, 0) + 1
+
+    def update_table(self, table):
+        if 'species' not in table.codes or 'island' not in table.codes:
+            return
+        all_species = table.categories['species']
+        islands = table.categories['island']
+        for (species_code, island_code), n in Counter(zip(table.codes['species'], table.codes['island'])).items():
+            species = all_species[species_code].strip()
+            island = islands[island_code].strip()
+            if not species or not island:
+                continue
+            if species not in self.species_data:
+                self.species_data[species] = {'total': 0, 'islands': {}}
+            self.species_data[species]['total'] += n
+            self.species_data[species]['islands'][island] = self.species_data[species]['islands'].get(island, 0) + n
+
+    def merge(self, other):
+        for species, info in other.species_data.items():
+            if species not in self.species_data:
+                self.species_data[species] = {'total': 0, 'islands': {}}
+            self.species_data[species]['total'] += info['total']
+            for island, count in info['islands'].items():
+                self.species_data[species]['islands'][island] = self.species_data[species]['islands'].get(island, 0) + count
+
+    def to_state(self):
+        return self.species_data
+
+    @classmethod
+    def from_state(cls, state):
+        acc = cls()
+        acc.species_data = state
+        return acc
+
+    def result(self):
+        return self.species_data
+
+
+class BillLengthAccumulator:
+    """Bill length GroupStats per species (avg_bill_length)."""
+
+    def __init__(self):
+        self.bill_lengths = GroupedStats()
+
+    def update(self, p):
+        if 'species' not in p or 'bill_length_mm' not in p:
+            return
+
+        species = str(p['species']).strip()
+        bill_length = p['bill_length_mm']
+
+        if not species or bill_length is None:
+            return
+
+        self.bill_lengths.add(species, float(bill_length))
+
+    def update_record(self, record):
+        species = record.species.strip()
+        if species and record.bill_length_mm is not None:
+            self.bill_lengths.add(species, float(record.bill_length_mm))
+
+    def _stripped_groups(self, table):
+        # labels that only differ by whitespace share a group
+        groups = {}
+        group_of_code = [groups.setdefault(label.strip(), len(groups))
+                         for label in table.categories['species']]
+        return groups, group_of_code
+
+    def update_table(self, table):
+        if 'species' not in table.codes or 'bill_length_mm' not in table.numeric:
+            return
+
+        groups, group_of_code = self._stripped_groups(table)
+        group_stats = [GroupStats() for _ in groups]
+        for code, bill_length in zip(table.codes['species'], table.numeric['bill_length_mm']):
+            if bill_length == bill_length:
+                group_stats[group_of_code[code]].add(bill_length)
+
+        for species, group in groups.items():
+            if species and group_stats[group].count:
+                self.bill_lengths.merge_group(species, group_stats[group])
+
+    def update_numpy(self, table):
+        if 'species' not in table.codes or 'bill_length_mm' not in table.numeric:
+            return
+
+        groups, group_of_code = self._stripped_groups(table)
+        species_groups = np.array(group_of_code, dtype=np.int64)[np.asarray(table.codes['species'], dtype=np.int64)]
+        bill_lengths = np.asarray(table.numeric['bill_length_mm'], dtype=np.float64)
+
+        labels = list(groups)
+        for group, stats in _numpy_group_stats(species_groups, bill_lengths, len(groups)):
+            if labels[group]:
+                self.bill_lengths.merge_group(labels[group], stats)
+
+    def merge(self, other):
+        self.bill_lengths.merge(other.bill_lengths)
+
+    def to_state(self):
+        return self.bill_lengths.to_state()
+
+    @classmethod
+    def from_state(cls, state):
+        acc = cls()
+        acc.bill_lengths = GroupedStats.from_state(state)
+        return acc
+
+    def result(self):
+        my_dict = {}
+        for k, stats in self.bill_lengths.items():
+            if stats.count:
+                my_dict[k] = round(stats.mean(), 2)
+            else:
+                my_dict[k] = "No data"
+        return my_dict
+
+
+class DistributionAccumulator:
+    """
+    DistributionStats for each measurement per group (measurement_distributions).
+    
+    Rows with an empty or missing group value are skipped, as are missing
+    measurements.
+    """
+
+    def __init__(self, group_by=('species', 'island', 'sex'), measurements=MEASUREMENT_COLUMNS):
+        self.group_by = tuple(group_by)
+        self.measurements = tuple(measurements)
+        self.groups = {}
+
+    def _new_group(self):
+        return [DistributionStats(MEASUREMENT_HISTOGRAMS.get(name, (0.0, 1.0, 1)))
+                for name in self.measurements]
+
+    def update(self, penguin):
+        key = tuple(penguin.get(name) for name in self.group_by)
+        if any(value is None or value == '' for value in key):
+            return
+        group = self.groups.get(key)
+        if group is None:
+            group = self.groups[key] = self._new_group()
+        for stats, name in zip(group, self.measurements):
+            value = penguin.get(name)
+            if value is not None:
+                stats.add(value)
+
+    def update_table(self, table):
+        if any(name not in table.codes for name in self.group_by):
+            # numeric group columns such as year go through the rows
+            for penguin in table:
+                self.update(penguin)
+            return
+
+        # group by the codes first, in row order, then attach labels
+        missing = array('d', [math.nan]) * len(table)
+        columns = [table.numeric.get(name, missing) for name in self.measurements]
+        by_code = {}
+        for row, codes in enumerate(zip(*(table.codes[name] for name in self.group_by))):
+            group = by_code.get(codes)
+            if group is None:
+                group = by_code[codes] = self._new_group()
+            for stats, column in zip(group, columns):
+                value = column[row]
+                if value == value:
+                    stats.add(value)
+
+        labels = [table.categories[name] for name in self.group_by]
+        for codes, group in by_code.items():
+            key = tuple(names[code] for names, code in zip(labels, codes))
+            if all(key):
+                self._merge_group(key, group)
+
+    def _merge_group(self, key, group):
+        if key not in self.groups:
+            self.groups[key] = self._new_group()
+        for stats, other in zip(self.groups[key], group):
+            stats.merge(other)
+
+    def merge(self, other):
+        for key, group in other.groups.items():
+            self._merge_group(key, group)
+
+    def to_state(self):
+        return {
+            'group_by': list(self.group_by),
+            'measurements': list(self.measurements),
+            'groups': [[list(key), [stats.to_state() for stats in group]]
+                       for key, group in self.groups.items()],
+        }
+
+    @classmethod
+    def from_state(cls, state):
+        acc = cls(state['group_by'], state['measurements'])
+        for key, group in state['groups']:
+            acc.groups[tuple(key)] = [DistributionStats.from_state(stats) for stats in group]
+        return acc
+
+    def result(self):
+        return {key: {name: stats.summary() for name, stats in zip(self.measurements, group)}
+                for key, group in self.groups.items()}
+
+
+class ApproxIslandGenderCounter:
+    """
+    Approximate count_island_gender for many islands or sites: male and
+    female counts of the top_k islands from count-min sketches.
+    """
+
+    def __init__(self, top_k=100, epsilon=0.001, delta=0.01):
+        self.islands = HeavyHitters(top_k, epsilon, delta)
+        self.genders = CountMinSketch(epsilon, delta)
+
+    def _add(self, island, sex, n):
+        if not island or not sex:
+            return
+        sex = sex.lower()
+        if sex in ('male', 'female'):
+            self.islands.add(island, n)
+            self.genders.add((island, sex), n)
+
+    def update(self, penguin):
+        self._add(penguin.get('island', ''), penguin.get('sex', ''), 1)
+
+    def update_record(self, record):
+        self._add(record.island, record.sex, 1)
+
+    def update_table(self, table):
+        if 'island' not in table.codes or 'sex' not in table.codes:
+            return
+        islands = table.categories['island']
+        sexes = table.categories['sex']
+        for (island_code, sex_code), n in Counter(zip(table.codes['island'], table.codes['sex'])).items():
+            self._add(islands[island_code], sexes[sex_code], n)
+
+    def merge(self, other):
+        self.islands.merge(other.islands)
+        self.genders.merge(other.genders)
+
+    def to_state(self):
+        return [self.islands.to_state(), self.genders.to_state()]
+
+    @classmethod
+    def from_state(cls, state):
+        acc = cls()
+        acc.islands = HeavyHitters.from_state(state[0])
+        acc.genders = CountMinSketch.from_state(state[1])
+        return acc
+
+    def result(self):
+        return {island: {'male': self.genders.estimate((island, 'male')),
+                         'female': self.genders.estimate((island, 'female'))}
+                for island, _ in self.islands.items()}
+
+
+class ApproxSpeciesIslandCounter:
+    """
+    Approximate count_species_by_island: totals of the top_k species and
+    counts of the top_k species/island pairs from count-min sketches.
+    """
+
+    def __init__(self, top_k=100, epsilon=0.001, delta=0.01):
+        self.species = HeavyHitters(top_k, epsilon, delta)
+        self.pairs = HeavyHitters(top_k, epsilon, delta)
+
+    def _add(self, species, island, n):
+        species = species.strip()
+        island = island.strip()
+        if species and island:
+            self.species.add(species, n)
+            self.pairs.add((species, island), n)
+
+    def update(self, penguin):
+        self._add(penguin.get('species', ''), penguin.get('island', ''), 1)
+
+    def update_record(self, record):
+        self._add(record.species, record.island, 1)
+
+    def update_table(self, table):
+        if 'species' not in table.codes or 'island' not in table.codes:
+            return
+        all_species = table.categories['species']
+        islands = table.categories['island']
+        for (species_code, island_code), n in Counter(zip(table.codes['species'], table.codes['island'])).items():
+            self._add(all_species[species_code], islands[island_code], n)
+
+    def merge(self, other):
+        self.species.merge(other.species)
+        self.pairs.merge(other.pairs)
+
+    def to_state(self):
+        return [self.species.to_state(), self.pairs.to_state()]
+
+    @classmethod
+    def from_state(cls, state):
+        acc = cls()
+        acc.species = HeavyHitters.from_state(state[0])
+        acc.pairs = HeavyHitters.from_state(state[1])
+        return acc
+
+    def result(self):
+        species_data = {species: {'total': total, 'islands': {}} for species, total in self.species.items()}
+        for (species, island), count in self.pairs.items():
+            if species in species_data:
+                species_data[species]['islands'][island] = count
+        return species_data
+
+
+class DistinctCounter:
+    """HyperLogLog estimate of the number of distinct non-empty values in one column."""
+
+    def __init__(self, column, error=0.01):
+        self.column = column
+        self.hll = HyperLogLog(error)
+
+    def update(self, penguin):
+        value = penguin.get(self.column)
+        if value is not None and value != '':
+            self.hll.add(value)
+
+    def update_table(self, table):
+        if self.column in table.codes:
+            for label in set(table.categories[self.column]):
+                if label:
+                    self.hll.add(label)
+        else:
+            for penguin in table:
+                self.update(penguin)
+
+    def merge(self, other):
+        self.hll.merge(other.hll)
+
+    def to_state(self):
+        return [self.column, self.hll.to_state()]
+
+    @classmethod
+    def from_state(cls, state):
+        # bypass __init__, whose arguments differ in the column-bound subclasses
+        acc = cls.__new__(cls)
+        acc.column = state[0]
+        acc.hll = HyperLogLog.from_state(state[1])
+        return acc
+
+    def result(self):
+        return self.hll.estimate()
+
+
+class SpeciesDistinctCounter(DistinctCounter):
+    """DistinctCounter for the species column, usable as an accumulator class."""
+
+    def __init__(self, error=0.01):
+        super().__init__('species', error)
+
+
+class IslandDistinctCounter(DistinctCounter):
+    """DistinctCounter for the island column, usable as an accumulator class."""
+
+    def __init__(self, error=0.01):
+        super().__init__('island', error)
+
+
+# accumulators run by aggregate_penguins when none are given, keyed by the
+# name of the result they produce
+DEFAULT_ACCUMULATORS = {
+    'total_count': TotalCounter,
+    'species_data': SpeciesIslandCounter,
+    'gender_counts': IslandGenderCounter,
+    'weight_stats': BodyWeightAccumulator,
+    'bill_length_avgs': BillLengthAccumulator,
+}
+
+# opt-in approximate mode for data with many islands, sites or species:
+# the categorical breakdowns use fixed-size sketches, and the overview's
+# species and island counts come from HyperLogLog
+APPROXIMATE_ACCUMULATORS = {
+    'total_count': TotalCounter,
+    'species_data': ApproxSpeciesIslandCounter,
+    'gender_counts': ApproxIslandGenderCounter,
+    'weight_stats': BodyWeightAccumulator,
+    'bill_length_avgs': BillLengthAccumulator,
+    'species_count': SpeciesDistinctCounter,
+    'island_count': IslandDistinctCounter,
+}
+
+
+def approximate_accumulators(top_k=100, epsilon=0.001, delta=0.01, error=0.01):
+    """
+    APPROXIMATE_ACCUMULATORS with other sketch sizes.
+    
+    The sketch accumulators are bound to the settings with
+    functools.partial, so the result works anywhere an accumulators dict
+    does (aggregate_penguins, analyze_files, analyze_incremental). Saved
+    states carry their own settings, and analyze_incremental recomputes
+    when the settings change.
+    
+    Parameters:
+        top_k (int): Islands or species kept by the heavy-hitter sketches
+        epsilon (float): Count-min overcount bound, as a fraction of the total
+        delta (float): Chance of exceeding the count-min bound
+        error (float): HyperLogLog relative standard error
+    
+    Returns:
+        dict: Result names mapped to accumulator factories
+    """
+    sketch = {'top_k': top_k, 'epsilon': epsilon, 'delta': delta}
+    return dict(APPROXIMATE_ACCUMULATORS,
+                species_data=functools.partial(ApproxSpeciesIslandCounter, **sketch),
+                gender_counts=functools.partial(ApproxIslandGenderCounter, **sketch),
+                species_count=functools.partial(SpeciesDistinctCounter, error=error),
+                island_count=functools.partial(IslandDistinctCounter, error=error))
+
+
+def _factory_class(factory):
+    # the accumulator class behind a class or a functools.partial of one
+    return factory.func if isinstance(factory, functools.partial) else factory
+
+
+def _factory_name(factory):
+    # identifies the class and any bound settings in saved state
+    name = _factory_class(factory).__qualname__
+    if isinstance(factory, functools.partial):
+        name += repr((factory.args, sorted(factory.keywords.items())))
+    return name
+
+
+def _resolve_backend(backend, penguins):
+    """Pick 'python' or 'numpy' for a backend option of 'auto', 'python' or 'numpy'."""
+    if backend == 'auto':
+        # lists and streams would first have to be copied into columns, so
+        # only tables go to NumPy automatically
+        if np is not None and isinstance(penguins, PenguinTable):
+            return 'numpy'
+        return 'python'
+    if backend not in ('python', 'numpy'):
+        raise ValueError(f"Unknown backend: {backend}")
+    if backend == 'numpy' and np is None:
+        raise ImportError("The numpy backend needs NumPy to be installed")
+    return backend
+
+
+@profiled
+def aggregate_penguins(penguins, accumulators=None, backend='auto'):
+    """
+    Run several analyses over the penguin records in a single pass.
+    
+    Parameters:
+        penguins (iterable): Penguin dictionaries or a PenguinTable, read only once
+        accumulators (dict): Result names mapped to accumulator classes,
+            defaults to DEFAULT_ACCUMULATORS
+        backend (str): 'python', 'numpy', or 'auto' to use NumPy for tables
+            when it is installed
+    
+    Returns:
+        dict: Result names mapped to the same values the matching analysis
+            functions return
+    """
+    running = _run_accumulators(penguins, accumulators, backend)
+    return {name: acc.result() for name, acc in running.items()}
+
+
+def _run_accumulators(penguins, accumulators, backend):
+    """Feed the penguins to fresh accumulators and return them unfinished."""
+    if accumulators is None:
+        accumulators = DEFAULT_ACCUMULATORS
+    running = {name: factory() for name, factory in accumulators.items()}
+    pending = list(running.values())
+
+    backend = _resolve_backend(backend, penguins)
+    if backend == 'numpy' and not isinstance(penguins, PenguinTable):
+        penguins = PenguinTable.from_records(penguins)
+
+    # tables are grouped column by column; only accumulators without a
+    # table path still need the rows
+    if isinstance(penguins, PenguinTable):
+        pending = []
+        for acc in running.values():
+            if backend == 'numpy' and hasattr(acc, 'update_numpy'):
+                acc.update_numpy(penguins)
+            elif hasattr(acc, 'update_table'):
+                acc.update_table(penguins)
+            else:
+                pending.append(acc)
+        if not pending:
+            penguins = ()
+
+    _feed(penguins, pending)
+    return running
+
+
+def _feed(penguins, accumulators):
+    """Update the accumulators row by row, using update_record for PenguinRecords."""
+    updates = [acc.update for acc in accumulators]
+    record_updates = [getattr(acc, 'update_record', acc.update) for acc in accumulators]
+    for penguin in penguins:
+        if penguin.__class__ is PenguinRecord:
+            for update in record_updates:
+                update(penguin)
+        else:
+            for update in updates:
+                update(penguin)
+
+
+def _aggregate_file(job):
+    # runs in a worker process; returns partial accumulators, not rows
+    penguins_file, accumulators, backend = job
+    return _run_accumulators(iter_csv(penguins_file), accumulators, backend)
+
+
+def _merge_into(merged, partials):
+    for partial in partials:
+        for name, acc in partial.items():
+            merged[name].merge(acc)
+
+
+@profiled
+def analyze_files(penguin_files, accumulators=None, processes=None, backend='auto'):
+    """
+    Load and analyze many CSV files with the same header in parallel.
+    
+    Each worker process streams one file through the accumulators and sends
+    back only their partial counts and sums, which are merged in file order.
+    
+    Parameters:
+        penguin_files (list or str): CSV paths, or a glob pattern such as 'colonies/*.csv'
+        accumulators (dict): Result names mapped to accumulator classes,
+            defaults to DEFAULT_ACCUMULATORS
+        processes (int): Number of worker processes, defaults to the CPU count;
+            1 runs everything in this process
+        backend (str): Backend used inside each worker, see aggregate_penguins
+    
+    Returns:
+        dict: Result names mapped to the same values aggregate_penguins returns
+    """
+    if isinstance(penguin_files, str):
+        penguin_files = sorted(glob.glob(penguin_files))
+    jobs = [(penguins_file, accumulators, backend) for penguins_file in penguin_files]
+
+    merged = _run_accumulators((), accumulators, 'python')
+    if processes == 1 or len(jobs) <= 1:
+        _merge_into(merged, map(_aggregate_file, jobs))
+    else:
+        with ProcessPoolExecutor(max_workers=processes) as pool:
+            _merge_into(merged, pool.map(_aggregate_file, jobs))
+
+    return {name: acc.result() for name, acc in merged.items()}
+
+
+# parallel analysis of one large CSV file, split into byte ranges
+
+# smallest byte range given to one worker
+CHUNK_MIN_BYTES = 1 << 20
+
+
+def _chunk_ranges(data, start, n_chunks):
+    """Split data[start:] into about n_chunks ranges that end on newlines."""
+    size = len(data)
+    step = max(1, (size - start) // n_chunks)
+    bounds = [start]
+    for i in range(1, n_chunks):
+        newline = data.find(b'\n', start + i * step)
+        if newline == -1:
+            break
+        if bounds[-1] < newline + 1 < size:
+            bounds.append(newline + 1)
+    bounds.append(size)
+    return list(zip(bounds, bounds[1:]))
+
+
+def _aggregate_chunk(job):
+    # runs in a worker process; scans one byte range and returns partial
+    # accumulators, or None if the range needs the csv module
+    penguins_file, start, end, accumulators, backend = job
+    with open(penguins_file, 'rb') as file:
+        with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            try:
+                table = _scan_mmap(data, start, end)
+            except _ScanFallback:
+                return None
+    return _run_accumulators(table, accumulators, backend)
+
+
+@profiled
+def analyze_chunked(penguins_file, accumulators=None, processes=None, chunk_bytes=None, backend='auto'):
+    """
+    Analyze one large CSV file in parallel by splitting it into byte ranges.
+    
+    The ranges end on line boundaries. Each worker process scans its range
+    with the scan_csv parser (same NA, float and int rules as load_csv) and
+    sends back only partial accumulators, which are merged in file order.
+    Files the scanner cannot split, such as ones with quoted newlines or
+    compressed files, are analyzed in one pass through iter_csv instead.
+    
+    Parameters:
+        penguins_file (str): Path to the CSV file
+        accumulators (dict): Result names mapped to accumulator classes,
+            defaults to DEFAULT_ACCUMULATORS
+        processes (int): Number of worker processes, defaults to the CPU count
+        chunk_bytes (int): Bytes per range; by default about four ranges per
+            worker, and at least CHUNK_MIN_BYTES
+        backend (str): Backend used inside each worker, see aggregate_penguins
+    
+    Returns:
+        dict: Result names mapped to the same values aggregate_penguins returns
+    """
+    workers = processes or os.cpu_count() or 1
+    try:
+        file = open(penguins_file, 'rb')
+    except FileNotFoundError:
+        print(f"Error: The file {penguins_file} was not found.")
+        return aggregate_penguins((), accumulators)
+
+    with file:
+        size = os.fstat(file.fileno()).st_size
+        if size == 0:
+            return aggregate_penguins((), accumulators)
+        if _compression_kind(file.read(6)) is not None:
+            # byte ranges of a compressed stream cannot be decoded separately
+            return aggregate_penguins(iter_csv(penguins_file), accumulators, backend)
+        with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            body_start = len(data.readline())
+            if chunk_bytes is None:
+                chunk_bytes = max(CHUNK_MIN_BYTES, (size - body_start) // (workers * 4) + 1)
+            n_chunks = max(1, -(-(size - body_start) // chunk_bytes))
+            ranges = _chunk_ranges(data, body_start, n_chunks)
+
+    jobs = [(penguins_file, start, end, accumulators, backend) for start, end in ranges]
+    if workers == 1 or len(jobs) <= 1:
+        partials = list(map(_aggregate_chunk, jobs))
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            partials = list(pool.map(_aggregate_chunk, jobs))
+
+    if any(partial is None for partial in partials):
+        return aggregate_penguins(iter_csv(penguins_file), accumulators, backend)
+    merged = _run_accumulators((), accumulators, 'python')
+    _merge_into(merged, partials)
+    return {name: acc.result() for name, acc in merged.items()}
+
+
+# incremental analysis of append-only CSV files
+
+# bytes before the saved offset that are checked to detect a rewritten file
+STATE_CHECK_BYTES = 4096
+
+
+def _complete_lines(file, offset, progress):
     """
-    Load penguin data from a CSV file.
+    Yield decoded lines from offset that make up complete records, recording
+    the end of the last record. A record is complete once its lines end in
+    \n with the double quotes balanced, so a quoted field holding a newline
+    is never cut.
+    """
+    file.seek(offset)
+    pending = []
+    quotes = 0
+    for line in file:
+        if not line.endswith(b'\n'):
+            # a row still being written; pick it up next time
+            break
+        offset += len(line)
+        pending.append(line)
+        quotes += line.count(b'"')
+        if quotes % 2 == 0:
+            progress['offset'] = offset
+            for piece in pending:
+                yield piece.decode('utf-8')
+            pending = []
+
+
+def _check_bytes(file, offset):
+    start = max(0, offset - STATE_CHECK_BYTES)
+    file.seek(start)
+    return hashlib.sha1(file.read(offset - start)).hexdigest()
+
+
+def _read_state(state_file):
+    # a missing, truncated or corrupt sidecar file counts as no saved state
+    try:
+        with open(state_file, 'r') as f:
+            saved = json.load(f)
+    except (FileNotFoundError, ValueError):
+        return None
+    return saved if isinstance(saved, dict) else None
+
+
+@profiled
+def analyze_incremental(penguins_file, state_file=None, accumulators=None):
+    """
+    Analyze a CSV file that only grows by appended rows.
+    
+    The accumulator state and the byte offset of the last complete row are
+    saved in a JSON sidecar file. Later runs only parse the rows appended
+    since then. A last row without its final newline is included in the
+    results but not in the saved state, so it is read again next time; a
+    row that ends inside a quoted field is left out. If the file was
+    truncated or rewritten, or different accumulators (by name or class)
+    are asked for, everything is recomputed. Compressed files are always
+    analyzed in full.
     
     Parameters:
         penguins_file (str): Path to the CSV file
+        state_file (str): Path of the sidecar file, defaults to
+            penguins_file + '.state.json'
+        accumulators (dict): Result names mapped to accumulator classes (or
+            functools.partial of one, see approximate_accumulators), defaults
+            to DEFAULT_ACCUMULATORS; they need to_state/from_state
     
     Returns:
-        list: List of dictionaries, each representing a penguin record
+        dict: Result names mapped to the same values aggregate_penguins returns
     """
-    penguins = []
-    
+    if accumulators is None:
+        accumulators = DEFAULT_ACCUMULATORS
+    if state_file is None:
+        state_file = penguins_file + '.state.json'
+
     try:
-        with open(penguins_file, 'r') as file:
-            reader = csv.DictReader(file)
-            
-            for row in reader:
-                penguin = {}
-                
-                for key, value in row.items():
-                    # Skip the index column if it exists
-                    if key == '' or key is None:
-                        continue
-                        
-                    if key in ['bill_length_mm', 'bill_depth_mm', 'flipper_length_mm', 'body_mass_g']:
-                        if value and value.strip() and value.strip().upper() != 'NA':
-                            penguin[key] = float(value)
-                        else: 
-                            penguin[key] = None
-                    elif key == 'year':
-                        if value and value.strip() and value.strip().upper() != 'NA':
-                            penguin[key] = int(value)
-                        else: 
-                            penguin[key] = None
-                    else:
-                        if value and value.strip().upper() != 'NA':
-                            penguin[key] = value
-                        else:
-                            penguin[key] = ""
-                
-                penguins.append(penguin)
+        file = open(penguins_file, 'rb')
     except FileNotFoundError:
         print(f"Error: The file {penguins_file} was not found.")
-    
-    return penguins
+        return aggregate_penguins([], accumulators)
+
+    with file:
+        if _compression_kind(file.read(6)) is not None:
+            # offsets into a compressed stream cannot be resumed from
+            return aggregate_penguins(iter_csv(penguins_file), accumulators)
+        file.seek(0)
+        header_line = file.readline()
+        if not header_line.endswith(b'\n'):
+            # no complete header yet
+            return aggregate_penguins([], accumulators)
+        header = next(csv.reader([header_line.decode('utf-8')]))
+        size = os.fstat(file.fileno()).st_size
+
+        classes = {name: _factory_name(factory) for name, factory in accumulators.items()}
+        saved = _read_state(state_file)
+        if saved is not None:
+            if (saved.get('header') != header
+                    or not isinstance(saved.get('accumulators'), dict)
+                    or saved.get('classes') != classes
+                    or sorted(saved['accumulators']) != sorted(accumulators)
+                    or not isinstance(saved.get('offset'), int)
+                    or saved['offset'] > size
+                    or saved.get('check') != _check_bytes(file, saved['offset'])):
+                saved = None
+
+        if saved is None:
+            running = {name: factory() for name, factory in accumulators.items()}
+            offset = len(header_line)
+        else:
+            running = {name: _factory_class(factory).from_state(saved['accumulators'][name])
+                       for name, factory in accumulators.items()}
+            offset = saved['offset']
+
+        progress = {'offset': offset}
+        coerce = compile_schema(header)
+        updates = [acc.update for acc in running.values()]
+        for fields in csv.reader(_complete_lines(file, offset, progress)):
+            if not fields:
+                continue
+            penguin = coerce(fields)
+            for update in updates:
+                update(penguin)
+
+        # the state ends at the last complete record, so a tail without its
+        # final newline is parsed again on the next run
+        state = json.dumps({
+            'header': header,
+            'offset': progress['offset'],
+            'check': _check_bytes(file, progress['offset']),
+            'classes': classes,
+            'accumulators': {name: acc.to_state() for name, acc in running.items()},
+        })
+
+        # ... but still counted now, like a full pass would, unless a quoted
+        # field is left open
+        file.seek(progress['offset'])
+        tail = file.read()
+        if tail.count(b'"') % 2 == 0:
+            for fields in csv.reader(io.StringIO(tail.decode('utf-8'))):
+                if not fields:
+                    continue
+                penguin = coerce(fields)
+                for update in updates:
+                    update(penguin)
+
+    temp_file = state_file + '.tmp'
+    with open(temp_file, 'w') as f:
+        f.write(state)
+    os.replace(temp_file, state_file)
+
+    return {name: acc.result() for name, acc in running.items()}
+
+
+def _accumulate(accumulator, penguins, backend='python'):
+    backend = _resolve_backend(backend, penguins)
+    if backend == 'numpy':
+        if not isinstance(penguins, PenguinTable):
+            penguins = PenguinTable.from_records(penguins)
+        accumulator.update_numpy(penguins)
+        return accumulator.result()
+    if isinstance(penguins, PenguinTable):
+        accumulator.update_table(penguins)
+        return accumulator.result()
+    _feed(penguins, [accumulator])
+    return accumulator.result()
 
 
 # eve's part of analysis functions
 
-def count_island_gender(penguins):
+@profiled
+def count_island_gender(penguins, approximate=False):
     """
     Count male and female penguins on each island.
     
     Parameters:
-        penguins (list): List of penguin dictionaries
+        penguins (iterable): List or stream of penguin dictionaries, or a PenguinTable
+        approximate (bool or dict): Use fixed-memory sketches instead of exact
+            counts; a dict gives ApproxIslandGenderCounter options
+            (top_k, epsilon, delta)
     
     Returns:
         dict: Dictionary with island names as keys and gender counts as values
     """
-    counts = {}
-
-    for penguin in penguins:
-        island = penguin.get('island', '')
-        sex = penguin.get('sex','')
-        if not island or not sex:
-            continue
-        if island not in counts:
-            counts[island] = {'male':0, 'female':0}
-        if sex.lower() == 'male':
-            counts[island]['male']+=1
-        elif sex.lower() == 'female':
-            counts[island]['female']+=1
-    return counts
+    if approximate:
+        options = approximate if isinstance(approximate, dict) else {}
+        return _accumulate(ApproxIslandGenderCounter(**options), penguins)
+    return _accumulate(IslandGenderCounter(), penguins)
 
 
+@profiled
 def calculate_ratio(counts):
     """
     Calculate male to female ratio for each island.
@@ -119,202 +2971,766 @@ def calculate_ratio(counts):
     return ratios
 
 
-def calculate_body_weights(penguins):
+@profiled
+def calculate_body_weights(penguins, backend='auto'):
     """
     Calculate average body weights by species, island, and gender.
     
     Parameters:
-        penguins (list): List of penguin dictionaries
+        penguins (iterable): List or stream of penguin dictionaries, or a PenguinTable
+        backend (str): 'python', 'numpy', or 'auto' to use NumPy for tables
+            when it is installed
     
     Returns:
         dict: Nested dictionary with average weights
     """
-    weights_data = {}
-    
-    for penguin in penguins:
-        species = penguin.get('species','')
-        island = penguin.get('island','')
-        sex = penguin.get('sex','')
-        body_mass = penguin.get('body_mass_g')
-
-        if not species or not island or not sex or body_mass is None:
-            continue
-
-        if species not in weights_data:
-            weights_data[species]= {}
-        if island not in weights_data[species]:
-            weights_data[species][island] = {}
-        if sex not in weights_data[species][island]:
-            weights_data[species][island][sex]=[]
-
-        weights_data[species][island][sex].append(body_mass)
-
-    weights_stats = {}
-    
-    for species, islands in weights_data.items():
-        weights_stats[species] = {}
-        for island,genders in islands.items():
-            weights_stats[species][island] = {}
-            for gender, weights in genders.items():
-                if weights:
-                    avg_weight = sum(weights)/len(weights)
-                    weights_stats[species][island][gender]=round(avg_weight,2)
-                else:
-                    weights_stats[species][island][gender] = 'No data'
-    return weights_stats
+    return _accumulate(BodyWeightAccumulator(), penguins, backend)
 
 
 # alexia's part of analysis functions
 
+@profiled
 def count_total_penguins(penguins):
     
+    # streams from iter_csv have no len(), so count them as they go by
+    if not hasattr(penguins, '__len__'):
+        return _accumulate(TotalCounter(), penguins)
     return len(penguins)
 
 
-def count_species_by_island(penguins):
+@profiled
+def count_species_by_island(penguins, approximate=False):
+    # approximate=True (or a dict of top_k/epsilon/delta) uses fixed-memory sketches
+    if approximate:
+        options = approximate if isinstance(approximate, dict) else {}
+        return _accumulate(ApproxSpeciesIslandCounter(**options), penguins)
+    return _accumulate(SpeciesIslandCounter(), penguins)
+
+@profiled
+def avg_bill_length(penguins, backend='auto'):
+    """
+    calculates average bill lnegth
+    backend can be 'python', 'numpy', or 'auto' (numpy for tables if installed)
+    """
+    return _accumulate(BillLengthAccumulator(), penguins, backend)
+
+# distribution statistics for every measurement
+
+@profiled
+def measurement_distributions(penguins, group_by=('species', 'island', 'sex'),
+                              measurements=MEASUREMENT_COLUMNS):
+    """
+    Compute streaming statistics of the measurements for each group.
+    
+    One pass, with fixed memory per group: count, mean and standard
+    deviation (Welford), min and max, median and percentiles from a KLL
+    sketch (rank error around 1%), and a fixed-bin histogram. The
+    accumulator can also be passed to aggregate_penguins or analyze_files,
+    and partial results merge across files.
+    
+    Parameters:
+        penguins (iterable): Penguin dictionaries or a PenguinTable
+        group_by (tuple): Columns that form the group key
+        measurements (tuple): Numeric columns to summarize
+    
+    Returns:
+        dict: Group key tuples mapped to {measurement: statistics dict}
+    """
+    return _accumulate(DistributionAccumulator(group_by, measurements), penguins)
+
 
-    species_data = {}
+@profiled
+def count_distinct(penguins, column, error=0.01):
+    """
+    Estimate the number of distinct values in a column with HyperLogLog.
     
-    for penguin in penguins:
-        species = penguin.get('species', '').strip()
-        island = penguin.get('island', '').strip()
-        
-        if not species or not island:
-            continue
+    Parameters:
+        penguins (iterable): Penguin dictionaries or a PenguinTable
+        column (str): Column name, e.g. 'island'
+        error (float): Target relative standard error
+    
+    Returns:
+        int: Estimated number of distinct non-empty values
+    """
+    return _accumulate(DistinctCounter(column, error), penguins)
+
+
+# per-year partitions with cached per-year aggregates
+
+# the analyses broken down by year; ratios are derived from gender_counts
+YEAR_ACCUMULATORS = {
+    'total_count': TotalCounter,
+    'gender_counts': IslandGenderCounter,
+    'weight_stats': BodyWeightAccumulator,
+    'bill_length_avgs': BillLengthAccumulator,
+}
+
+
+class YearPartitions:
+    """
+    Penguin records split by year, with each year's aggregates cached.
+    
+    Each year is kept in its own PenguinTable (rows without a year under
+    None). Adding records only drops the cached results of the years they
+    belong to, so the other years are never rescanned.
+    """
+
+    def __init__(self, penguins=(), accumulators=None):
+        self.accumulators = YEAR_ACCUMULATORS if accumulators is None else accumulators
+        self.partitions = {}
+        self._results = {}
+        self.computed = 0
+        self.add(penguins)
+
+    @classmethod
+    def from_csv(cls, penguins_file, accumulators=None):
+        """Partition a (plain or compressed) CSV file by year in one pass."""
+        return cls(iter_csv(penguins_file), accumulators)
+
+    def add(self, penguins):
+        """
+        Append records to their year partitions.
         
-        if species not in species_data:
-            species_data[species] = {'total': 0, 'islands': {}}
+        Parameters:
+            penguins (iterable): Penguin dictionaries or records
         
-        species_data[species]['total'] += 1
-        species_data[species]['islands'][island] = species_data[species]['islands'].get(island, 0) + 1
+        Returns:
+            set: The years that received records
+        """
+        touched = set()
+        for penguin in penguins:
+            year = penguin.get('year')
+            partition = self.partitions.get(year)
+            if partition is None:
+                partition = self.partitions[year] = PenguinTable()
+            partition.append(penguin)
+            touched.add(year)
+        for year in touched:
+            self._results.pop(year, None)
+        return touched
+
+    def years(self):
+        """Known years in order, with None (no year) last."""
+        return sorted(self.partitions, key=lambda year: (year is None, year or 0))
+
+    def results(self, year):
+        """Aggregates (and ratios) of one year, computed only when that year changed."""
+        partition = self.partitions[year]
+        cached = self._results.get(year)
+        if cached is not None and cached[0] == partition.version:
+            return cached[1]
+        results = aggregate_penguins(partition, self.accumulators)
+        if 'gender_counts' in results:
+            results['ratios'] = calculate_ratio(results['gender_counts'])
+        self._results[year] = (partition.version, results)
+        self.computed += 1
+        return results
+
+    def by_year(self):
+        """Every year's aggregates, keyed by year."""
+        return {year: self.results(year) for year in self.years()}
+
+    def year_over_year(self):
+        """Changes between consecutive known years, see year_over_year."""
+        return year_over_year(self.by_year())
+
+
+def _nested_delta(old, new):
+    # numbers give new - old; dicts recurse over the keys in both; text
+    # values such as "No females" have no delta and are left out
+    if isinstance(old, dict) and isinstance(new, dict):
+        deltas = {}
+        for key in new:
+            if key in old:
+                delta = _nested_delta(old[key], new[key])
+                if delta is not None:
+                    deltas[key] = delta
+        return deltas
+    numbers = (int, float)
+    if isinstance(old, numbers) and isinstance(new, numbers) and not isinstance(old, bool):
+        return round(new - old, 2)
+    return None
+
+
+def analyze_by_year(penguins):
+    """
+    Run count_island_gender, calculate_ratio, calculate_body_weights and
+    avg_bill_length separately for each year.
+    
+    Parameters:
+        penguins (iterable): Penguin dictionaries, records, or a CSV path
     
-    return species_data
+    Returns:
+        dict: Year mapped to total_count, gender_counts, ratios, weight_stats
+            and bill_length_avgs (rows without a year under None, last)
+    """
+    if isinstance(penguins, str):
+        return YearPartitions.from_csv(penguins).by_year()
+    return YearPartitions(penguins).by_year()
+
 
-def avg_bill_length(penguins):
+def year_over_year(by_year):
     """
-    calculates average bill lnegth
+    Year-over-year changes of per-year results.
+    
+    Parameters:
+        by_year (dict): Output of analyze_by_year
+    
+    Returns:
+        dict: (previous year, year) mapped to the same nested layout holding
+            year - previous year for every numeric value found in both years
     """
-    my_dict = {}
+    years = [year for year in by_year if year is not None]
+    return {(previous, year): _nested_delta(by_year[previous], by_year[year])
+            for previous, year in zip(years, years[1:])}
 
-    for p in penguins:
-        if 'species' not in p or 'bill_length_mm' not in p:
-            continue
 
-        species = str(p['species']).strip()
-        bill_length = p['bill_length_mm']
+# in-process cache of analysis results
 
-        if not species or bill_length is None:
-            continue
+class QueryCache:
+    """
+    LRU cache of analysis results.
+    
+    Entries are keyed by the dataset object, its version (PenguinTable.version
+    and its length), the analysis function and its arguments. Appending to a
+    PenguinTable or a list changes the key, but lists edited in place must be
+    passed to invalidate(). Cached results are shared, so treat them as
+    read-only.
+    """
 
-        if species in my_dict:
-            my_dict[species].append(float(bill_length))
-        else:
-            my_dict[species] = [float(bill_length)]
+    def __init__(self, maxsize=128):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+
+    def get(self, penguins, analysis, *args, **kwargs):
+        """Return analysis(penguins, *args, **kwargs), computing it only on a miss."""
+        if not hasattr(penguins, '__len__'):
+            # a one-shot stream can't be analyzed twice, so there is nothing to reuse
+            return analysis(penguins, *args, **kwargs)
+        key = (id(penguins), getattr(penguins, 'version', None), len(penguins),
+               analysis, args, tuple(sorted(kwargs.items())))
+        try:
+            entry = self._entries.get(key)
+        except TypeError:
+            # unhashable arguments
+            return analysis(penguins, *args, **kwargs)
+
+        # the stored dataset guards against a new object reusing an old id()
+        if entry is not None and entry[0] is penguins:
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+        self.misses += 1
+        result = analysis(penguins, *args, **kwargs)
+        self._entries[key] = (penguins, result)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+        return result
+
+    def invalidate(self, penguins=None):
+        """Drop the entries for one dataset, or everything when none is given."""
+        if penguins is None:
+            self._entries.clear()
+            return
+        for key in [key for key, entry in self._entries.items() if entry[0] is penguins]:
+            del self._entries[key]
+
+    def __len__(self):
+        return len(self._entries)
 
-    for k in my_dict:
-        values = my_dict[k]
-        if values:
-            my_dict[k] = round(sum(values) / len(values), 2)
+
+ANALYSIS_CACHE = QueryCache()
+
+
+def cached_analysis(penguins, analysis, *args, **kwargs):
+    """
+    Run an analysis through the shared ANALYSIS_CACHE.
+    
+    Parameters:
+        penguins (list or PenguinTable): Loaded dataset
+        analysis (callable): Analysis function, e.g. calculate_body_weights
+        *args, **kwargs: Extra arguments for the analysis
+    
+    Returns:
+        The analysis result, reused from the cache when possible
+    """
+    return ANALYSIS_CACHE.get(penguins, analysis, *args, **kwargs)
+
+
+def invalidate_cache(penguins=None):
+    """Forget cached results for a dataset whose records changed (or for all datasets)."""
+    ANALYSIS_CACHE.invalidate(penguins)
+
+
+def island_ratios(penguins):
+    """Male to female ratio per island straight from the records (cacheable)."""
+    return calculate_ratio(count_island_gender(penguins))
+
+
+# generic group-by queries
+
+QUERY_AGGREGATES = ('count', 'sum', 'mean', 'min', 'max', 'std')
+
+
+def _matches(value, condition):
+    if callable(condition):
+        return condition(value)
+    if isinstance(condition, (set, frozenset, list, tuple)):
+        return value in condition
+    return value == condition
+
+
+def _table_query_rows(table, where):
+    """Row positions matching every condition, starting from the smallest index lookup."""
+    best = None
+    remaining = []
+    for column, condition in where.items():
+        if callable(condition) or (column not in table.codes and column not in table.numeric):
+            remaining.append((column, condition))
+            continue
+        values = condition if isinstance(condition, (set, frozenset, list, tuple)) else [condition]
+        if any(value is None for value in values):
+            # missing values are not in the index
+            remaining.append((column, condition))
+            continue
+        index = table.index(column)
+        postings = [index[value] for value in values if value in index]
+        size = sum(len(rows) for rows in postings)
+        if best is None or size < best[0]:
+            if best is not None:
+                remaining.append(best[1])
+            best = (size, (column, condition), postings)
         else:
-            my_dict[k] = "No data"
+            remaining.append((column, condition))
+
+    if best is None:
+        rows = range(len(table))
+    elif len(best[2]) == 1:
+        rows = best[2][0]
+    else:
+        rows = sorted(row for rows in best[2] for row in rows)
+
+    for column, condition in remaining:
+        rows = [row for row in rows if _matches(table.value(column, row), condition)]
+    return rows
+
+
+@profiled
+def query(penguins, group_by=(), where=None, aggregates=(('count', None),)):
+    """
+    Filter, group and aggregate penguin records.
+    
+    For a PenguinTable the filters use the per-column indexes, so only the
+    matching rows are read. Lists and streams of dictionaries are scanned.
+    
+    Parameters:
+        penguins (iterable): Penguin dictionaries or a PenguinTable
+        group_by (tuple): Column names to group on, e.g. ('species', 'sex')
+        where (dict): Column names mapped to a value, a set/list of allowed
+            values, or a function returning True for rows to keep,
+            e.g. {'year': 2008, 'island': {'Biscoe', 'Dream'}}
+        aggregates (tuple): (function, column) pairs; function is one of
+            count, sum, mean, min, max, std, and ('count', None) counts rows;
+            text columns can only be counted
+    
+    Returns:
+        dict: Tuples of group values mapped to {'<function>_<column>': value}
+            ('count' for the row count); means and standard deviations are
+            not rounded
+    """
+    where = where or {}
+    group_by = tuple(group_by)
+    for function, column in aggregates:
+        if function not in QUERY_AGGREGATES:
+            raise ValueError(f"Unknown aggregate: {function}")
+        if column is None and function != 'count':
+            raise ValueError(f"Aggregate {function} needs a column")
+    stat_columns = {column for function, column in aggregates if column is not None}
+    # columns aggregated with anything but count must hold numbers
+    numeric_only = {column for function, column in aggregates if column is not None and function != 'count'}
+    needed = group_by + tuple(stat_columns)
+
+    if isinstance(penguins, PenguinTable):
+        for column in needed + tuple(where):
+            if column not in penguins.codes and column not in penguins.numeric:
+                raise ValueError(f"Unknown column: {column}")
+        for column in numeric_only:
+            if column in penguins.codes:
+                raise ValueError(f"Column {column} is not numeric; only count applies to it")
+        records = ({name: penguins.value(name, row) for name in needed}
+                   for row in _table_query_rows(penguins, where))
+    else:
+        records = (penguin for penguin in penguins
+                   if all(_matches(penguin.get(column), condition)
+                          for column, condition in where.items()))
+
+    groups = {}
+    for penguin in records:
+        key = tuple(penguin.get(name) for name in group_by)
+        entry = groups.get(key)
+        if entry is None:
+            entry = groups[key] = [0, {column: GroupStats() for column in stat_columns}]
+        entry[0] += 1
+        for column, stats in entry[1].items():
+            value = penguin.get(column)
+            if value is None or value == "":
+                continue
+            if isinstance(value, str):
+                # text columns can only be counted
+                if column in numeric_only:
+                    raise ValueError(f"Column {column} is not numeric; only count applies to it")
+                stats.count += 1
+            else:
+                stats.add(value)
+
+    results = {}
+    for key, (row_count, column_stats) in groups.items():
+        summary = {}
+        for function, column in aggregates:
+            if column is None:
+                summary['count'] = row_count
+                continue
+            stats = column_stats[column]
+            if function == 'count':
+                value = stats.count
+            elif function == 'sum':
+                value = stats.total
+            elif function == 'mean':
+                value = stats.mean()
+            elif function == 'min':
+                value = stats.minimum
+            elif function == 'max':
+                value = stats.maximum
+            else:
+                value = stats.std()
+            summary[f'{function}_{column}'] = value
+        results[key] = summary
+    return results
 
-    return my_dict
 
 # output functions
+#
+# each report is assembled from section renderers that return text, so a
+# report is written with a single file.write and sections shared between
+# reports (like the body weight table) are only rendered once
+
+def _render_title(title, width):
+    return '='*width+'\n' + title+'\n' + '='*width+'\n\n'
+
+
+def _render_heading(title, width, rule_width):
+    return '\n' + '='*width+'\n' + title+'\n' + '-'*rule_width+'\n'
+
+
+def render_overview(total_count, species_data, gender_stats, species_count=None, island_count=None):
+    """Render the dataset overview section; counts given explicitly (e.g. estimates) win."""
+    if species_count is None:
+        species_count = len(species_data)
+    if island_count is None:
+        island_count = len(gender_stats)
+    return ('DATASET OVERVIEW\n' + '-'*40+'\n'
+            f'Total number of penguins: {total_count}\n'
+            f'Number of species: {species_count}\n'
+            f'Number of islands: {island_count}\n'
+            '\n')
+
+
+def render_species_distribution(species_data):
+    """Render each species' total and island percentages."""
+    parts = []
+    for i, (species, info) in enumerate(sorted(species_data.items()), 1):
+        parts.append(f'\nSpecies {i}: {species}\n')
+        parts.append(f'  Total count: {info["total"]}\n')
+        parts.append(f'  Island distribution:\n')
+        for island, count in sorted(info['islands'].items()):
+            percentage = (count / info['total']) * 100
+            parts.append(f'    - {island}: {count} ({percentage:.1f}%)\n')
+    return ''.join(parts)
+
+
+def render_gender_distribution(gender_stats, ratios, detailed=False):
+    """
+    Render male and female counts and the ratio for each island.
+    
+    Parameters:
+        gender_stats (dict): Gender counts by island
+        ratios (dict): Male:female ratios by island
+        detailed (bool): Add a blank line and the island total (comprehensive layout)
+    
+    Returns:
+        str: Rendered section
+    """
+    parts = []
+    for island, counts in sorted(gender_stats.items()):
+        males = counts.get('male',0)
+        females = counts.get('female', 0)
+        if detailed:
+            parts.append(f"\nIsland: {island}\n")
+        else:
+            parts.append(f"Island: {island}\n")
+        parts.append(f"  Males: {males}\n")
+        parts.append(f"  Females: {females}\n")
+        if detailed:
+            parts.append(f"  Total: {males + females}\n")
+        parts.append(f"  Male:Female Ratio: {ratios.get(island, 'N/A')}\n")
+    return ''.join(parts)
+
+
+def render_body_weights(weight_stats):
+    """Render the average body weight of each species, island and gender."""
+    parts = []
+    for species, islands in sorted(weight_stats.items()):
+        parts.append(f"\n{species}:\n")
+        for island, genders in sorted(islands.items()):
+            parts.append(f"  {island}:\n")
+            for gender in ['male', 'female']:
+                if gender in genders:
+                    weight = genders[gender]
+                    if weight != 'No data':
+                        parts.append(f"    {gender.capitalize()}: {weight} g\n")
+                    else:
+                        parts.append(f"    {gender.capitalize()}: {weight}\n")
+    return ''.join(parts)
+
+
+def _section(sections, key, renderer, *args):
+    # render a section once per set of aggregates and reuse the text
+    if sections is None:
+        return renderer(*args)
+    if key not in sections:
+        sections[key] = renderer(*args)
+    return sections[key]
+
+
+def render_results(gender_stats, weight_stats, ratios, sections=None):
+    """Render the text written by write_to_file."""
+    return ''.join([
+        _render_title('Penguin Analysis Results', 60),
+        'Gender distribution by island:\n', '-'*30+'\n',
+        _section(sections, 'gender', render_gender_distribution, gender_stats, ratios),
+        _render_heading("AVERAGE BODY WEIGHT (g) BY SPECIES, ISLAND, AND GENDER", 60, 30),
+        _section(sections, 'body_weights', render_body_weights, weight_stats),
+        "\n" + "=" * 60 + "\n",
+        "Analysis complete.\n",
+    ])
+
+
+def render_validation(validation):
+    """Render the data quality section from a validate_csv report."""
+    parts = [f"Rows read: {validation['rows']}\n",
+             f"Rows kept: {validation['valid_rows']}\n",
+             f"Rows quarantined: {validation['quarantined']}\n"]
+    if validation['quarantine_file']:
+        parts.append(f"Quarantined rows written to: {validation['quarantine_file']}\n")
+
+    parts.append("\nErrors by column:\n")
+    for column, counts in sorted(validation['errors'].items()):
+        parts.append(f"  {column}: {counts['invalid']} invalid, {counts['out_of_range']} out of range\n")
+    if not validation['errors']:
+        parts.append("  None\n")
 
+    if validation['outliers'] is None:
+        parts.append("\nOutliers by species: not checked\n")
+        return ''.join(parts)
+    parts.append(f"\nOutliers by species (|z| > {validation['z_threshold']:g} or more than "
+                 f"{validation['iqr_factor']:g} IQR outside the quartiles):\n")
+    counts = Counter((outlier['species'], outlier['column']) for outlier in validation['outliers'])
+    for (species, column), count in sorted(counts.items()):
+        parts.append(f"  {species}, {column}: {count}\n")
+    if not counts:
+        parts.append("  None\n")
+    return ''.join(parts)
+
+
+def render_comprehensive_results(total_count, species_data, gender_stats, ratios,
+                                 weight_stats, sections=None, species_count=None, island_count=None,
+                                 validation=None):
+    """Render the text written by write_comprehensive_results, with a data quality section if validation is given."""
+    return ''.join([
+        _render_title('COMPREHENSIVE PENGUIN DATA ANALYSIS', 70),
+        # Section 1: Overall Summary
+        _section(sections, 'overview', render_overview, total_count, species_data, gender_stats,
+                 species_count, island_count),
+        # Section 2: Species Distribution
+        '='*70+'\n', 'SPECIES DISTRIBUTION BY ISLAND\n', '-'*40+'\n',
+        _section(sections, 'species', render_species_distribution, species_data),
+        # Section 3: Gender Distribution
+        _render_heading('GENDER DISTRIBUTION BY ISLAND', 70, 40),
+        _section(sections, 'gender_detailed', render_gender_distribution, gender_stats, ratios, True),
+        # Section 4: Body Weight Analysis
+        _render_heading("AVERAGE BODY WEIGHT (g) BY SPECIES, ISLAND, AND GENDER", 70, 40),
+        _section(sections, 'body_weights', render_body_weights, weight_stats),
+        # Section 5: Data Quality (only for validated loads)
+        _render_heading("DATA QUALITY SUMMARY", 70, 40) + render_validation(validation) if validation else '',
+        "\n" + "=" * 70 + "\n",
+        "Analysis complete. Data processed successfully!\n",
+        "=" * 70 + "\n",
+    ])
+
+
+@profiled
 def write_to_file(gender_stats, weight_stats, ratios, filename='penguin_analysis_results.txt'):
 
     with open(filename,'w') as file:
-        file.write('='*60+'\n')
-        file.write('Penguin Analysis Results\n')
-        file.write('='*60+'\n\n')
-
-        file.write('Gender distribution by island:\n')
-        file.write('-'*30+'\n')
-        for island, counts in sorted(gender_stats.items()):
-            file.write(f"Island: {island}\n")
-            file.write(f"  Males: {counts.get('male',0)}\n")
-            file.write(f"  Females: {counts.get('female', 0)}\n")
-            file.write(f"  Male:Female Ratio: {ratios.get(island, 'N/A')}\n")
-
-        file.write("\n" + "=" * 60 + "\n")
-        file.write("AVERAGE BODY WEIGHT (g) BY SPECIES, ISLAND, AND GENDER\n")
-        file.write("-" * 30 + "\n")
-        
-        for species, islands in sorted(weight_stats.items()):
-            file.write(f"\n{species}:\n")
-            for island, genders in sorted(islands.items()):
-                file.write(f"  {island}:\n")
-                for gender in ['male', 'female']:
-                    if gender in genders:
-                        weight = genders[gender]
-                        if weight != 'No data':
-                            file.write(f"    {gender.capitalize()}: {weight} g\n")
-                        else:
-                            file.write(f"    {gender.capitalize()}: {weight}\n")
-        
-        file.write("\n" + "=" * 60 + "\n")
-        file.write("Analysis complete.\n")
+        file.write(render_results(gender_stats, weight_stats, ratios))
 
 
+@profiled
 def write_comprehensive_results(total_count, species_data, gender_stats, ratios, 
                                  weight_stats, filename='comprehensive_penguin_analysis.txt'):
 
     with open(filename, 'w') as file:
-        file.write('='*70+'\n')
-        file.write('COMPREHENSIVE PENGUIN DATA ANALYSIS\n')
-        file.write('='*70+'\n\n')
-        
-        # Section 1: Overall Summary
-        file.write('DATASET OVERVIEW\n')
-        file.write('-'*40+'\n')
-        file.write(f'Total number of penguins: {total_count}\n')
-        file.write(f'Number of species: {len(species_data)}\n')
-        file.write(f'Number of islands: {len(gender_stats)}\n')
-        file.write('\n')
-        
-        # Section 2: Species Distribution
-        file.write('='*70+'\n')
-        file.write('SPECIES DISTRIBUTION BY ISLAND\n')
-        file.write('-'*40+'\n')
-        
-        for i, (species, info) in enumerate(sorted(species_data.items()), 1):
-            file.write(f'\nSpecies {i}: {species}\n')
-            file.write(f'  Total count: {info["total"]}\n')
-            file.write(f'  Island distribution:\n')
-            for island, count in sorted(info['islands'].items()):
-                percentage = (count / info['total']) * 100
-                file.write(f'    - {island}: {count} ({percentage:.1f}%)\n')
-        
-        # Section 3: Gender Distribution
-        file.write('\n' + '='*70+'\n')
-        file.write('GENDER DISTRIBUTION BY ISLAND\n')
-        file.write('-'*40+'\n')
-        for island, counts in sorted(gender_stats.items()):
-            total_island = counts.get('male', 0) + counts.get('female', 0)
-            file.write(f"\nIsland: {island}\n")
-            file.write(f"  Males: {counts.get('male',0)}\n")
-            file.write(f"  Females: {counts.get('female', 0)}\n")
-            file.write(f"  Total: {total_island}\n")
-            file.write(f"  Male:Female Ratio: {ratios.get(island, 'N/A')}\n")
-        
-        # Section 4: Body Weight Analysis
-        file.write("\n" + "=" * 70 + "\n")
-        file.write("AVERAGE BODY WEIGHT (g) BY SPECIES, ISLAND, AND GENDER\n")
-        file.write("-" * 40 + "\n")
-        
-        for species, islands in sorted(weight_stats.items()):
-            file.write(f"\n{species}:\n")
-            for island, genders in sorted(islands.items()):
-                file.write(f"  {island}:\n")
-                for gender in ['male', 'female']:
-                    if gender in genders:
-                        weight = genders[gender]
-                        if weight != 'No data':
-                            file.write(f"    {gender.capitalize()}: {weight} g\n")
-                        else:
-                            file.write(f"    {gender.capitalize()}: {weight}\n")
-        
-        file.write("\n" + "=" * 70 + "\n")
-        file.write("Analysis complete. Data processed successfully!\n")
-        file.write("=" * 70 + "\n")
+        file.write(render_comprehensive_results(total_count, species_data, gender_stats,
+                                                ratios, weight_stats))
+
+
+@profiled
+def write_reports(results, reports, ratios=None):
+    """
+    Write several reports from one set of aggregates.
+    
+    Sections that appear in more than one report are rendered once.
+    
+    Parameters:
+        results (dict): Output of aggregate_penguins (total_count, species_data,
+            gender_counts, weight_stats, and optionally the species_count and
+            island_count estimates of APPROXIMATE_ACCUMULATORS and a
+            validate_csv report under 'validation')
+        reports (dict): Output filenames mapped to 'results' (the write_to_file
+            layout) or 'comprehensive'
+        ratios (dict): Male:female ratios, computed from gender_counts if not given
+    """
+    if ratios is None:
+        ratios = calculate_ratio(results['gender_counts'])
+    sections = {}
+    for filename, layout in reports.items():
+        if layout == 'results':
+            text = render_results(results['gender_counts'], results['weight_stats'],
+                                  ratios, sections)
+        elif layout == 'comprehensive':
+            text = render_comprehensive_results(results['total_count'], results['species_data'],
+                                                results['gender_counts'], ratios,
+                                                results['weight_stats'], sections,
+                                                results.get('species_count'), results.get('island_count'),
+                                                results.get('validation'))
+        else:
+            raise ValueError(f"Unknown report layout: {layout}")
+        with open(filename, 'w') as file:
+            file.write(text)
+
+
+# machine-readable exports
+#
+# results are flattened into rows with the same columns for every analysis,
+# then handed to a writer registered for the requested format
+
+RESULT_COLUMNS = ('analysis', 'species', 'island', 'sex', 'metric', 'value', 'text')
+
+RESULT_WRITERS = {}
+
+
+def flatten_results(results, ratios=None):
+    """
+    Turn nested analysis results into flat rows.
+    
+    Numeric results go in 'value'; text results such as "No females" go in
+    'text' with value None.
+    
+    Parameters:
+        results (dict): Output of aggregate_penguins (any subset of its keys)
+        ratios (dict): Male:female ratios, computed from gender_counts if not given
+    
+    Yields:
+        dict: One row with the RESULT_COLUMNS keys
+    """
+    def row(analysis, metric, value, species='', island='', sex=''):
+        if isinstance(value, (int, float)):
+            return {'analysis': analysis, 'species': species, 'island': island, 'sex': sex,
+                    'metric': metric, 'value': value, 'text': ''}
+        return {'analysis': analysis, 'species': species, 'island': island, 'sex': sex,
+                'metric': metric, 'value': None, 'text': str(value)}
+
+    if 'total_count' in results:
+        yield row('total', 'count', results['total_count'])
+
+    for species, info in results.get('species_data', {}).items():
+        yield row('species_by_island', 'total', info['total'], species=species)
+        for island, count in info['islands'].items():
+            yield row('species_by_island', 'count', count, species=species, island=island)
+
+    gender_counts = results.get('gender_counts')
+    if gender_counts is not None:
+        for island, counts in gender_counts.items():
+            for sex in ['male', 'female']:
+                yield row('island_gender', 'count', counts.get(sex, 0), island=island, sex=sex)
+        if ratios is None:
+            ratios = calculate_ratio(gender_counts)
+    for island, ratio in (ratios or {}).items():
+        yield row('gender_ratio', 'male_female_ratio', ratio, island=island)
+
+    for species, islands in results.get('weight_stats', {}).items():
+        for island, genders in islands.items():
+            for sex, weight in genders.items():
+                yield row('body_weight', 'mean_g', weight, species=species, island=island, sex=sex)
+
+    for species, bill_length in results.get('bill_length_avgs', {}).items():
+        yield row('bill_length', 'mean_mm', bill_length, species=species)
+
+
+def result_writer(fmt):
+    """Register a function writer(rows, filename) for export_results."""
+    def register(writer):
+        RESULT_WRITERS[fmt] = writer
+        return writer
+    return register
+
+
+@result_writer('jsonl')
+def write_results_jsonl(rows, filename):
+    """Write one compact JSON object per line."""
+    with open(filename, 'w') as file:
+        file.writelines(json.dumps(row, separators=(',', ':')) + '\n' for row in rows)
+
+
+@result_writer('csv')
+def write_results_csv(rows, filename):
+    """Write a flat CSV with a header row; missing values are left empty."""
+    with open(filename, 'w', newline='') as file:
+        writer = csv.DictWriter(file, fieldnames=RESULT_COLUMNS)
+        writer.writeheader()
+        writer.writerows(rows)
+
+
+@result_writer('columnar')
+def write_results_columnar(rows, filename):
+    """
+    Write a binary columnar file in the snapshot format.
+    
+    open_snapshot(filename) maps it back without parsing: 'value' is a float64
+    column (NaN where missing) and the text columns are category codes.
+    """
+    table = PenguinTable.from_records(rows, numeric_columns=('value',))
+    for name in RESULT_COLUMNS:
+        if name not in table.numeric and name not in table.codes:
+            table._add_column(name)
+    save_snapshot(table, filename)
+
+
+@profiled
+def export_results(results, filename, fmt='jsonl', ratios=None):
+    """
+    Write analysis results in a machine-readable format.
+    
+    Parameters:
+        results (dict): Output of aggregate_penguins (any subset of its keys)
+        filename (str): Output path
+        fmt (str): A format registered in RESULT_WRITERS ('jsonl', 'csv', 'columnar')
+        ratios (dict): Male:female ratios, computed from gender_counts if not given
+    """
+    if fmt not in RESULT_WRITERS:
+        raise ValueError(f"Unknown output format: {fmt}")
+    RESULT_WRITERS[fmt](flatten_results(results, ratios), filename)
@@ -0,0 +1,237 @@
+# Project 1: Penguin Data Analysis - Analysis Service
+#
+# Long-running asyncio service that loads the penguin data once, keeps the
+# aggregates in memory and answers HTTP GET requests with JSON. The CSV is
+# watched and reloaded when it changes. No dependencies outside the
+# standard library.
+#
+#   python serve_penguins.py penguins.csv --port 8080
+#   curl 'http://127.0.0.1:8080/body_weights?species=Gentoo&island=Biscoe'
+#
+#   python serve_penguins.py penguins.csv --unix /tmp/penguins.sock
+#   curl --unix-socket /tmp/penguins.sock 'http://localhost/ratios'
+
+import argparse
+import asyncio
+import json
+import os
+from urllib.parse import urlsplit, parse_qs
+
+from main import (load_table, aggregate_penguins, calculate_ratio, query,
+                  MEASUREMENT_COLUMNS, INTEGER_COLUMNS, QUERY_AGGREGATES)
+
+
+STATUS_TEXT = {200: 'OK', 400: 'Bad Request', 404: 'Not Found', 405: 'Method Not Allowed',
+               500: 'Internal Server Error'}
+
+# paths whose answers are computed per request rather than looked up
+THREADED_PATHS = {'/query'}
+
+
+def _filter_keys(data, wanted):
+    """Keep only the wanted key of a dict, or all keys when wanted is None."""
+    if wanted is None:
+        return data
+    return {key: value for key, value in data.items() if key == wanted}
+
+
+def _parse_value(column, text):
+    if column in INTEGER_COLUMNS:
+        return int(text)
+    if column in MEASUREMENT_COLUMNS:
+        return float(text)
+    return text
+
+
+class PenguinService:
+    """
+    Holds the loaded table and its aggregates and answers requests.
+
+    The loaded data is swapped in as one state dict, so requests running
+    during a reload see either the old or the new data, never a mix.
+    """
+
+    def __init__(self, penguins_file, poll_interval=2.0):
+        self.penguins_file = penguins_file
+        self.poll_interval = poll_interval
+        self.state = None
+        self.loads = 0
+        self._fingerprint = None
+
+    def _current_fingerprint(self):
+        try:
+            info = os.stat(self.penguins_file)
+        except FileNotFoundError:
+            return None
+        return (info.st_size, info.st_mtime_ns)
+
+    def load(self):
+        """Load the CSV and compute the aggregates (blocking)."""
+        fingerprint = self._current_fingerprint()
+        table = load_table(self.penguins_file, index=True)
+        results = aggregate_penguins(table)
+        self.state = {
+            'table': table,
+            'results': results,
+            'ratios': calculate_ratio(results['gender_counts']),
+        }
+        self._fingerprint = fingerprint
+        self.loads += 1
+
+    async def reload_if_changed(self):
+        """Reload in a worker thread if the CSV's size or mtime changed."""
+        fingerprint = self._current_fingerprint()
+        if fingerprint is None or fingerprint == self._fingerprint:
+            return False
+        await asyncio.to_thread(self.load)
+        return True
+
+    async def watch(self):
+        """Poll the CSV forever, reloading it when it changes."""
+        while True:
+            await asyncio.sleep(self.poll_interval)
+            try:
+                await self.reload_if_changed()
+            except Exception as error:
+                # keep serving the last good data
+                print(f"Error: Could not reload {self.penguins_file}: {error}")
+
+    def route(self, path, params):
+        """
+        Answer one request.
+
+        Parameters:
+            path (str): Request path, e.g. '/body_weights'
+            params (dict): Query string values (single values, as strings)
+
+        Returns:
+            tuple: (HTTP status, JSON-serializable payload)
+        """
+        state = self.state
+        results = state['results']
+
+        if path == '/health':
+            return 200, {'status': 'ok', 'rows': results['total_count'], 'loads': self.loads}
+        if path == '/summary':
+            return 200, dict(results, ratios=state['ratios'])
+        if path == '/body_weights':
+            weights = {}
+            for species, islands in _filter_keys(results['weight_stats'], params.get('species')).items():
+                islands = _filter_keys(islands, params.get('island'))
+                islands = {island: _filter_keys(genders, params.get('sex')) for island, genders in islands.items()}
+                weights[species] = islands
+            return 200, weights
+        if path == '/ratios':
+            return 200, _filter_keys(state['ratios'], params.get('island'))
+        if path == '/gender':
+            return 200, _filter_keys(results['gender_counts'], params.get('island'))
+        if path == '/species':
+            return 200, _filter_keys(results['species_data'], params.get('species'))
+        if path == '/bill_length':
+            return 200, _filter_keys(results['bill_length_avgs'], params.get('species'))
+        if path == '/query':
+            return self._query(state['table'], params)
+        return 404, {'error': f"Unknown path: {path}"}
+
+    def _query(self, table, params):
+        # /query?group_by=species,sex&where.year=2008&where.island=Biscoe,Dream&agg=mean:body_mass_g,count
+        group_by = [name for name in params.get('group_by', '').split(',') if name]
+        where = {}
+        aggregates = []
+        try:
+            for key, text in params.items():
+                if key.startswith('where.'):
+                    column = key[len('where.'):]
+                    values = [_parse_value(column, value) for value in text.split(',')]
+                    where[column] = values[0] if len(values) == 1 else set(values)
+            for spec in params.get('agg', 'count').split(','):
+                function, _, column = spec.partition(':')
+                if function not in QUERY_AGGREGATES:
+                    return 400, {'error': f"Unknown aggregate: {function}"}
+                aggregates.append((function, column or None))
+            groups = query(table, group_by, where, aggregates)
+        except ValueError as error:
+            return 400, {'error': str(error)}
+        return 200, [dict(zip(group_by, key), **values) for key, values in groups.items()]
+
+    async def handle_connection(self, reader, writer):
+        """Read one HTTP request and write the JSON response."""
+        try:
+            request_line = await reader.readline()
+            while (await reader.readline()) not in (b'\r\n', b'\n', b''):
+                pass
+            parts = request_line.decode('latin-1').split()
+            if len(parts) < 2:
+                status, payload = 400, {'error': 'Malformed request'}
+            elif parts[0] != 'GET':
+                status, payload = 405, {'error': 'Only GET is supported'}
+            else:
+                url = urlsplit(parts[1])
+                params = {key: values[-1] for key, values in parse_qs(url.query).items()}
+                try:
+                    if url.path in THREADED_PATHS:
+                        # scans of the table run in a worker thread so they
+                        # don't hold up other connections
+                        status, payload = await asyncio.to_thread(self.route, url.path, params)
+                    else:
+                        status, payload = self.route(url.path, params)
+                except Exception as error:
+                    status, payload = 500, {'error': str(error)}
+
+            body = json.dumps(payload).encode('utf-8')
+            writer.write(f"HTTP/1.1 {status} {STATUS_TEXT[status]}\r\n"
+                         "Content-Type: application/json\r\n"
+                         f"Content-Length: {len(body)}\r\n"
+                         "Connection: close\r\n\r\n".encode('latin-1') + body)
+            await writer.drain()
+        finally:
+            writer.close()
+
+    async def start(self, host='127.0.0.1', port=8080, unix_path=None):
+        """
+        Load the data and start listening.
+
+        Parameters:
+            host (str): Address for TCP
+            port (int): TCP port, 0 picks a free one
+            unix_path (str): Listen on this Unix socket instead of TCP
+
+        Returns:
+            asyncio.Server: The running server
+        """
+        await asyncio.to_thread(self.load)
+        if unix_path:
+            return await asyncio.start_unix_server(self.handle_connection, path=unix_path)
+        return await asyncio.start_server(self.handle_connection, host, port)
+
+
+async def serve(penguins_file, host='127.0.0.1', port=8080, unix_path=None, poll_interval=2.0):
+    """Run the service until cancelled."""
+    service = PenguinService(penguins_file, poll_interval)
+    server = await service.start(host, port, unix_path)
+    where = unix_path or f"http://{host}:{server.sockets[0].getsockname()[1]}"
+    print(f"Serving {penguins_file} ({service.state['results']['total_count']} penguins) on {where}")
+    watcher = asyncio.create_task(service.watch())
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        watcher.cancel()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve the penguin analyses over HTTP.")
+    parser.add_argument('penguins_file', nargs='?', default='penguins.csv', help="CSV file to serve")
+    parser.add_argument('--host', default='127.0.0.1', help="TCP address to listen on")
+    parser.add_argument('--port', type=int, default=8080, help="TCP port to listen on")
+    parser.add_argument('--unix', help="listen on this Unix socket path instead of TCP")
+    parser.add_argument('--poll', type=float, default=2.0, help="seconds between checks for CSV changes")
+    args = parser.parse_args()
+    try:
+        asyncio.run(serve(args.penguins_file, args.host, args.port, args.unix, args.poll))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
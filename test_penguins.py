@@ -9,10 +9,45 @@
 
 import os
 
-from main import (load_csv, count_island_gender, calculate_ratio, 
+from main import (load_csv, iter_csv, count_island_gender, calculate_ratio, 
                   calculate_body_weights, write_to_file,
                   count_total_penguins, count_species_by_island,
-                  write_comprehensive_results, avg_bill_length)
+                  write_comprehensive_results, avg_bill_length,
+                  aggregate_penguins, IslandGenderCounter, TotalCounter,
+                  PenguinTable, load_table, analyze_files, BodyWeightAccumulator,
+                  GroupStats, GroupedStats, BillLengthAccumulator,
+                  analyze_incremental, open_snapshot, scan_csv,
+                  PROFILER, profiling, profile_stage, write_profile,
+                  write_reports, render_body_weights, render_results,
+                  export_results, flatten_results, result_writer, RESULT_WRITERS,
+                  QueryCache, island_ratios, query, measurement_distributions,
+                  KLLSketch, DistributionStats, DistributionAccumulator,
+                  count_distinct, CountMinSketch, ApproxIslandGenderCounter,
+                  APPROXIMATE_ACCUMULATORS, DEFAULT_ACCUMULATORS, approximate_accumulators,
+                  SpeciesDistinctCounter, PenguinRecord, analyze_chunked, _chunk_ranges,
+                  detect_compression, YearPartitions, analyze_by_year, year_over_year,
+                  _nested_delta, compile_schema, ColumnSchema,
+                  validate_csv, iter_validated, flag_outliers, VALID_RANGES)
+import asyncio
+import bz2
+import contextlib
+import csv
+import gzip
+import io
+import json
+import lzma
+import main as main_module
+import statistics
+import threading
+import time
+from benchmark_penguins import generate_synthetic_csv, run_benchmarks, compare_results
+from serve_penguins import PenguinService
+from analyze_penguins import main as analyze_cli
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
 
 
 # helper function to parse CSV string to dict
@@ -109,6 +144,48 @@ Adelie,,,male,
             os.remove(test_filename3)
 
 
+def test_iter_csv():
+    """Test the iter_csv streaming loader."""
+    print("\nTesting iter_csv...")
+
+    test_csv_content = """species,island,bill_length_mm,bill_depth_mm,flipper_length_mm,body_mass_g,sex,year
+Adelie,Biscoe,37.8,18.3,174,3400,female,2007
+Gentoo,Dream,NA,NA,200,4500,male,NA
+"""
+    test_filename = 'test_data_stream.csv'
+    with open(test_filename, 'w') as f:
+        f.write(test_csv_content)
+
+    try:
+        # Test 1: General case - same records as load_csv
+        stream = iter_csv(test_filename)
+        assert not isinstance(stream, list), "Should return a lazy iterator"
+        assert list(stream) == load_csv(test_filename), "Should yield the same records as load_csv"
+        print(" Test 1 passed: Streams the same records as load_csv")
+
+        # Test 2: General case - analyses accept the stream directly
+        assert count_total_penguins(iter_csv(test_filename)) == 2, "Should count a stream"
+        weights = calculate_body_weights(iter_csv(test_filename))
+        assert weights['Gentoo']['Dream']['male'] == 4500.0, "Should average a stream"
+        assert avg_bill_length(iter_csv(test_filename)) == {'Adelie': 37.8}, "NA bill lengths skipped"
+        print(" Test 2 passed: Analysis functions accept a stream")
+
+        # Test 3: Edge case - NA values become None
+        records = iter_csv(test_filename)
+        next(records)
+        gentoo = next(records)
+        assert gentoo['bill_length_mm'] is None, "NA measurement becomes None"
+        assert gentoo['year'] is None, "NA year becomes None"
+        print(" Test 3 passed: NA values converted")
+    finally:
+        if os.path.exists(test_filename):
+            os.remove(test_filename)
+
+    # Test 4: Edge case - non-existent file yields nothing
+    assert list(iter_csv('nonexistent_file_xyz.csv')) == [], "Missing file yields no records"
+    print(" Test 4 passed: Handles missing file")
+
+
 def test_count_island_gender():
     """Test the count_island_gender function."""
     print("\nTesting count_island_gender...")
@@ -392,6 +469,1380 @@ def test_avg_bill_length():
     assert result4 == {}, "Empty input should return {}"
     print(" Test 4 passed: Handles empty input")
 
+# engine tests
+
+def test_aggregate_penguins():
+    """Test the single-pass aggregate_penguins engine."""
+    print("\nTesting aggregate_penguins...")
+
+    test_data = [
+        parse_csv_string_to_dict('"1","Adelie","Torgersen",39.1,18.7,181,3750,"male",2007'),
+        parse_csv_string_to_dict('"2","Adelie","Torgersen",39.5,17.4,186,3800,"female",2007'),
+        parse_csv_string_to_dict('"3","Gentoo","Biscoe",,13.2,211,,"male",2007'),
+        parse_csv_string_to_dict('"4","Chinstrap","Dream",46.5,17.9,192,3500,"",2007')
+    ]
+
+    # Test 1: General case - same results as the separate functions
+    result = aggregate_penguins(test_data)
+    assert result['total_count'] == count_total_penguins(test_data), "Total count should match"
+    assert result['species_data'] == count_species_by_island(test_data), "Species data should match"
+    assert result['gender_counts'] == count_island_gender(test_data), "Gender counts should match"
+    assert result['weight_stats'] == calculate_body_weights(test_data), "Weight stats should match"
+    assert result['bill_length_avgs'] == avg_bill_length(test_data), "Bill lengths should match"
+    print(" Test 1 passed: Matches the individual analysis functions")
+
+    # Test 2: General case - only the requested accumulators run
+    result2 = aggregate_penguins(test_data, {'gender_counts': IslandGenderCounter})
+    assert list(result2) == ['gender_counts'], "Should only return requested results"
+    assert result2['gender_counts']['Torgersen'] == {'male': 1, 'female': 1}, "Should count genders"
+    print(" Test 2 passed: Custom accumulators")
+
+    # Test 3: Edge case - records are read only once
+    result3 = aggregate_penguins(iter(test_data))
+    assert result3['total_count'] == 4, "A one-shot iterator should feed every accumulator"
+    assert result3['weight_stats'] == calculate_body_weights(test_data), "Weights from iterator"
+    print(" Test 3 passed: Single pass over an iterator")
+
+    # Test 4: Edge case - empty input
+    result4 = aggregate_penguins([], {'total_count': TotalCounter, 'gender_counts': IslandGenderCounter})
+    assert result4 == {'total_count': 0, 'gender_counts': {}}, "Empty input gives empty results"
+    print(" Test 4 passed: Empty input handled")
+
+def test_penguin_table():
+    """Test the columnar PenguinTable."""
+    print("\nTesting PenguinTable...")
+
+    test_data = [
+        parse_csv_string_to_dict('"1","Adelie","Torgersen",39.1,18.7,181,3750,"male",2007'),
+        parse_csv_string_to_dict('"2"," Adelie ","Torgersen",39.5,17.4,186,3800,"female",2007'),
+        parse_csv_string_to_dict('"3","Gentoo","Biscoe",,13.2,211,,"male",2008'),
+        parse_csv_string_to_dict('"4","Chinstrap","Dream",46.5,17.9,192,3500,"",2009')
+    ]
+    table = PenguinTable.from_records(test_data)
+
+    # Test 1: General case - rows come back as the original dictionaries
+    assert len(table) == 4, "Should hold 4 rows"
+    assert list(table) == test_data, "Rows should round-trip"
+    assert table[2]['body_mass_g'] is None, "NaN should read back as None"
+    assert table[0]['year'] == 2007, "Year should read back as int"
+    print(" Test 1 passed: Rows round-trip through the columns")
+
+    # Test 2: General case - categories stored as codes
+    assert table.categories['island'] == ['', 'Torgersen', 'Biscoe', 'Dream'], "Island labels"
+    assert list(table.codes['island']) == [1, 1, 2, 3], "Island codes"
+    assert list(table.codes['sex']) == [1, 2, 1, 0], "Missing sex uses the empty label"
+    print(" Test 2 passed: Categorical columns encoded")
+
+    # Test 3: General case - analyses accept the table directly
+    assert count_island_gender(table) == count_island_gender(test_data), "Gender counts match"
+    assert calculate_body_weights(table) == calculate_body_weights(test_data), "Weights match"
+    assert count_species_by_island(table) == count_species_by_island(test_data), "Species match"
+    assert avg_bill_length(table) == avg_bill_length(test_data), "Bill lengths match"
+    assert aggregate_penguins(table) == aggregate_penguins(test_data), "Engine results match"
+    print(" Test 3 passed: Group-bys over codes match the dict results")
+
+    # Test 4: Edge case - empty table and missing columns
+    assert list(PenguinTable()) == [], "Empty table has no rows"
+    assert calculate_body_weights(PenguinTable()) == {}, "Empty table gives empty weights"
+    partial = PenguinTable.from_records([{'species': 'Adelie', 'island': 'Dream'}])
+    assert avg_bill_length(partial) == {}, "Missing bill column gives no averages"
+    assert load_table('nonexistent_file_xyz.csv').length == 0, "Missing file gives empty table"
+    print(" Test 4 passed: Empty and partial tables handled")
+
+def test_backends():
+    """Test the python and numpy backends of calculate_body_weights and avg_bill_length."""
+    print("\nTesting backends...")
+
+    test_data = [
+        parse_csv_string_to_dict('"1","Adelie","Torgersen",39.1,18.7,181,3750,"male",2007'),
+        parse_csv_string_to_dict('"2","Adelie","Torgersen",39.5,17.4,186,3800,"male",2007'),
+        parse_csv_string_to_dict('"3","Gentoo"," Biscoe",,13.2,211,,"female",2008'),
+        parse_csv_string_to_dict('"4"," Gentoo ","Biscoe",46.1,13.2,211,4500,"female",2008')
+    ]
+    table = PenguinTable.from_records(test_data)
+
+    # Test 1: General case - explicit python backend on every input type
+    weights = calculate_body_weights(test_data, backend='python')
+    assert weights['Adelie']['Torgersen']['male'] == 3775.0, "Python backend average"
+    assert calculate_body_weights(table, backend='python') == weights, "Table python backend"
+    assert avg_bill_length(table, backend='python') == avg_bill_length(test_data), "Table bill lengths"
+    print(" Test 1 passed: Python backend")
+
+    # Test 2: General case - numpy backend gives identical results
+    if numpy is not None:
+        assert calculate_body_weights(table, backend='numpy') == weights, "NumPy weights match"
+        assert calculate_body_weights(test_data, backend='numpy') == weights, "NumPy converts lists"
+        assert avg_bill_length(table, backend='numpy') == {'Adelie': 39.3, 'Gentoo': 46.1}, "NumPy bill lengths"
+        print(" Test 2 passed: NumPy backend matches")
+    else:
+        try:
+            calculate_body_weights(table, backend='numpy')
+            assert False, "Should need NumPy"
+        except ImportError:
+            pass
+        print(" Test 2 passed: NumPy backend reports missing NumPy")
+
+    # Test 3: Edge case - auto backend and the single-pass engine
+    assert calculate_body_weights(table) == weights, "Auto backend matches"
+    assert aggregate_penguins(table, backend='auto') == aggregate_penguins(test_data), "Engine auto backend"
+    print(" Test 3 passed: Auto backend")
+
+    # Test 4: Edge case - unknown backend
+    try:
+        avg_bill_length(test_data, backend='fortran')
+        assert False, "Unknown backend should raise"
+    except ValueError:
+        pass
+    print(" Test 4 passed: Unknown backend rejected")
+
+def test_analyze_files():
+    """Test analyze_files over sharded CSV files."""
+    print("\nTesting analyze_files...")
+
+    shard1 = """species,island,bill_length_mm,bill_depth_mm,flipper_length_mm,body_mass_g,sex,year
+Adelie,Biscoe,37.8,18.3,174,3400,female,2007
+Adelie,Biscoe,37.7,18.7,180,3600,male,2007
+"""
+    shard2 = """species,island,bill_length_mm,bill_depth_mm,flipper_length_mm,body_mass_g,sex,year
+Adelie,Biscoe,38.2,18.1,185,3800,male,2008
+Gentoo,Dream,NA,NA,200,4500,male,2008
+"""
+    shard_files = ['test_shard_1.csv', 'test_shard_2.csv']
+    for shard_file, content in zip(shard_files, [shard1, shard2]):
+        with open(shard_file, 'w') as f:
+            f.write(content)
+
+    try:
+        all_records = load_csv(shard_files[0]) + load_csv(shard_files[1])
+
+        # Test 1: General case - parallel results match one combined pass
+        result = analyze_files(shard_files, processes=2)
+        assert result == aggregate_penguins(all_records), "Merged shards should match a single pass"
+        assert result['gender_counts']['Biscoe'] == {'male': 2, 'female': 1}, "Counts merged"
+        assert result['weight_stats']['Adelie']['Biscoe']['male'] == 3700.0, "Means merged from sums"
+        print(" Test 1 passed: Shards merged across processes")
+
+        # Test 2: General case - glob pattern, serial run
+        result2 = analyze_files('test_shard_*.csv', processes=1)
+        assert result2 == result, "Glob pattern should find both shards"
+        print(" Test 2 passed: Glob pattern handled")
+
+        # Test 3: Edge case - partial accumulators merge
+        first = BodyWeightAccumulator()
+        second = BodyWeightAccumulator()
+        for penguin in load_csv(shard_files[0]):
+            first.update(penguin)
+        for penguin in load_csv(shard_files[1]):
+            second.update(penguin)
+        first.merge(second)
+        assert first.result() == calculate_body_weights(all_records), "merge() combines sums and counts"
+        print(" Test 3 passed: Accumulators merge")
+    finally:
+        for shard_file in shard_files:
+            if os.path.exists(shard_file):
+                os.remove(shard_file)
+
+    # Test 4: Edge case - no files
+    assert analyze_files([]) == aggregate_penguins([]), "No files gives empty results"
+    print(" Test 4 passed: No files handled")
+
+def test_group_stats():
+    """Test the mergeable GroupStats and GroupedStats accumulators."""
+    print("\nTesting GroupStats...")
+
+    # Test 1: General case - count, sum, sum of squares, min, max
+    stats = GroupStats()
+    for value in [2.0, 4.0, 4.0, 4.0, 5.0, 5.0, 7.0, 9.0]:
+        stats.add(value)
+    assert stats.count == 8 and stats.total == 40.0, "Count and sum"
+    assert stats.total_sq == 232.0, "Sum of squares"
+    assert stats.minimum == 2.0 and stats.maximum == 9.0, "Min and max"
+    assert stats.mean() == 5.0, "Mean"
+    assert round(stats.std(), 4) == 2.1381, "Sample standard deviation"
+    print(" Test 1 passed: Statistics tracked")
+
+    # Test 2: General case - merging batches equals one batch
+    first = GroupedStats()
+    second = GroupedStats()
+    combined = GroupedStats()
+    for key, value in [('a', 1.0), ('b', 2.0), ('a', 3.0)]:
+        first.add(key, value)
+        combined.add(key, value)
+    for key, value in [('a', 5.0), ('c', 6.0)]:
+        second.add(key, value)
+        combined.add(key, value)
+    first.merge(second)
+    assert first.groups == combined.groups, "Merged groups should equal a single pass"
+    print(" Test 2 passed: Grouped stats merge")
+
+    # Test 3: General case - means stay exact across batches until the end
+    batch1 = [{'species': 'Adelie', 'bill_length_mm': 40.0}]
+    batch2 = [{'species': 'Adelie', 'bill_length_mm': 41.0},
+              {'species': 'Adelie', 'bill_length_mm': 42.5}]
+    acc1 = BillLengthAccumulator()
+    acc2 = BillLengthAccumulator()
+    for penguin in batch1:
+        acc1.update(penguin)
+    for penguin in batch2:
+        acc2.update(penguin)
+    acc1.merge(acc2)
+    assert acc1.result() == avg_bill_length(batch1 + batch2), "Should match one pass over all rows"
+    assert acc1.result()['Adelie'] == 41.17, "Mean of all three values, not of the batch means"
+    print(" Test 3 passed: Accumulators merge before rounding")
+
+    # Test 4: Edge case - empty stats
+    empty = GroupStats()
+    assert empty.mean() is None and empty.std() is None, "Empty stats have no mean or std"
+    stats.merge(empty)
+    assert stats.count == 8 and stats.minimum == 2.0, "Merging empty stats changes nothing"
+    empty.merge(stats)
+    assert empty == stats, "Merging into empty copies the stats"
+    print(" Test 4 passed: Empty stats handled")
+
+def test_analyze_incremental():
+    """Test analyze_incremental on an append-only CSV file."""
+    print("\nTesting analyze_incremental...")
+
+    header = "species,island,bill_length_mm,bill_depth_mm,flipper_length_mm,body_mass_g,sex,year\n"
+    rows = [
+        "Adelie,Biscoe,37.8,18.3,174,3400,female,2007\n",
+        "Adelie,Biscoe,37.7,18.7,180,3600,male,2007\n",
+        "Gentoo,Dream,46.1,13.2,211,4500,male,2008\n",
+        "Gentoo,Dream,45.2,14.8,215,4550,female,2008\n",
+    ]
+    test_filename = 'test_data_incremental.csv'
+    state_filename = test_filename + '.state.json'
+    with open(test_filename, 'w') as f:
+        f.write(header + rows[0] + rows[1])
+
+    try:
+        # Test 1: General case - first run analyzes the whole file and saves state
+        result = analyze_incremental(test_filename)
+        assert result == aggregate_penguins(load_csv(test_filename)), "First run should match a full pass"
+        assert os.path.exists(state_filename), "Should save the sidecar state file"
+        print(" Test 1 passed: Initial run saves state")
+
+        # Test 2: General case - appended rows update the saved state
+        with open(test_filename, 'a') as f:
+            f.write(rows[2] + rows[3])
+        result2 = analyze_incremental(test_filename)
+        assert result2 == aggregate_penguins(load_csv(test_filename)), "Should match a full pass after appending"
+        assert result2['gender_counts']['Dream'] == {'male': 1, 'female': 1}, "New rows counted"
+        print(" Test 2 passed: Appended rows processed")
+
+        # Test 3: Edge case - a last row without its newline is counted but re-read next run
+        with open(test_filename, 'a') as f:
+            f.write("Chinstrap,Dream,46.5,17.9,192,3500,fe")
+        result3 = analyze_incremental(test_filename)
+        assert result3 == aggregate_penguins(load_csv(test_filename)), "Unterminated row counted like a full pass"
+        with open(test_filename, 'a') as f:
+            f.write("male,2009\n")
+        result3 = analyze_incremental(test_filename)
+        assert result3['total_count'] == 5, "Completed row counted once"
+        assert result3['gender_counts']['Dream']['female'] == 2, "Completed row parsed whole"
+        # a quoted field holding a newline, cut off after the newline
+        with open(test_filename, 'a') as f:
+            f.write('Gentoo,Dream,46.5,17.9,192,3500,"fe\n')
+        assert analyze_incremental(test_filename)['total_count'] == 5, "Open quoted field not counted"
+        with open(test_filename, 'a') as f:
+            f.write('male",2009\n')
+        result3 = analyze_incremental(test_filename)
+        assert result3 == aggregate_penguins(load_csv(test_filename)), "Quoted record resumed whole"
+        assert result3['total_count'] == 6, "Quoted record counted once"
+        print(" Test 3 passed: Partial rows handled")
+
+        # Test 4: Edge case - a rewritten file is recomputed from scratch
+        with open(test_filename, 'w') as f:
+            f.write(header + rows[1])
+        result4 = analyze_incremental(test_filename)
+        assert result4 == aggregate_penguins(load_csv(test_filename)), "Rewritten file recomputed"
+        incomplete = json.dumps({'header': header.strip().split(','),
+                                 'accumulators': dict.fromkeys(result4)})
+        for broken in ('{"header": [', incomplete, '[1, 2]'):
+            with open(state_filename, 'w') as f:
+                f.write(broken)
+            assert analyze_incremental(test_filename) == result4, "Unreadable state recomputed"
+        renamed = dict(DEFAULT_ACCUMULATORS, total_count=TotalCounter)
+        analyze_incremental(test_filename, accumulators=renamed)
+        other = dict(DEFAULT_ACCUMULATORS, total_count=BillLengthAccumulator)
+        assert analyze_incremental(test_filename, accumulators=other)['total_count'] == \
+            aggregate_penguins(load_csv(test_filename), other)['total_count'], "Other class recomputed"
+        with open(test_filename, 'w') as f:
+            f.write(header + rows[0] + rows[1].rstrip('\n'))
+        os.remove(state_filename)
+        assert analyze_incremental(test_filename) == aggregate_penguins(load_csv(test_filename)), "No final newline"
+        assert analyze_incremental(test_filename)['total_count'] == 2, "Tail re-read, not doubled"
+        print(" Test 4 passed: Rewritten file and broken state detected")
+    finally:
+        for filename in [test_filename, state_filename]:
+            if os.path.exists(filename):
+                os.remove(filename)
+
+def test_snapshot_cache():
+    """Test the binary snapshot cache behind load_table(cache=True)."""
+    print("\nTesting snapshot cache...")
+
+    test_csv_content = """species,island,bill_length_mm,bill_depth_mm,flipper_length_mm,body_mass_g,sex,year
+Adelie,Biscoe,37.8,18.3,174,3400,female,2007
+Gentoo,Dream,NA,NA,200,4500,male,NA
+"""
+    test_filename = 'test_data_snapshot.csv'
+    snapshot_filename = test_filename + '.snapshot'
+    with open(test_filename, 'w') as f:
+        f.write(test_csv_content)
+
+    try:
+        # Test 1: General case - first load parses and writes the snapshot
+        table = load_table(test_filename, cache=True)
+        assert os.path.exists(snapshot_filename), "Should write a snapshot"
+        assert list(table) == load_csv(test_filename), "Parsed table should match load_csv"
+        print(" Test 1 passed: Snapshot written on first load")
+
+        # Test 2: General case - second load maps the snapshot
+        cached = load_table(test_filename, cache=True, verify_hash=True)
+        assert isinstance(cached.numeric['body_mass_g'], memoryview), "Columns should be views into the snapshot"
+        assert list(cached) == list(table), "Snapshot rows should match"
+        assert aggregate_penguins(cached) == aggregate_penguins(table), "Snapshot analyses should match"
+        print(" Test 2 passed: Snapshot memory-mapped on later loads")
+
+        # Test 3: Edge case - a changed CSV is parsed again
+        with open(test_filename, 'a') as f:
+            f.write("Chinstrap,Dream,46.5,17.9,192,3500,female,2009\n")
+        changed = load_table(test_filename, cache=True)
+        assert len(changed) == 3, "Changed file should be reparsed"
+        assert open_snapshot(snapshot_filename)[0][2]['species'] == 'Chinstrap', "Snapshot refreshed"
+        print(" Test 3 passed: Stale snapshot replaced")
+
+        # Test 4: Edge case - a damaged snapshot is ignored
+        with open(snapshot_filename, 'wb') as f:
+            f.write(b'not a snapshot')
+        assert open_snapshot(snapshot_filename) is None, "Damaged snapshot should not open"
+        assert len(load_table(test_filename, cache=True)) == 3, "Should fall back to the CSV"
+        print(" Test 4 passed: Damaged snapshot falls back to the CSV")
+    finally:
+        for filename in [test_filename, snapshot_filename]:
+            if os.path.exists(filename):
+                os.remove(filename)
+
+def test_scan_csv():
+    """Test the scan_csv byte-level loader."""
+    print("\nTesting scan_csv...")
+
+    def write_and_compare(filename, content):
+        with open(filename, 'w', newline='') as f:
+            f.write(content)
+        try:
+            return scan_csv(filename), load_csv(filename)
+        finally:
+            if os.path.exists(filename):
+                os.remove(filename)
+
+    # Test 1: General case - quoted index, species, island and sex columns
+    table, records = write_and_compare('test_data_scan_1.csv', """"","species","island","bill_length_mm","bill_depth_mm","flipper_length_mm","body_mass_g","sex","year"
+"1","Adelie","Torgersen",39.1,18.7,181,3750,"male",2007
+"2","Gentoo","Biscoe",NA,NA,NA,NA,NA,2008
+""")
+    assert list(table) == records, "Should match load_csv"
+    assert 'bill_length_mm' in table.numeric and '' not in table.columns, "Index column skipped"
+    assert table[1]['body_mass_g'] is None and table[1]['sex'] == "", "NA handled"
+    print(" Test 1 passed: Penguins layout scanned")
+
+    # Test 2: General case - missing columns, short rows and blank lines
+    table, records = write_and_compare('test_data_scan_2.csv', """species,island,body_mass_g,sex,year
+Adelie,,,male,
+
+Chinstrap,Dream
+""")
+    assert list(table) == records, "Should match load_csv"
+    assert table[1]['year'] is None and table[1]['sex'] == "", "Short row filled with missing values"
+    print(" Test 2 passed: Missing values and short rows")
+
+    # Test 3: Edge case - quoted commas, escaped quotes and CRLF endings
+    table, records = write_and_compare('test_data_scan_3.csv',
+                                       'species,island,sex\r\n"Ade,lie","Bis""coe",male\r\nGentoo,Dream,female\r\n')
+    assert list(table) == records, "Should match load_csv"
+    assert table[0]['species'] == 'Ade,lie' and table[0]['island'] == 'Bis"coe', "Quoted fields parsed"
+    print(" Test 3 passed: Quoting handled like csv")
+
+    # Test 4: Edge case - missing and empty files
+    assert len(scan_csv('nonexistent_file_xyz.csv')) == 0, "Missing file gives empty table"
+    table, records = write_and_compare('test_data_scan_4.csv', "")
+    assert len(table) == 0 and records == [], "Empty file gives empty table"
+    print(" Test 4 passed: Missing and empty files")
+
+def test_benchmarks():
+    """Test the synthetic data generator and benchmark runner."""
+    print("\nTesting benchmarks...")
+
+    test_filename = 'test_data_synthetic.csv'
+    try:
+        # Test 1: General case - generated file loads like penguins.csv
+        generate_synthetic_csv(test_filename, 200, na_rate=0.1)
+        records = load_csv(test_filename)
+        assert len(records) == 200, "Should generate 200 rows"
+        assert set(records[0]) == set(load_csv('penguins.csv')[0]), "Should use the penguins columns"
+        assert any(record['body_mass_g'] is None for record in records), "Should include NA values"
+        print(" Test 1 passed: Synthetic CSV generated")
+
+        # Test 2: General case - category cardinality and no NA
+        generate_synthetic_csv(test_filename, 300, na_rate=0.0, n_species=5, n_islands=7)
+        records = load_csv(test_filename)
+        assert len(count_species_by_island(records)) == 5, "Should use 5 species"
+        assert len(count_island_gender(records)) == 7, "Should use 7 islands"
+        assert all(record['year'] is not None for record in records), "No NA values"
+        print(" Test 2 passed: Cardinality and NA rate configurable")
+    finally:
+        if os.path.exists(test_filename):
+            os.remove(test_filename)
+
+    # Test 3: General case - every stage measured
+    report = run_benchmarks([50], repeat=1)
+    stages = report['runs'][0]['stages']
+    assert report['runs'][0]['rows'] == 50, "Should record the size"
+    assert 'load_csv' in stages and 'pipeline' in stages, "Should time loading and the pipeline"
+    assert stages['calculate_body_weights']['peak_bytes'] > 0, "Should record memory"
+    large = run_benchmarks([50], repeat=1, list_rows=10)['runs'][0]['stages']
+    assert 'load_csv' not in large and 'aggregate_penguins' not in large, "List stages skipped above list_rows"
+    assert 'load_table' in large and 'pipeline' in large, "Streaming and table stages still run"
+    print(" Test 3 passed: Stages timed and profiled")
+
+    # Test 4: Edge case - regression comparison
+    slower = {'runs': [{'rows': 50, 'stages': {'load_csv': {'best_seconds': stages['load_csv']['best_seconds'] * 10}}}]}
+    assert compare_results(report, report) == [], "Same results have no regressions"
+    assert compare_results(report, slower)[0][1] == 'load_csv', "Slower stage reported"
+    print(" Test 4 passed: Regressions detected")
+
+def test_profiling():
+    """Test the per-stage profiling hooks."""
+    print("\nTesting profiling...")
+
+    test_data = [
+        parse_csv_string_to_dict('"1","Adelie","Torgersen",39.1,18.7,181,3750,"male",2007'),
+        parse_csv_string_to_dict('"2","Gentoo","Biscoe",46.1,13.2,211,4500,"female",2008')
+    ]
+    was_enabled = PROFILER.enabled
+    PROFILER.reset()
+
+    # Test 1: General case - profiled functions record a stage
+    with profiling() as profiler:
+        calculate_body_weights(test_data)
+        with profile_stage('custom', rows=2):
+            count_island_gender(test_data)
+    stages = [record['stage'] for record in profiler.stages]
+    assert stages == ['calculate_body_weights', 'custom', 'count_island_gender'], f"Stages recorded, got {stages}"
+    record = profiler.stages[0]
+    assert record['rows'] == 2 and record['wall_seconds'] >= 0 and record['cpu_seconds'] >= 0, "Times and rows"
+    assert record['peak_bytes'] is not None, "Peak memory recorded"
+    assert profiler.stages[2]['depth'] == 1, "Nested stage depth"
+    print(" Test 1 passed: Stages recorded")
+
+    # Test 2: General case - streams charge only their own time
+    PROFILER.reset()
+    test_filename = 'test_data_profile.csv'
+    with open(test_filename, 'w') as f:
+        f.write("species,island,body_mass_g,sex,year\nAdelie,Biscoe,3400,female,2007\n")
+    try:
+        with profiling() as profiler:
+            aggregate_penguins(iter_csv(test_filename))
+        assert [r['stage'] for r in profiler.stages] == ['aggregate_penguins', 'iter_csv'], "Stream recorded"
+        assert profiler.stages[1]['rows'] == 1, "Stream rows counted"
+        PROFILER.reset()
+        with profiling() as profiler:
+            calculate_ratio(count_island_gender(test_data))
+            validate_csv(test_filename)
+            aggregate_penguins(test_data)
+        rows = {r['stage']: r['rows'] for r in profiler.stages}
+        assert rows['calculate_ratio'] is None, "Island dicts are not rows"
+        assert rows['validate_csv'] == 1, "Rows of the (penguins, report) tuple"
+    finally:
+        if os.path.exists(test_filename):
+            os.remove(test_filename)
+    PROFILER.reset()
+    with profiling() as profiler:
+        def worker():
+            for _ in range(50):
+                with profile_stage('outer'):
+                    calculate_body_weights(test_data)
+        threads = [threading.Thread(target=worker) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        aggregate_penguins(test_data)
+    depths = {record['stage']: record['depth'] for record in profiler.stages}
+    assert depths == {'outer': 0, 'calculate_body_weights': 1, 'aggregate_penguins': 0}, \
+        "Threads nest their own stages"
+    assert len(profiler.stages) == 401, "Every stage recorded"
+    assert all(set(record) == {'stage', 'depth', 'wall_seconds', 'cpu_seconds', 'rows', 'peak_bytes'}
+               for record in profiler.stages), "No bookkeeping keys left in records"
+    print(" Test 2 passed: Streams profiled")
+
+    # Test 3: General case - JSON and summary export
+    json_filename = 'test_profile.json'
+    report_filename = 'test_profile_report.txt'
+    with open(report_filename, 'w') as f:
+        f.write("report\n")
+    try:
+        write_profile(json_filename, report_filename)
+        with open(json_filename) as f:
+            assert '"aggregate_penguins"' in f.read(), "JSON holds the stages"
+        with open(report_filename) as f:
+            content = f.read()
+        assert content.startswith("report\n") and 'PROFILE' in content, "Summary appended"
+    finally:
+        for filename in [json_filename, report_filename]:
+            if os.path.exists(filename):
+                os.remove(filename)
+    print(" Test 3 passed: Profile exported")
+
+    # Test 4: Edge case - nothing recorded when profiling is off
+    PROFILER.reset()
+    if not was_enabled:
+        calculate_body_weights(test_data)
+        with profile_stage('ignored') as record:
+            assert record is None, "No record when disabled"
+        assert PROFILER.stages == [], "Nothing recorded when disabled"
+    print(" Test 4 passed: Disabled profiling records nothing")
+
+def test_write_reports():
+    """Test the shared report renderers and write_reports."""
+    print("\nTesting write_reports...")
+
+    test_data = [
+        parse_csv_string_to_dict('"1","Adelie","Torgersen",39.1,18.7,181,3750,"male",2007'),
+        parse_csv_string_to_dict('"2","Adelie","Torgersen",39.5,17.4,186,3800,"female",2007'),
+        parse_csv_string_to_dict('"3","Gentoo","Biscoe",46.1,13.2,211,4500,"female",2008')
+    ]
+    results = aggregate_penguins(test_data)
+    ratios = calculate_ratio(results['gender_counts'])
+    filenames = ['test_report_1.txt', 'test_report_2.txt', 'test_report_3.txt', 'test_report_4.txt']
+
+    try:
+        # Test 1: General case - write_reports matches the two writers
+        write_to_file(results['gender_counts'], results['weight_stats'], ratios, filenames[0])
+        write_comprehensive_results(results['total_count'], results['species_data'],
+                                    results['gender_counts'], ratios, results['weight_stats'], filenames[1])
+        write_reports(results, {filenames[2]: 'results', filenames[3]: 'comprehensive'})
+        contents = []
+        for filename in filenames:
+            with open(filename) as f:
+                contents.append(f.read())
+        assert contents[0] == contents[2], "Results layout should match write_to_file"
+        assert contents[1] == contents[3], "Comprehensive layout should match write_comprehensive_results"
+        print(" Test 1 passed: Reports match the writers")
+
+        # Test 2: General case - body weight section rendered once and reused
+        sections = {}
+        render_results(results['gender_counts'], results['weight_stats'], ratios, sections)
+        assert sections['body_weights'] == render_body_weights(results['weight_stats']), "Section cached"
+        assert sections['body_weights'] in contents[1], "Same section in the comprehensive report"
+        assert "    Male: 3750.0 g\n" in sections['body_weights'], "Weights rendered with units"
+        print(" Test 2 passed: Sections shared between reports")
+    finally:
+        for filename in filenames:
+            if os.path.exists(filename):
+                os.remove(filename)
+
+    # Test 3: Edge case - No data weights have no unit
+    text = render_body_weights({'Adelie': {'Dream': {'male': 'No data'}}})
+    assert text == "\nAdelie:\n  Dream:\n    Male: No data\n", "No data rendered without unit"
+    print(" Test 3 passed: No data rendered")
+
+    # Test 4: Edge case - unknown layout
+    try:
+        write_reports(results, {filenames[0]: 'poster'})
+        assert False, "Unknown layout should raise"
+    except ValueError:
+        pass
+    assert not os.path.exists(filenames[0]), "Nothing written for an unknown layout"
+    print(" Test 4 passed: Unknown layout rejected")
+
+def test_export_results():
+    """Test the machine-readable result exports."""
+    print("\nTesting export_results...")
+
+    test_data = [
+        parse_csv_string_to_dict('"1","Adelie","Torgersen",39.1,18.7,181,3750,"male",2007'),
+        parse_csv_string_to_dict('"2","Adelie","Torgersen",39.5,17.4,186,3800,"male",2007'),
+        parse_csv_string_to_dict('"3","Gentoo","Biscoe",46.1,13.2,211,4500,"female",2008')
+    ]
+    results = aggregate_penguins(test_data)
+    rows = list(flatten_results(results))
+
+    # Test 1: General case - every analysis flattened
+    analyses = {row['analysis'] for row in rows}
+    assert analyses == {'total', 'species_by_island', 'island_gender', 'gender_ratio',
+                        'body_weight', 'bill_length'}, f"All analyses present, got {analyses}"
+    weight = [row for row in rows if row['analysis'] == 'body_weight' and row['species'] == 'Adelie'][0]
+    assert weight['value'] == 3775.0 and weight['sex'] == 'male', "Body weight row"
+    ratio = [row for row in rows if row['analysis'] == 'gender_ratio' and row['island'] == 'Torgersen'][0]
+    assert ratio['value'] is None and ratio['text'] == 'No females', "Text results kept in text"
+    print(" Test 1 passed: Results flattened")
+
+    filenames = {'jsonl': 'test_results.jsonl', 'csv': 'test_results.csv', 'columnar': 'test_results.columnar'}
+    try:
+        # Test 2: General case - JSON Lines and CSV round-trip
+        export_results(results, filenames['jsonl'], 'jsonl')
+        export_results(results, filenames['csv'], 'csv')
+        with open(filenames['jsonl']) as f:
+            assert [json.loads(line) for line in f] == rows, "JSON Lines round-trip"
+        with open(filenames['csv'], newline='') as f:
+            csv_rows = list(csv.DictReader(f))
+        assert len(csv_rows) == len(rows) and csv_rows[0]['analysis'] == 'total', "CSV rows written"
+        print(" Test 2 passed: JSON Lines and CSV written")
+
+        # Test 3: General case - columnar file maps back without parsing
+        export_results(results, filenames['columnar'], 'columnar')
+        table = open_snapshot(filenames['columnar'])[0]
+        assert isinstance(table.numeric['value'], memoryview), "Value column mapped"
+        assert [row['analysis'] for row in table] == [row['analysis'] for row in rows], "Rows in order"
+        assert table[0]['value'] == 3.0, "Numeric values stored as float"
+        print(" Test 3 passed: Columnar file written")
+    finally:
+        for filename in filenames.values():
+            if os.path.exists(filename):
+                os.remove(filename)
+
+    # Test 4: Edge case - custom writers and unknown formats
+    written = []
+
+    @result_writer('memory')
+    def write_memory(rows, filename):
+        written.extend(rows)
+    try:
+        export_results({'total_count': 0}, 'unused', 'memory')
+        assert written == [{'analysis': 'total', 'species': '', 'island': '', 'sex': '',
+                            'metric': 'count', 'value': 0, 'text': ''}], "Custom writer used"
+    finally:
+        del RESULT_WRITERS['memory']
+    try:
+        export_results(results, 'unused', 'xml')
+        assert False, "Unknown format should raise"
+    except ValueError:
+        pass
+    print(" Test 4 passed: Pluggable writers")
+
+def test_query_cache():
+    """Test the LRU QueryCache."""
+    print("\nTesting QueryCache...")
+
+    test_data = [
+        parse_csv_string_to_dict('"1","Adelie","Torgersen",39.1,18.7,181,3750,"male",2007'),
+        parse_csv_string_to_dict('"2","Adelie","Torgersen",39.5,17.4,186,3800,"female",2007')
+    ]
+    cache = QueryCache(maxsize=2)
+
+    # Test 1: General case - repeated requests are served from the cache
+    first = cache.get(test_data, calculate_body_weights)
+    second = cache.get(test_data, calculate_body_weights)
+    assert second is first, "Second request should reuse the result"
+    assert cache.hits == 1 and cache.misses == 1, "One hit and one miss"
+    assert cache.get(test_data, island_ratios) == {'Torgersen': 1.0}, "Ratios cached too"
+    print(" Test 1 passed: Repeated requests hit the cache")
+
+    # Test 2: General case - appended records change the key
+    table = PenguinTable.from_records(test_data)
+    before = cache.get(table, count_island_gender)
+    table.append(parse_csv_string_to_dict('"3","Adelie","Torgersen",40.3,18,195,3250,"male",2007'))
+    after = cache.get(table, count_island_gender)
+    assert before['Torgersen']['male'] == 1 and after['Torgersen']['male'] == 2, "New version recomputed"
+    print(" Test 2 passed: New data versions recomputed")
+
+    # Test 3: Edge case - LRU eviction and explicit invalidation
+    assert len(cache) == 2, "Should hold at most maxsize entries"
+    misses = cache.misses
+    cache.get(test_data, calculate_body_weights)
+    assert cache.misses == misses + 1, "Least recently used entry should have been evicted"
+    test_data[0]['body_mass_g'] = 4000.0
+    cache.invalidate(test_data)
+    assert cache.get(test_data, calculate_body_weights)['Adelie']['Torgersen']['male'] == 4000.0, "Invalidated"
+    print(" Test 3 passed: Eviction and invalidation")
+
+    # Test 4: Edge case - streams and unhashable arguments bypass the cache
+    assert cache.get(iter(test_data), count_total_penguins) == 2, "Streams computed directly"
+    size = len(cache)
+    assert cache.get(test_data, lambda penguins, extra: len(extra), [1, 2, 3]) == 3, "Unhashable args computed"
+    assert len(cache) == size, "Nothing cached for streams or unhashable args"
+    print(" Test 4 passed: Uncacheable requests computed directly")
+
+def test_query():
+    """Test the generic group-by/filter query API."""
+    print("\nTesting query...")
+
+    test_data = [
+        parse_csv_string_to_dict('"1","Adelie","Torgersen",39.1,18.7,181,3750,"male",2007'),
+        parse_csv_string_to_dict('"2","Adelie","Biscoe",39.5,17.4,186,3800,"female",2008'),
+        parse_csv_string_to_dict('"3","Adelie","Biscoe",40.3,18,195,3250,"female",2008'),
+        parse_csv_string_to_dict('"4","Gentoo","Biscoe",46.1,13.2,211,,"male",2008'),
+        parse_csv_string_to_dict('"5","Gentoo","Dream",46.5,14.1,215,5000,"male",2009')
+    ]
+    table = PenguinTable.from_records(test_data)
+
+    # Test 1: General case - grouped aggregates
+    result = query(test_data, group_by=('species',),
+                   aggregates=[('count', None), ('mean', 'body_mass_g'), ('max', 'bill_length_mm')])
+    assert result[('Adelie',)] == {'count': 3, 'mean_body_mass_g': 3600.0, 'max_bill_length_mm': 40.3}, "Adelie aggregates"
+    assert result[('Gentoo',)]['mean_body_mass_g'] == 5000.0, "Missing values skipped"
+    print(" Test 1 passed: Grouped aggregates")
+
+    # Test 2: General case - filters with values, sets and functions
+    where = {'year': 2008, 'island': {'Biscoe', 'Dream'}, 'sex': lambda sex: sex == 'female'}
+    result2 = query(test_data, group_by=('island', 'sex'), where=where,
+                    aggregates=[('count', None), ('std', 'body_mass_g'), ('min', 'flipper_length_mm')])
+    assert list(result2) == [('Biscoe', 'female')], "Only matching groups"
+    assert round(result2[('Biscoe', 'female')]['std_body_mass_g'], 2) == 388.91, "Standard deviation"
+    assert result2[('Biscoe', 'female')]['min_flipper_length_mm'] == 186.0, "Minimum"
+    print(" Test 2 passed: Filters applied")
+
+    # Test 3: General case - indexed table gives the same answers
+    table.build_indexes()
+    assert list(table.index('island')['Biscoe']) == [1, 2, 3], "Island index holds row positions"
+    assert list(table.index('year')[2008]) == [1, 2, 3], "Year index holds row positions"
+    assert query(table, group_by=('island', 'sex'), where=where,
+                 aggregates=[('count', None), ('std', 'body_mass_g'), ('min', 'flipper_length_mm')]) == result2, "Table matches"
+    assert query(table, where={'species': 'Gentoo', 'year': 2009}) == {(): {'count': 1}}, "Ungrouped count"
+    print(" Test 3 passed: Indexed queries")
+
+    # Test 4: Edge case - no matches and bad aggregates
+    assert query(table, where={'species': 'Emperor'}) == {}, "No matching rows"
+    assert query([], group_by=('species',)) == {}, "Empty input"
+    try:
+        query(test_data, aggregates=[('median', 'body_mass_g')])
+        assert False, "Unknown aggregate should raise"
+    except ValueError:
+        pass
+    assert query(table, aggregates=[('count', 'sex')]), "Text columns can be counted"
+    for data, kwargs in [(table, {'aggregates': [('mean', 'sex')]}),
+                         (test_data, {'aggregates': [('max', 'species')]}),
+                         (table, {'group_by': ('nosuch',)}),
+                         (table, {'aggregates': [('mean', 'nosuchcol')]})]:
+        try:
+            query(data, **kwargs)
+            assert False, f"Should raise for {kwargs}"
+        except ValueError:
+            pass
+    print(" Test 4 passed: Edge cases handled")
+
+def test_penguin_service():
+    """Test the asyncio analysis service in serve_penguins.py."""
+    print("\nTesting penguin service...")
+
+    header = "species,island,bill_length_mm,bill_depth_mm,flipper_length_mm,body_mass_g,sex,year\n"
+    rows = [
+        "Gentoo,Biscoe,46.1,13.2,211,4500,female,2007\n",
+        "Gentoo,Biscoe,50.0,16.3,230,5700,male,2007\n",
+        "Adelie,Dream,39.5,17.4,186,3800,female,2008\n",
+    ]
+    test_filename = 'test_data_service.csv'
+    with open(test_filename, 'w') as f:
+        f.write(header + rows[0] + rows[1])
+
+    async def fetch(port, target, method='GET'):
+        reader, writer = await asyncio.open_connection('127.0.0.1', port)
+        writer.write(f"{method} {target} HTTP/1.1\r\nHost: localhost\r\n\r\n".encode())
+        response = await reader.read()
+        writer.close()
+        head, _, body = response.partition(b'\r\n\r\n')
+        return int(head.split()[1]), json.loads(body)
+
+    async def scenario():
+        service = PenguinService(test_filename, poll_interval=0.01)
+        server = await service.start(port=0)
+        port = server.sockets[0].getsockname()[1]
+        try:
+            # Test 1: General case - filtered body weights
+            status, weights = await fetch(port, '/body_weights?species=Gentoo&island=Biscoe')
+            assert status == 200, "Request should succeed"
+            assert weights == {'Gentoo': {'Biscoe': {'female': 4500.0, 'male': 5700.0}}}, "Filtered weights"
+            print(" Test 1 passed: Body weights served")
+
+            # Test 2: General case - concurrent requests
+            answers = await asyncio.gather(fetch(port, '/ratios'), fetch(port, '/health'),
+                                           fetch(port, '/query?group_by=sex&agg=count,mean:body_mass_g'))
+            assert answers[0] == (200, {'Biscoe': 1.0}), "Ratio by island"
+            assert answers[1][1]['rows'] == 2, "Health reports row count"
+            assert answers[2][1] == [{'sex': 'female', 'count': 1, 'mean_body_mass_g': 4500.0},
+                                     {'sex': 'male', 'count': 1, 'mean_body_mass_g': 5700.0}], "Query results"
+            finished = []
+            def slow_query(table, params):
+                time.sleep(0.3)
+                return PenguinService._query(service, table, params)
+            async def timed_fetch(target):
+                answer = await fetch(port, target)
+                finished.append(target)
+                return answer
+            service._query = slow_query
+            await asyncio.gather(timed_fetch('/query'), timed_fetch('/health'))
+            del service._query
+            assert finished == ['/health', '/query'], "A slow query doesn't block other requests"
+            print(" Test 2 passed: Concurrent requests answered")
+
+            # Test 3: General case - CSV changes are picked up
+            with open(test_filename, 'a') as f:
+                f.write(rows[2])
+            assert await service.reload_if_changed(), "Changed file should reload"
+            assert not await service.reload_if_changed(), "Unchanged file should not reload"
+            status, summary = await fetch(port, '/summary')
+            assert summary['total_count'] == 3, "New row served after reload"
+            assert summary['ratios'] == {'Biscoe': 1.0, 'Dream': 0.0}, "Ratios recomputed"
+            print(" Test 3 passed: Hot reload")
+
+            # Test 4: Edge case - unknown paths, bad queries and other methods
+            assert (await fetch(port, '/nothing'))[0] == 404, "Unknown path"
+            assert (await fetch(port, '/query?agg=median:body_mass_g'))[0] == 400, "Unknown aggregate"
+            assert (await fetch(port, '/query?where.year=soon'))[0] == 400, "Bad filter value"
+            assert (await fetch(port, '/query?agg=mean:species'))[0] == 400, "Mean of a text column"
+            assert (await fetch(port, '/query?group_by=nosuch'))[0] == 400, "Unknown column"
+            assert (await fetch(port, '/health', method='POST'))[0] == 405, "Only GET allowed"
+            print(" Test 4 passed: Errors reported")
+        finally:
+            server.close()
+            await server.wait_closed()
+
+    try:
+        asyncio.run(scenario())
+    finally:
+        os.remove(test_filename)
+
+def test_analyze_cli():
+    """Test the analyze_penguins.py command line entry point."""
+    print("\nTesting analyze_penguins command line...")
+
+    header = "species,island,bill_length_mm,bill_depth_mm,flipper_length_mm,body_mass_g,sex,year\n"
+    test_filename = 'test_data_cli.csv'
+    output_filename = 'test_output_cli.txt'
+    cache_filename = 'test_cli_cache.json'
+    with open(test_filename, 'w') as f:
+        f.write(header)
+        f.write("Adelie,Torgersen,39.1,18.7,181,3750,male,2007\n")
+        f.write("Adelie,Torgersen,39.5,17.4,186,3800,female,2007\n")
+
+    try:
+        # Test 1: General case - the comprehensive report matches the writer
+        analyze_cli([test_filename, '--output', output_filename])
+        penguins = load_csv(test_filename)
+        results = aggregate_penguins(penguins)
+        write_comprehensive_results(results['total_count'], results['species_data'],
+                                    results['gender_counts'], calculate_ratio(results['gender_counts']),
+                                    results['weight_stats'], 'test_expected_cli.txt')
+        with open(output_filename) as f, open('test_expected_cli.txt') as expected:
+            assert f.read() == expected.read(), "Report should match write_comprehensive_results"
+        print(" Test 1 passed: Comprehensive report written")
+
+        # Test 2: General case - selected analyses exported as JSON Lines
+        analyze_cli([test_filename, '--format', 'jsonl', '--analysis', 'bill_length_avgs',
+                     '--output', output_filename, '--backend', 'python'])
+        with open(output_filename) as f:
+            rows = [json.loads(line) for line in f]
+        assert [(row['analysis'], row['species'], row['value']) for row in rows] == [('bill_length', 'Adelie', 39.3)], "Only the chosen analysis"
+        print(" Test 2 passed: Selected analyses exported")
+
+        # Test 3: General case - cached output is reused until the input changes
+        arguments = [test_filename, '--format', 'csv', '--output', output_filename,
+                     '--cache', '--cache-file', cache_filename]
+        analyze_cli(arguments)
+        with open(cache_filename) as f:
+            entries = json.load(f)
+        key = next(iter(entries))
+        entries[key] = 'from cache\n'
+        with open(cache_filename, 'w') as f:
+            json.dump(entries, f)
+        analyze_cli(arguments)
+        with open(output_filename) as f:
+            assert f.read() == 'from cache\n', "Unchanged input should be answered from the cache"
+        with open(test_filename, 'a') as f:
+            f.write("Gentoo,Biscoe,46.1,13.2,211,4500,female,2007\n")
+        analyze_cli(arguments)
+        with open(output_filename) as f:
+            assert 'Gentoo' in f.read(), "Changed input should be recomputed"
+        print(" Test 3 passed: Result cache")
+
+        # Test 4: Edge case - bad arguments are rejected
+        for arguments in (['missing_file.csv'], [test_filename, '--analysis', 'total_count'],
+                          [test_filename, '--format', 'columnar']):
+            try:
+                with contextlib.redirect_stderr(io.StringIO()):
+                    analyze_cli(arguments)
+                assert False, "Bad arguments should exit"
+            except SystemExit as error:
+                assert error.code == 2, "argparse usage error"
+        print(" Test 4 passed: Bad arguments rejected")
+    finally:
+        for filename in (test_filename, output_filename, cache_filename, 'test_expected_cli.txt',
+                         test_filename + '.snapshot'):
+            if os.path.exists(filename):
+                os.remove(filename)
+
+def test_measurement_distributions():
+    """Test the streaming distribution statistics."""
+    print("\nTesting measurement_distributions...")
+
+    test_data = [
+        parse_csv_string_to_dict('"1","Gentoo","Biscoe",46.1,13.2,211,4500,"female",2007'),
+        parse_csv_string_to_dict('"2","Gentoo","Biscoe",48.7,14.1,210,4450,"female",2007'),
+        parse_csv_string_to_dict('"3","Gentoo","Biscoe",45.2,14.8,215,5000,"female",2008'),
+        parse_csv_string_to_dict('"4","Gentoo","Biscoe",46.5,13.5,210,,"female",2008'),
+        parse_csv_string_to_dict('"5","Adelie","Dream",39.5,17.4,186,7000,"male",2009'),
+        parse_csv_string_to_dict('"6","Adelie","Dream",39.5,17.4,186,3800,,2009')
+    ]
+
+    # Test 1: General case - mean, std, median and histogram of one group
+    result = measurement_distributions(test_data)
+    body_mass = result[('Gentoo', 'Biscoe', 'female')]['body_mass_g']
+    assert body_mass['count'] == 3, "Missing values skipped"
+    assert round(body_mass['mean'], 6) == round(statistics.mean([4500, 4450, 5000]), 6), "Mean"
+    assert round(body_mass['std'], 6) == round(statistics.stdev([4500, 4450, 5000]), 6), "Standard deviation"
+    assert body_mass['median'] == 4500.0 and body_mass['min'] == 4450.0, "Median and minimum"
+    assert sum(body_mass['histogram']['counts']) == 3, "Histogram counts every value"
+    assert result[('Adelie', 'Dream', 'male')]['body_mass_g']['histogram']['above'] == 1, "Out of range value"
+    assert ('Adelie', 'Dream', '') not in result, "Rows without a sex skipped"
+    print(" Test 1 passed: Group statistics")
+
+    # Test 2: General case - table input and other groupings
+    table = PenguinTable.from_records(test_data)
+    table_result = measurement_distributions(table)
+    assert set(table_result) == set(result), "Same groups for tables"
+    table_mass = table_result[('Gentoo', 'Biscoe', 'female')]['body_mass_g']
+    assert table_mass['median'] == body_mass['median'] and table_mass['count'] == 3, "Table matches rows"
+    by_year = measurement_distributions(table, group_by=('year',), measurements=('bill_depth_mm',))
+    assert by_year[(2009,)]['bill_depth_mm']['count'] == 2, "Grouped by a numeric column"
+    print(" Test 2 passed: Tables and groupings")
+
+    # Test 3: General case - quantile sketch stays small and merges accurately
+    values = [(i * 7919) % 10007 for i in range(20000)]
+    first, second = KLLSketch(), KLLSketch()
+    for value in values[:10000]:
+        first.add(value)
+    for value in values[10000:]:
+        second.add(value)
+    first.merge(second)
+    assert sum(len(items) for items in first.compactors) < 1000, "Bounded memory"
+    median = first.quantile(0.5)
+    assert abs(sum(value <= median for value in values) / len(values) - 0.5) < 0.02, "Median rank close to 0.5"
+    stats = DistributionStats()
+    for value in values:
+        stats.add(value)
+    assert round(stats.std(), 6) == round(statistics.stdev(values), 6), "Welford std"
+    print(" Test 3 passed: Sketch accuracy and merging")
+
+    # Test 4: Edge case - empty input, state round trip and shard merging
+    assert measurement_distributions([]) == {}, "Empty input"
+    accumulator = DistributionAccumulator()
+    for penguin in test_data:
+        accumulator.update(penguin)
+    restored = DistributionAccumulator.from_state(json.loads(json.dumps(accumulator.to_state())))
+    assert restored.result() == result, "State survives a JSON round trip"
+    shard = DistributionAccumulator()
+    for penguin in test_data[3:]:
+        shard.update(penguin)
+    merged = DistributionAccumulator()
+    for penguin in test_data[:3]:
+        merged.update(penguin)
+    merged.merge(shard)
+    assert merged.result()[('Gentoo', 'Biscoe', 'female')]['body_mass_g']['count'] == 3, "Shards merge"
+    print(" Test 4 passed: Edge cases handled")
+
+def test_approximate_counts():
+    """Test the count-min and HyperLogLog approximate mode."""
+    print("\nTesting approximate counts...")
+
+    test_data = [
+        parse_csv_string_to_dict('"1","Adelie","Torgersen",39.1,18.7,181,3750,"male",2007'),
+        parse_csv_string_to_dict('"2","Adelie","Torgersen",39.5,17.4,186,3800,"female",2007'),
+        parse_csv_string_to_dict('"3","Gentoo","Biscoe",46.1,13.2,211,4500,"female",2007'),
+        parse_csv_string_to_dict('"4","Gentoo","Biscoe",46.5,13.5,210,4550,"male",2008'),
+        parse_csv_string_to_dict('"5","Gentoo","Biscoe",45.2,14.8,215,5000,"male",2008')
+    ]
+
+    # Test 1: General case - few keys are counted exactly
+    assert count_island_gender(test_data, approximate=True) == count_island_gender(test_data), "Island gender counts"
+    assert count_species_by_island(test_data, approximate=True) == count_species_by_island(test_data), "Species counts"
+    assert count_distinct(test_data, 'island') == 2, "Distinct islands"
+    print(" Test 1 passed: Small data matches exact counts")
+
+    # Test 2: General case - many sites kept in fixed memory
+    sites = [{'island': f'site{i % 5000}' if i % 3 else 'colony', 'sex': 'male' if i % 2 else 'female'}
+             for i in range(30000)]
+    result = count_island_gender(sites, approximate={'top_k': 5, 'epsilon': 0.0005})
+    assert len(result) == 5, "Only the top_k islands are kept"
+    assert list(result)[0] == 'colony', "Most frequent island first"
+    assert result['colony'] == count_island_gender(sites)['colony'], "Heavy hitter counted exactly"
+    estimate = count_distinct(sites, 'island', error=0.02)
+    assert abs(estimate - 5001) / 5001 < 0.06, "Distinct count within error bounds"
+    print(" Test 2 passed: High-cardinality keys")
+
+    # Test 3: General case - approximate accumulators in the report
+    table = PenguinTable.from_records(test_data)
+    results = aggregate_penguins(table, APPROXIMATE_ACCUMULATORS)
+    assert results['island_count'] == 2 and results['species_count'] == 2, "Distinct estimates"
+    write_reports(results, {'test_approx_report.txt': 'comprehensive'})
+    with open('test_approx_report.txt') as f:
+        report = f.read()
+    os.remove('test_approx_report.txt')
+    assert 'Number of islands: 2\n' in report and 'Number of species: 2\n' in report, "Overview uses estimates"
+    print(" Test 3 passed: Approximate report")
+
+    # Test 4: Edge case - merging shards, saved state and mismatched sketches
+    first, second = ApproxIslandGenderCounter(top_k=3), ApproxIslandGenderCounter(top_k=3)
+    for penguin in test_data[:2]:
+        first.update(penguin)
+    for penguin in test_data[2:]:
+        second.update(penguin)
+    first.merge(second)
+    restored = ApproxIslandGenderCounter.from_state(json.loads(json.dumps(first.to_state())))
+    assert restored.result() == count_island_gender(test_data), "Merged and restored counts"
+    try:
+        CountMinSketch(epsilon=0.01).merge(CountMinSketch(epsilon=0.001))
+        assert False, "Different sizes should not merge"
+    except ValueError:
+        pass
+    assert count_distinct([], 'island') == 0, "Empty input"
+    state_filename = 'penguins.csv.approx_test.state.json'
+    try:
+        full = aggregate_penguins(load_csv('penguins.csv'), APPROXIMATE_ACCUMULATORS)
+        for _ in range(2):
+            # the second run restores every accumulator from the saved state
+            resumed = analyze_incremental('penguins.csv', state_filename, APPROXIMATE_ACCUMULATORS)
+            assert resumed == full, "Approximate accumulators resume from saved state"
+        coarse = approximate_accumulators(top_k=2, epsilon=0.01, error=0.05)
+        full = aggregate_penguins(load_csv('penguins.csv'), coarse)
+        assert len(full['species_data']) == 2, "Non-default top_k used"
+        for _ in range(2):
+            assert analyze_incremental('penguins.csv', state_filename, coarse) == full, "Settings kept on resume"
+        with open(state_filename) as f:
+            states = json.load(f)['accumulators']
+        restored = SpeciesDistinctCounter.from_state(states['species_count'])
+        assert restored.hll.precision == SpeciesDistinctCounter(error=0.05).hll.precision \
+            != SpeciesDistinctCounter().hll.precision, "Precision saved and restored"
+        assert ApproxIslandGenderCounter.from_state(states['gender_counts']).genders.width == \
+            ApproxIslandGenderCounter(epsilon=0.01).genders.width, "Sketch width saved and restored"
+        default = aggregate_penguins(load_csv('penguins.csv'), APPROXIMATE_ACCUMULATORS)
+        assert analyze_incremental('penguins.csv', state_filename, APPROXIMATE_ACCUMULATORS) == default, \
+            "Changed settings recomputed"
+    finally:
+        if os.path.exists(state_filename):
+            os.remove(state_filename)
+    print(" Test 4 passed: Edge cases handled")
+
+def test_penguin_record():
+    """Test the compact PenguinRecord rows."""
+    print("\nTesting PenguinRecord...")
+
+    test_filename = 'test_data_records.csv'
+    with open(test_filename, 'w') as f:
+        f.write('"","species","island","bill_length_mm","bill_depth_mm","flipper_length_mm","body_mass_g","sex","year","tag"\n')
+        f.write('"1","Adelie","Torgersen",39.1,18.7,181,3750,"male",2007,"A1"\n')
+        f.write('"2","Adelie","Torgersen",NA,NA,NA,NA,NA,NA,"A2"\n')
+        f.write('"3","Gentoo","Biscoe",46.1,13.2,211,4500,"female",2008,"G1"\n')
+
+    try:
+        # Test 1: General case - records hold the same values as dictionaries
+        penguins = load_csv(test_filename)
+        records = load_csv(test_filename, records=True)
+        assert all(isinstance(record, PenguinRecord) for record in records), "Records returned"
+        assert records == penguins, "Same values as load_csv dictionaries"
+        assert records[0].body_mass_g == 3750.0 and records[0].year == 2007, "Typed fields"
+        assert records[1].sex == "" and records[1].bill_length_mm is None, "Missing values"
+        print(" Test 1 passed: Records match dictionaries")
+
+        # Test 2: General case - categorical strings are interned
+        assert records[0].species is records[1].species, "Species labels shared"
+        assert records[0].island is records[1].island, "Island labels shared"
+        assert records[0]['tag'] == 'A1' and records[0].get('tag') == 'A1', "Extra columns kept"
+        print(" Test 2 passed: Interned categoricals")
+
+        # Test 3: General case - analyses give the same results for records
+        assert aggregate_penguins(records) == aggregate_penguins(penguins), "Aggregates match"
+        assert count_island_gender(records) == count_island_gender(penguins), "Island gender counts match"
+        assert avg_bill_length(records) == avg_bill_length(penguins), "Bill lengths match"
+        assert count_species_by_island(iter_csv(test_filename, records=True)) == count_species_by_island(penguins), "Streams"
+        print(" Test 3 passed: Analyses accept records")
+
+        # Test 4: Edge case - records without some fields behave like dictionaries
+        record = PenguinRecord.from_dict({'species': 'Chinstrap'})
+        assert record.island == "" and record.body_mass_g is None, "Defaults for missing fields"
+        assert 'tag' not in record and record.get('tag', 'none') == 'none', "Absent extra column"
+        assert PenguinTable.from_records(records)[2] == penguins[2], "Tables built from records"
+        partial = {'species': 'Chinstrap', 'island': 'Torgersen', 'body_mass_g': 3800.0,
+                   'sex': 'female', 'year': 2009}
+        record = PenguinRecord.from_dict(partial)
+        assert record == partial and record.to_dict() == partial, "Only the CSV's columns"
+        assert 'bill_length_mm' not in record and record.get('bill_length_mm', 'none') == 'none', "Absent field"
+        assert sorted(record.keys()) == sorted(partial), "Keys match the dictionary"
+        print(" Test 4 passed: Edge cases handled")
+    finally:
+        os.remove(test_filename)
+
+def test_analyze_chunked():
+    """Test parallel analysis of one CSV split into byte ranges."""
+    print("\nTesting analyze_chunked...")
+
+    test_filename = 'test_data_chunked.csv'
+    generate_synthetic_csv(test_filename, 3000, na_rate=0.05, seed=3)
+
+    try:
+        expected = aggregate_penguins(load_csv(test_filename))
+
+        # Test 1: General case - many small ranges in this process
+        assert analyze_chunked(test_filename, processes=1, chunk_bytes=4096) == expected, "Ranges merged in order"
+        print(" Test 1 passed: Chunked results match a full pass")
+
+        # Test 2: General case - ranges split across worker processes
+        result = analyze_chunked(test_filename, processes=2, chunk_bytes=20000,
+                                 accumulators={'gender_counts': IslandGenderCounter})
+        assert result == {'gender_counts': expected['gender_counts']}, "Worker results merged"
+        print(" Test 2 passed: Worker processes")
+
+        # Test 3: General case - ranges end on line boundaries
+        with open(test_filename, 'rb') as f:
+            data = f.read()
+        header_end = data.index(b'\n') + 1
+        for start, end in _chunk_ranges(data, header_end, 7):
+            assert data[end - 1:end] == b'\n' and data[start - 1:start] == b'\n', "Range on line boundaries"
+        print(" Test 3 passed: Line-aligned ranges")
+
+        # Test 4: Edge case - quoted newlines fall back to the csv module
+        with open(test_filename, 'w') as f:
+            f.write('species,island,body_mass_g,sex\n')
+            f.write('Adelie,"Torg\nersen",3750,male\n' * 50)
+        assert analyze_chunked(test_filename, processes=1, chunk_bytes=64) == aggregate_penguins(load_csv(test_filename)), "Fallback"
+        assert analyze_chunked('missing_chunked.csv')['total_count'] == 0, "Missing file"
+        print(" Test 4 passed: Edge cases handled")
+    finally:
+        os.remove(test_filename)
+
+def test_compressed_input():
+    """Test reading gzip, bz2 and xz compressed CSV files."""
+    print("\nTesting compressed input...")
+
+    with open('penguins.csv', 'rb') as f:
+        raw = f.read()
+    expected = load_csv('penguins.csv')
+    middle = raw.index(b'\n', len(raw) // 2) + 1
+    files = {
+        'test_data_compressed.csv.gz': gzip.compress(raw[:middle]) + gzip.compress(raw[middle:]),
+        'test_data_compressed.csv.bz2': bz2.compress(raw),
+        'test_data_compressed.csv.xz': lzma.compress(raw),
+        'test_data_truncated.csv.gz': gzip.compress(raw)[:2000],
+    }
+    for filename, data in files.items():
+        with open(filename, 'wb') as f:
+            f.write(data)
+
+    try:
+        # Test 1: General case - formats detected from magic bytes
+        assert detect_compression('test_data_compressed.csv.gz') == 'gzip', "gzip detected"
+        assert detect_compression('test_data_compressed.csv.bz2') == 'bz2', "bz2 detected"
+        assert detect_compression('test_data_compressed.csv.xz') == 'xz', "xz detected"
+        assert detect_compression('penguins.csv') is None, "Plain CSV"
+        print(" Test 1 passed: Compression detected")
+
+        # Test 2: General case - load_csv decompresses on the fly
+        for filename in ('test_data_compressed.csv.gz', 'test_data_compressed.csv.bz2',
+                         'test_data_compressed.csv.xz'):
+            assert load_csv(filename) == expected, f"{filename} loads like the plain file"
+        print(" Test 2 passed: Compressed files loaded (multi-member gzip included)")
+
+        # Test 3: General case - streaming, tables and chunked analysis
+        results = aggregate_penguins(expected)
+        assert aggregate_penguins(iter_csv('test_data_compressed.csv.xz', records=True)) == results, "Stream"
+        assert aggregate_penguins(load_table('test_data_compressed.csv.bz2')) == aggregate_penguins(load_table('penguins.csv')), "Table"
+        assert analyze_chunked('test_data_compressed.csv.gz', processes=1) == results, "Chunked falls back to streaming"
+        print(" Test 3 passed: Streaming and tables")
+
+        # Test 4: Edge case - corrupt data raises in the reading thread, early stop
+        try:
+            load_csv('test_data_truncated.csv.gz')
+            assert False, "Truncated file should raise"
+        except EOFError:
+            pass
+        stream = iter_csv('test_data_compressed.csv.gz')
+        assert next(stream)['species'] == 'Adelie', "First row read"
+        stream.close()
+        print(" Test 4 passed: Edge cases handled")
+    finally:
+        for filename in files:
+            os.remove(filename)
+
+def test_year_partitions():
+    """Test per-year partitions, cached aggregates and year-over-year deltas."""
+    print("\nTesting year partitions...")
+
+    test_data = [
+        parse_csv_string_to_dict('"1","Adelie","Torgersen",39.1,18.7,181,3750,"male",2007'),
+        parse_csv_string_to_dict('"2","Adelie","Torgersen",39.5,17.4,186,3800,"female",2007'),
+        parse_csv_string_to_dict('"3","Adelie","Torgersen",40.3,18,195,3250,"female",2008'),
+        parse_csv_string_to_dict('"4","Adelie","Torgersen",36.7,19.3,193,3450,"female",2008'),
+        parse_csv_string_to_dict('"5","Adelie","Torgersen",39.3,20.6,190,3650,"male",')
+    ]
+
+    # Test 1: General case - analyses broken down by year
+    by_year = analyze_by_year(test_data)
+    assert list(by_year) == [2007, 2008, None], "Years in order, missing year last"
+    assert by_year[2007]['gender_counts'] == count_island_gender(test_data[:2]), "2007 counts"
+    assert by_year[2008]['ratios'] == {'Torgersen': 0.0}, "2008 ratio"
+    assert by_year[2008]['weight_stats'] == calculate_body_weights(test_data[2:4]), "2008 weights"
+    assert by_year[2007]['bill_length_avgs'] == avg_bill_length(test_data[:2]), "2007 bill lengths"
+    print(" Test 1 passed: Per-year analyses")
+
+    # Test 2: General case - year-over-year deltas
+    deltas = year_over_year(by_year)
+    assert list(deltas) == [(2007, 2008)], "One pair of consecutive years"
+    assert deltas[(2007, 2008)]['gender_counts'] == {'Torgersen': {'male': -1, 'female': 1}}, "Count deltas"
+    assert deltas[(2007, 2008)]['weight_stats'] == {'Adelie': {'Torgersen': {'female': -450.0}}}, "Weight delta"
+    assert deltas[(2007, 2008)]['ratios'] == {'Torgersen': -1.0}, "Ratio delta"
+    print(" Test 2 passed: Year-over-year deltas")
+
+    # Test 3: General case - new data only recomputes its own year
+    partitions = YearPartitions(test_data)
+    partitions.by_year()
+    computed = partitions.computed
+    assert partitions.add([parse_csv_string_to_dict('"6","Adelie","Dream",40.0,18,190,3900,"male",2008')]) == {2008}, "Touched years"
+    refreshed = partitions.by_year()
+    assert partitions.computed == computed + 1, "Only the 2008 partition recomputed"
+    assert refreshed[2008]['gender_counts']['Dream'] == {'male': 1, 'female': 0}, "New row counted"
+    print(" Test 3 passed: Incremental recompute")
+
+    # Test 4: Edge case - empty data, a single year and text results
+    assert analyze_by_year([]) == {}, "No partitions"
+    assert year_over_year(analyze_by_year(test_data[:2])) == {}, "No pairs for one year"
+    assert _nested_delta({'a': 'No females', 'b': 2}, {'a': 1.5, 'b': 3}) == {'b': 1}, "Text values skipped"
+    print(" Test 4 passed: Edge cases handled")
+
+def test_compile_schema():
+    """Test schema-driven row coercion."""
+    print("\nTesting compile_schema...")
+
+    header = ['', 'species', 'bill_length_mm', 'sex', 'year']
+
+    # Test 1: General case - fields converted by position
+    coerce = compile_schema(header)
+    assert coerce(['1', 'Adelie', '39.1', 'male', '2007']) == {'species': 'Adelie', 'bill_length_mm': 39.1,
+                                                             'sex': 'male', 'year': 2007}, "Typed values"
+    assert coerce(['2', 'NA', ' na ', '', 'NA']) == {'species': '', 'bill_length_mm': None,
+                                                    'sex': '', 'year': None}, "NA handling"
+    print(" Test 1 passed: Positional coercion")
+
+    # Test 2: General case - custom and extra columns through the schema
+    schema = [ColumnSchema('tag', int, ('', 'NA', 'UNKNOWN'), -1),
+              ColumnSchema('sex', str.lower, ('NA', ''), 'unknown')]
+    coerce2 = compile_schema(header + ['tag'], schema)
+    row = coerce2(['3', 'Gentoo', '46.1', 'FEMALE', '2008', 'unknown'])
+    assert row['tag'] == -1 and row['sex'] == 'female', "Custom converters and NA tokens"
+    assert coerce2(['4', 'Gentoo', '46.1', '  ', '2008', '17'])['sex'] == 'unknown', "Custom default"
+    test_filename = 'test_data_schema.csv'
+    with open(test_filename, 'w') as f:
+        f.write('species,tag\nAdelie,7\nAdelie,unknown\n')
+    try:
+        assert [p['tag'] for p in load_csv(test_filename, schema=schema)] == [7, -1], "load_csv schema"
+        assert load_csv(test_filename)[0]['tag'] == '7', "Unknown columns stay text"
+    finally:
+        os.remove(test_filename)
+    coerce3 = compile_schema(['tags'], [ColumnSchema('tags', lambda text: text.split(';'), ('NA',), None)])
+    first, second = coerce3(['a;b']), coerce3(['a;b'])
+    first['tags'].append('c')
+    assert second['tags'] == ['a', 'b'], "Mutable converter results are not shared between rows"
+    print(" Test 2 passed: Custom schema columns")
+
+    # Test 3: General case - short rows, extra fields and repeated values
+    assert coerce(['5', 'Chinstrap']) == {'species': 'Chinstrap', 'bill_length_mm': None,
+                                          'sex': '', 'year': None}, "Short rows padded"
+    assert coerce(['6', 'Adelie', '40', 'male', '2009', 'extra'])['year'] == 2009, "Extra fields dropped"
+    first = coerce(['7', 'Adelie', '40', 'male', '2009'])['species']
+    second = coerce(['8', ''.join(['Ade', 'lie']), '40', 'male', '2009'])['species']
+    assert first is second, "Repeated text shares one string"
+    print(" Test 3 passed: Row shapes")
+
+    # Test 4: Edge case - single column, no columns and bad numbers
+    assert compile_schema(['species'])(['Adelie']) == {'species': 'Adelie'}, "One column"
+    assert compile_schema([])(['x']) == {}, "Empty header"
+    try:
+        coerce(['9', 'Adelie', 'long', 'male', '2009'])
+        assert False, "Bad number should raise"
+    except ValueError:
+        pass
+    print(" Test 4 passed: Edge cases handled")
+
+def test_validate_csv():
+    """Test validate_csv, flag_outliers and the data quality report section."""
+    print("\nTesting validate_csv...")
+    header = '"","species","island","bill_length_mm","bill_depth_mm","flipper_length_mm","body_mass_g","sex","year"\n'
+    rows = ['"1","Adelie","Dream",39.1,18.7,181,3750,"male",2007\n',
+            '"2","Adelie","Dream",abc,17.4,186,3800,"female",2007\n',
+            '"3","Gentoo","Biscoe",46.1,13.2,211,40000,"female",2007\n',
+            '"4","Gentoo","Biscoe",NA,NA,NA,0,NA,NA\n',
+            '"5","Chinstrap","Dream",46.5,17.9,192,3500,"female",2007\n',
+            '"6","Gentoo","Biscoe",abc\n',
+            '"7","Gentoo","Biscoe",46.1,13.2,211,0,"female",2007,"extra"\n']
+    filenames = ['test_validate.csv', 'test_validate.csv.quarantine.csv', 'test_validate_report.txt']
+    try:
+        with open(filenames[0], 'w') as file:
+            file.write(header + ''.join(rows))
+
+        # Test 1: General case - penguins.csv is clean and loads like load_csv
+        penguins, report = validate_csv('penguins.csv')
+        assert penguins == load_csv('penguins.csv'), "Good rows match load_csv"
+        assert report['rows'] == report['valid_rows'] == 344, "All rows kept"
+        assert report['quarantined'] == 0 and report['errors'] == {}, "No errors"
+        assert report['quarantine_file'] is None, "No quarantine file"
+        print(" Test 1 passed: Clean file validated")
+
+        # Test 2: General case - bad values are counted and quarantined instead of raising
+        penguins, report = validate_csv(filenames[0])
+        assert [penguin['species'] for penguin in penguins] == ['Adelie', 'Chinstrap'], "Good rows kept"
+        assert report['quarantined'] == 5, "Five rows quarantined"
+        assert report['errors'] == {'bill_length_mm': {'invalid': 2, 'out_of_range': 0},
+                                    'body_mass_g': {'invalid': 0, 'out_of_range': 3}}, "Errors per column"
+        with open(filenames[1], newline='') as file:
+            quarantined = list(csv.reader(file))
+        assert quarantined[0][-1] == 'reason' and len(quarantined) == 6, "Header and bad rows written"
+        assert quarantined[1][3] == 'abc' and 'bill_length_mm' in quarantined[1][-1], "Raw row and reason"
+        assert 'outside' in quarantined[2][-1], "Range reason"
+        assert all(len(row) == 10 for row in quarantined), "Short and long rows fit the header"
+        assert quarantined[4][3:9] == ['abc', '', '', '', '', ''], "Short row padded"
+        assert 'body_mass_g' in quarantined[5][9] and quarantined[5][8] == '2007', "Long row cut to the header"
+        print(" Test 2 passed: Bad rows quarantined")
+
+        # Test 3: General case - outliers are flagged per species, the same with and without NumPy
+        flock = [{'species': 'Adelie', 'body_mass_g': 3700.0 + i % 5 * 10} for i in range(40)]
+        flock.append({'species': 'Adelie', 'body_mass_g': 6000.0})
+        flock += [{'species': 'Gentoo', 'body_mass_g': 6000.0 + i % 5 * 10} for i in range(40)]
+        outliers = flag_outliers(flock, ('body_mass_g',))
+        assert [(o['row'], o['species']) for o in outliers] == [(40, 'Adelie')], "Only the heavy Adelie"
+        penguins, report = validate_csv('penguins.csv')
+        saved = main_module.np
+        main_module.np = None
+        try:
+            assert flag_outliers(penguins) == report['outliers'], "Python path matches NumPy"
+        finally:
+            main_module.np = saved
+        assert all(o['species'] == penguins[o['row']]['species'] for o in report['outliers']), "Rows line up"
+        print(" Test 3 passed: Outliers flagged per species")
+
+        # Test 4: Edge cases - custom ranges, missing file, report section
+        penguins, report = validate_csv(filenames[0], ranges={})
+        assert report['quarantined'] == 2, "Only the unparseable rows without ranges"
+        penguins, report = validate_csv('nonexistent_file.csv')
+        assert penguins == [] and report['rows'] == 0, "Missing file"
+        report = {}
+        results = aggregate_penguins(iter_validated(filenames[0], report))
+        assert results['total_count'] == 2 and report['valid_rows'] == 2, "Streamed into aggregate_penguins"
+        results['validation'] = report
+        write_reports(results, {filenames[2]: 'comprehensive'})
+        with open(filenames[2]) as file:
+            text = file.read()
+        assert 'DATA QUALITY SUMMARY' in text and 'Rows quarantined: 5' in text, "Summary section"
+        assert 'body_mass_g: 0 invalid, 3 out of range' in text, "Column errors listed"
+        report = {}
+        assert len(list(iter_validated(filenames[0], report, outliers=False))) == 2, "Rows without the check"
+        assert report['outliers'] is None and report['quarantined'] == 5, "Outliers not checked"
+        assert set(VALID_RANGES) == set(main_module.MEASUREMENT_COLUMNS), "Every measurement has a range"
+        print(" Test 4 passed: Edge cases handled")
+    finally:
+        for filename in filenames:
+            if os.path.exists(filename):
+                os.remove(filename)
+
 # main
 
 def main():
@@ -405,6 +1856,7 @@ def main():
     
     # eve tests
     test_load_csv()
+    test_iter_csv()
     test_count_island_gender()
     test_calculate_ratio()
     test_calculate_body_weights()
@@ -413,36 +1865,67 @@ def main():
     test_count_total_penguins()
     test_count_species_by_island()
     test_avg_bill_length()
+
+    # engine tests
+    test_aggregate_penguins()
+    test_penguin_table()
+    test_backends()
+    test_analyze_files()
+    test_group_stats()
+    test_analyze_incremental()
+    test_snapshot_cache()
+    test_scan_csv()
+    test_benchmarks()
+    test_profiling()
+    test_write_reports()
+    test_export_results()
+    test_query_cache()
+    test_query()
+    test_penguin_service()
+    test_analyze_cli()
+    test_measurement_distributions()
+    test_approximate_counts()
+    test_penguin_record()
+    test_analyze_chunked()
+    test_compressed_input()
+    test_year_partitions()
+    test_compile_schema()
+    test_validate_csv()
     
     print("\n" + "=" * 40)
-    print("All 28 tests passed! ✓")
+    print("All 128 tests passed! ✓")
     print("=" * 40)
     
     print("\n" + "=" * 40)
     print("Performing actual analysis...")
     print("-" * 40)
     
-    # Load data
-    penguins = load_csv('penguins.csv')
+    # Stream the validated data and perform all analyses in a single pass over the records;
+    # the outlier check keeps the measurements in memory, so it only runs when
+    # PENGUIN_OUTLIERS is set
+    check_outliers = os.environ.get('PENGUIN_OUTLIERS', '') not in ('', '0')
+    validation = {}
+    results = aggregate_penguins(iter_validated('penguins.csv', validation, outliers=check_outliers))
+    results['validation'] = validation
     
-    if not penguins:
+    if not results['total_count']:
         print("Error: Could not load penguin data.")
         return
     
-    print(f"Loaded {len(penguins)} penguin records.")
-    
-    # Perform all analyses
+    print(f"Loaded {results['total_count']} penguin records.")
+    if validation['quarantined']:
+        print(f"Quarantined {validation['quarantined']} bad rows in '{validation['quarantine_file']}'")
     
     # Analysis 1: Total count 
-    total_count = count_total_penguins(penguins)
+    total_count = results['total_count']
     print(f"Total penguins: {total_count}")
     
     # Analysis 2: Species by island 
-    species_data = count_species_by_island(penguins)
+    species_data = results['species_data']
     print(f"Analyzed {len(species_data)} species across multiple islands.")
     
     # Analysis 3: Gender distribution 
-    gender_counts = count_island_gender(penguins)
+    gender_counts = results['gender_counts']
     print(f"Analyzed gender distribution across {len(gender_counts)} islands.")
     
     # Analysis 4: Gender ratios
@@ -450,26 +1933,27 @@ def main():
     print("Calculated male:female ratios.")
     
     # Analysis 5: Body weights
-    weight_stats = calculate_body_weights(penguins)
+    weight_stats = results['weight_stats']
     print(f"Calculated body weight statistics for {len(weight_stats)} species.")
 
      # Analysis 6: Bill length averages
-    bill_length_avgs = avg_bill_length(penguins)
+    bill_length_avgs = results['bill_length_avgs']
     print(f"Calculated bill length statistics for {len(bill_length_avgs)} species.")
     
     # Write results to files
     
-    # Original output 
+    # Both reports from the same aggregates, sharing the rendered sections
     output_file1 = 'penguin_analysis_results.txt'
-    write_to_file(gender_counts, weight_stats, ratios, output_file1)
-    print(f"\nOriginal results written to '{output_file1}'")
-    
-    # Comprehensive output
     output_file2 = 'comprehensive_penguin_analysis.txt'
-    write_comprehensive_results(total_count, species_data, gender_counts, 
-                                 ratios, weight_stats, output_file2)
+    write_reports(results, {output_file1: 'results', output_file2: 'comprehensive'}, ratios)
+    print(f"\nOriginal results written to '{output_file1}'")
     print(f"Comprehensive results written to '{output_file2}'")
     
+    # Stage timings, when PENGUIN_PROFILE is set
+    if PROFILER.enabled:
+        write_profile('penguin_profile.json', output_file2)
+        print("Profile written to 'penguin_profile.json'")
+    
     print("\nAnalysis complete!")
     print("=" * 40)
 